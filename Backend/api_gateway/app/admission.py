@@ -0,0 +1,275 @@
+"""Admission control for the upstream calls of the gateway.
+
+Each upstream has an adaptive concurrency limit. Calls over the limit wait in
+a bounded queue, highest priority first, until a slot frees up or their
+deadline passes; once the queue is full, a new call either takes the place of
+a lower-priority waiter or is rejected at once. Rejected calls get a 503 with
+Retry-After instead of piling up in the connection pool and the services.
+
+The limit follows the upstream latency (a gradient limiter): a fast average
+tracks the current latency, a baseline the latency without load, and
+    limit = limit * clamp(tolerance * baseline / current, 0.5, 1) + sqrt(limit)
+so it grows while latency stays near the baseline and shrinks once requests
+start queueing in the upstream. The baseline drops quickly with faster calls
+and rises slowly, and only from calls made while the limit was not in full use.
+Errors (no response, 502/503/504) cut the limit by 10%, at most once per
+current latency. Only calls made while the limit was in use move it.
+
+Priorities come from "<METHOD> <upstream>/<path>=<high|normal|low>" rules;
+low-priority calls (list browsing) may only use part of the limit, so logins
+and status updates still get through when lists are busy.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import re
+import time
+from fixflow_common.metrics import Counter
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+ADMISSION_REJECTED = Counter(
+    "gateway_admission_rejected_total", "Calls shed by admission control, per upstream and reason.", ("upstream", "reason"),
+)
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def parse_priorities(spec: str) -> list:
+    """'POST users/auth/login=high,GET orders/orders=low' -> [(regex, priority)].
+    Patterns are matched against "<METHOD> <upstream>/<path>"; '*' spans one segment."""
+    rules = []
+    for entry in filter(None, (e.strip() for e in spec.split(","))):
+        pattern, _, name = entry.rpartition("=")
+        if name.strip() not in PRIORITIES:
+            raise ValueError(f"Invalid priority: {entry}")
+        regex = "[^/]*".join(re.escape(part) for part in pattern.strip().split("*"))
+        rules.append((re.compile(regex + "$"), PRIORITIES[name.strip()]))
+    return rules
+
+
+class GradientLimit:
+    def __init__(self, initial: int, min_limit: int, max_limit: int, tolerance: float = 2.0):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.short_rtt = None
+        self.long_rtt = None
+        self._last_drop = 0.0
+
+    def _clamp(self, value: float) -> float:
+        return max(self.min_limit, min(self.max_limit, value))
+
+    def on_sample(self, seconds: float, in_flight: int):
+        if self.short_rtt is None:
+            self.short_rtt = self.long_rtt = seconds
+        self.short_rtt += (seconds - self.short_rtt) * 0.1
+        saturated = in_flight >= self.limit / 2
+        if seconds < self.long_rtt:
+            self.long_rtt += (seconds - self.long_rtt) * 0.1
+        elif not saturated or self.limit < 2 * self.min_limit:
+            # a saturated upstream's latency includes its own queue; only calls made
+            # with room to spare (or with nothing left to shed) raise the baseline
+            self.long_rtt += (seconds - self.long_rtt) / 500
+        if not saturated:
+            # the limit was not what held this call back; nothing learned about it
+            return
+        gradient = max(0.5, min(1.0, self.tolerance * self.long_rtt / self.short_rtt))
+        target = self.limit * gradient + math.sqrt(self.limit)
+        self.limit = self._clamp(self.limit * 0.8 + target * 0.2)
+
+    def on_drop(self):
+        now = time.monotonic()
+        if now - self._last_drop < (self.short_rtt or 0.0):
+            return
+        self._last_drop = now
+        self.limit = self._clamp(self.limit * 0.9)
+
+
+class _Waiter:
+    __slots__ = ("future", "priority")
+
+    def __init__(self, priority: int):
+        self.future = asyncio.get_running_loop().create_future()
+        self.priority = priority
+
+
+class Limiter:
+    """The adaptive limit and wait queue of one upstream."""
+
+    def __init__(self, name: str, limit: GradientLimit, queue_size: int, queue_timeout: float, low_share: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.low_share = low_share
+        self.in_flight = 0
+        self._queue: list = []
+        self._queued = 0
+        self._seq = itertools.count()
+        self.rejected = {"queue_full": 0, "timeout": 0, "evicted": 0}
+
+    def _room(self, priority: int) -> bool:
+        cap = self.limit.limit * (self.low_share if priority == PRIORITIES["low"] else 1.0)
+        return self.in_flight < max(1, int(cap))
+
+    def _reject(self, reason: str):
+        self.rejected[reason] += 1
+        ADMISSION_REJECTED.inc(self.name, reason)
+
+    async def acquire(self, priority: int):
+        # a free slot goes to a queued waiter of the same or higher priority first
+        head = self._head()
+        if (head is None or head > priority) and self._room(priority):
+            self.in_flight += 1
+            return
+        if self._queued >= self.queue_size and not self._evict(priority):
+            self._reject("queue_full")
+            raise Overloaded("queue_full")
+        waiter = _Waiter(priority)
+        # heap order: priority, then arrival
+        heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+        self._queued += 1
+        try:
+            # an eviction raises Overloaded from here
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            self._leave(waiter)
+            raise
+        if waiter.future.done():
+            if not waiter.future.cancelled() and waiter.future.exception() is None:
+                # release() handed the slot over, already counted in in_flight
+                return
+            # evicted in the same tick as the deadline; _evict did the bookkeeping
+            raise waiter.future.exception()
+        waiter.future.cancel()
+        self._queued -= 1
+        self._reject("timeout")
+        raise Overloaded("timeout")
+
+    def _leave(self, waiter: _Waiter):
+        if not waiter.future.done():
+            waiter.future.cancel()
+            self._queued -= 1
+        elif not waiter.future.cancelled() and waiter.future.exception() is None:
+            # got a slot just as the caller went away: pass it on
+            self.in_flight -= 1
+            self._dispatch()
+
+    def _evict(self, priority: int) -> bool:
+        """Drop the newest waiter of the lowest priority if it ranks below `priority`."""
+        live = [entry for entry in self._queue if not entry[2].future.done()]
+        if not live:
+            return False
+        victim = max(live, key=lambda entry: (entry[0], entry[1]))
+        if victim[0] <= priority:
+            return False
+        victim[2].future.set_exception(Overloaded("evicted"))
+        self._queued -= 1
+        self._reject("evicted")
+        return True
+
+    def release(self, seconds: float | None, ok: bool | None):
+        """A call finished after `seconds`; ok=None when it was cancelled."""
+        in_flight = self.in_flight
+        self.in_flight -= 1
+        if ok is True and seconds is not None:
+            self.limit.on_sample(seconds, in_flight)
+        elif ok is False:
+            self.limit.on_drop()
+        self._dispatch()
+
+    def _head(self) -> int | None:
+        """Priority of the first live waiter; drops the ones that left."""
+        while self._queue and self._queue[0][2].future.done():
+            heapq.heappop(self._queue)
+        return self._queue[0][0] if self._queue else None
+
+    def _dispatch(self):
+        while True:
+            priority = self._head()
+            if priority is None or not self._room(priority):
+                return
+            _, _, waiter = heapq.heappop(self._queue)
+            self._queued -= 1
+            self.in_flight += 1
+            waiter.future.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "limit": int(self.limit.limit),
+            "in_flight": self.in_flight,
+            "queued": self._queued,
+            "rtt_ms": None if self.limit.short_rtt is None else round(self.limit.short_rtt * 1000, 2),
+            "baseline_rtt_ms": None if self.limit.long_rtt is None else round(self.limit.long_rtt * 1000, 2),
+            "rejected": dict(self.rejected),
+        }
+
+
+class _Ticket:
+    def __init__(self, limiter: Limiter, priority: int):
+        self.limiter = limiter
+        self.priority = priority
+        # set by the caller: whether the upstream answered well, or skip=True
+        # for an outcome that says nothing about its latency
+        self.ok = None
+        self.skip = False
+        self._start = 0.0
+
+    async def __aenter__(self):
+        await self.limiter.acquire(self.priority)
+        self._start = time.perf_counter()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.skip or exc_type is asyncio.CancelledError:
+            ok = None
+        elif exc_type is not None:
+            ok = False
+        else:
+            ok = self.ok
+        self.limiter.release(time.perf_counter() - self._start, ok)
+
+
+class AdmissionControl:
+    def __init__(self, enabled: bool, initial: int, min_limit: int, max_limit: int, tolerance: float,
+                 queue_size: int, queue_timeout: float, low_share: float, priorities: str):
+        self.enabled = enabled
+        self._limit_args = (initial, min_limit, max_limit, tolerance)
+        self._queue_args = (queue_size, queue_timeout, low_share)
+        self.rules = parse_priorities(priorities)
+        self._limiters: dict = {}
+
+    def limiter(self, upstream: str) -> Limiter:
+        limiter = self._limiters.get(upstream)
+        if limiter is None:
+            limiter = self._limiters[upstream] = Limiter(upstream, GradientLimit(*self._limit_args), *self._queue_args)
+        return limiter
+
+    def priority(self, method: str, upstream: str, path: str) -> int:
+        target = f"{method} {upstream}/{path.strip('/')}"
+        for regex, priority in self.rules:
+            if regex.match(target):
+                return priority
+        return PRIORITIES["normal"]
+
+    def admit(self, upstream: str, method: str, path: str) -> _Ticket:
+        """`async with admit(...) as ticket:` around one upstream call; raises
+        Overloaded when it is shed. Set ticket.ok to report the outcome."""
+        return _Ticket(self.limiter(upstream), self.priority(method, upstream, path))
+
+    @property
+    def limiters(self) -> dict:
+        """Upstream name -> Limiter, for the upstreams called so far."""
+        return dict(self._limiters)
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, **{name: limiter.stats() for name, limiter in self._limiters.items()}}
@@ -1,21 +1,16 @@
-from fastapi import HTTPException, Header, Request
-import jwt
+from fastapi import Header, Request
+from fixflow_common.auth import TokenCache, bearer_token, verify_token
 from .config import settings
 from typing import Optional
 
-def verify_jwt(token: str):
-    try:
-        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=["HS256"])
-        return payload
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+
+
+def verify_jwt(token: str) -> dict:
+    return verify_token(token, settings.JWT_SECRET, token_cache)
+
 
 async def get_current_user(authorization: Optional[str] = Header(None), request: Request = None):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Missing Authorization header")
-    scheme, _, token = authorization.partition(" ")
-    if scheme.lower() != "bearer" or not token:
-        raise HTTPException(status_code=401, detail="Invalid auth scheme")
-    payload = verify_jwt(token)
+    payload = verify_jwt(bearer_token(authorization))
     request.state.user = payload
     return payload
@@ -0,0 +1,158 @@
+"""In-process response cache for idempotent GETs proxied by the gateway.
+Entries are per user (JWT sub) and Accept-Encoding, since the stored body is
+the upstream's, possibly compressed; responses that Vary on anything else are
+not stored. They expire after a TTL and are evicted LRU-first
+once the entry or byte budget is exhausted. Writes to a resource invalidate
+every cached view of it, for all users.
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+# headers that describe the upstream exchange rather than the cached representation
+_UNCACHED_HEADERS = {"x-request-id", "date", "set-cookie"}
+
+
+@dataclass
+class CachedResponse:
+    status_code: int
+    headers: list
+    body: bytes
+    etag: str
+    expires_at: float
+    size: int = field(init=False)
+
+    def __post_init__(self):
+        self.size = len(self.body) + sum(len(k) + len(v) for k, v in self.headers)
+
+
+def _segments(path: str) -> list:
+    return [s for s in path.strip("/").split("/") if s]
+
+
+def _collection(path: str) -> str:
+    # "orders/123/status" -> "orders", "orders:batch" -> "orders"
+    segments = _segments(path)
+    return segments[0].split(":", 1)[0] if segments else ""
+
+
+def make_etag(body: bytes) -> str:
+    return 'W/"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # weak comparison (RFC 7232, 2.3.2)
+    bare = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == bare:
+            return True
+    return False
+
+
+class ResponseCache:
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int, max_entry_bytes: int, enabled: bool = True):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: OrderedDict = OrderedDict()
+        # (upstream, collection) -> keys, so invalidation only scans one collection
+        self._by_collection: dict = {}
+        # bumped on every write, so a GET that raced a write is not stored
+        self._generations: dict = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(upstream: str, path: str, query: str, sub: str, accept_encoding: str | None = None) -> tuple:
+        return ("GET", upstream, path.strip("/"), query, sub, accept_encoding)
+
+    def generation(self, upstream: str, path: str) -> int:
+        return self._generations.get((upstream, _collection(path)), 0)
+
+    def get(self, key: tuple) -> CachedResponse | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def make_entry(self, status_code: int, headers: list, body: bytes) -> CachedResponse:
+        """A response as it would be cached, without storing it."""
+        headers = [(k, v) for k, v in headers if k not in _UNCACHED_HEADERS]
+        etag = next((v for k, v in headers if k == "etag"), None)
+        if etag is None:
+            etag = make_etag(body)
+            headers.append(("etag", etag))
+        return CachedResponse(status_code, headers, body, etag, time.monotonic() + self.ttl)
+
+    def put(self, key: tuple, status_code: int, headers: list, body: bytes, generation: int) -> CachedResponse:
+        entry = self.make_entry(status_code, headers, body)
+        upstream, path = key[1], key[2]
+        if entry.size > self.max_entry_bytes or generation != self.generation(upstream, path):
+            return entry
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self._bytes += entry.size
+        self._by_collection.setdefault((upstream, _collection(path)), set()).add(key)
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+        return entry
+
+    def invalidate(self, upstream: str, path: str):
+        """Drop cached views of `path`: the collection listing, the path itself,
+        its parents and anything below it (e.g. PATCH orders/1/status drops
+        GET orders, orders/1 and orders/1/status for every user). Batch writes
+        ("orders:batch", "orders/status:batch") can touch any member, so they
+        drop the whole collection.
+        """
+        collection = _collection(path)
+        self._generations[(upstream, collection)] = self._generations.get((upstream, collection), 0) + 1
+        written = _segments(path)
+        batch = any(":" in segment for segment in written)
+        for key in list(self._by_collection.get((upstream, collection), ())):
+            cached = _segments(key[2])
+            n = min(len(cached), len(written))
+            if batch or len(cached) == 1 or cached[:n] == written[:n]:
+                self._remove(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._by_collection.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _remove(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry.size
+        upstream, path = key[1], key[2]
+        keys = self._by_collection.get((upstream, _collection(path)))
+        if keys is not None:
+            keys.discard(key)
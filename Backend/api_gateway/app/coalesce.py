@@ -0,0 +1,110 @@
+"""Single-flight for identical concurrent GETs proxied by the gateway.
+The first request for a key (upstream, path, query, user and the headers that
+change the representation) goes upstream; identical requests arriving while
+it is in flight wait for it and get a copy of its response. Nothing is kept
+once that response is in, so this never serves data older than a request
+that was already running when the waiter arrived.
+
+Only routes matching the configured patterns take part. At most max_waiters
+requests share one call; further ones go upstream on their own, as do the
+waiters of a response that cannot be shared (no content-length, or larger
+than max_body_bytes). An upstream error is raised in every waiter. Writes
+detach the flights of their collection, so a read sent after a write
+returned never joins a call started before it.
+"""
+import asyncio
+import re
+from .cache import CachedResponse, _collection
+
+
+def parse_routes(spec: str) -> list:
+    """'orders/orders,orders/orders/*' -> [regex]; '*' spans one path segment."""
+    routes = []
+    for pattern in filter(None, (p.strip().strip("/") for p in spec.split(","))):
+        routes.append(re.compile("[^/]*".join(re.escape(part) for part in pattern.split("*")) + "$"))
+    return routes
+
+
+class Flight:
+    __slots__ = ("future", "waiters")
+
+    def __init__(self):
+        self.future = asyncio.get_running_loop().create_future()
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, routes: str, max_waiters: int, max_body_bytes: int, enabled: bool = True):
+        self.enabled = enabled
+        self.routes = parse_routes(routes)
+        self.max_waiters = max_waiters
+        self.max_body_bytes = max_body_bytes
+        self._flights: dict = {}
+        self.leaders = 0
+        self.shared = 0
+        self.unshared = 0
+        self.overflow = 0
+
+    def applies(self, upstream: str, path: str) -> bool:
+        if not self.enabled:
+            return False
+        target = f"{upstream}/{path.strip('/')}"
+        return any(route.match(target) for route in self.routes)
+
+    @staticmethod
+    def key(upstream: str, path: str, query: str, sub: str, vary: tuple = ()) -> tuple:
+        return (upstream, _collection(path), path.strip("/"), query, sub, vary)
+
+    def join(self, key: tuple) -> tuple:
+        """(flight, is_leader); (None, False) when the flight has no room left."""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = Flight()
+            self.leaders += 1
+            return flight, True
+        if flight.waiters >= self.max_waiters:
+            self.overflow += 1
+            return None, False
+        flight.waiters += 1
+        return flight, False
+
+    async def wait(self, flight: Flight) -> CachedResponse | None:
+        # shielded: a waiter whose client went away must not cancel the others
+        entry = await asyncio.shield(flight.future)
+        if entry is None:
+            self.unshared += 1
+        else:
+            self.shared += 1
+        return entry
+
+    def finish(self, key: tuple, flight: Flight, entry: CachedResponse | None = None, error: Exception | None = None):
+        """Hand the leader's response (or error) to the waiters. Always called
+        by the leader, also when it was cancelled, so nobody waits forever."""
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if flight.future.done():
+            return
+        if error is not None and flight.waiters:
+            flight.future.set_exception(error)
+        else:
+            flight.future.set_result(entry)
+
+    def shareable(self, upstream) -> bool:
+        length = upstream.headers.get("content-length")
+        return length is not None and length.isdigit() and int(length) <= self.max_body_bytes
+
+    def invalidate(self, upstream: str, path: str):
+        collection = _collection(path)
+        for key in [k for k in self._flights if k[0] == upstream and k[1] == collection]:
+            # running calls still answer their waiters; new requests start a new call
+            del self._flights[key]
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "shared": self.shared,
+            "unshared": self.unshared,
+            "overflow": self.overflow,
+        }
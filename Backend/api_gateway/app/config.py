@@ -1,23 +1,95 @@
 import os
+import tempfile
 from typing import List
+from fixflow_common.config import CommonSettings, env_bool
 
 
-class Settings:
+class Settings(CommonSettings):
     # Gateway URLs for downstream services (used in tests/local compose)
     USERS_URL: str = os.getenv("USERS_URL", "http://service_users:8001")
     ORDERS_URL: str = os.getenv("ORDERS_URL", "http://service_orders:8002")
 
-    # Security
-    # JWT secret can be provided directly or via a file (useful for Docker secrets)
-    _jwt_file = os.getenv("JWT_SECRET_FILE")
-    if _jwt_file and _jwt_file.strip() and os.path.exists(_jwt_file):
-        with open(_jwt_file, "r", encoding="utf-8") as f:
-            JWT_SECRET: str = f.read().strip()
-    else:
-        JWT_SECRET: str = os.getenv("JWT_SECRET", "CHANGE_ME_SECRET")
+    # Upstream connection pools (one per downstream service). Any value can be
+    # overridden per service with a USERS_/ORDERS_ prefix, e.g. ORDERS_UPSTREAM_MAX_CONNECTIONS
+    UPSTREAM_MAX_CONNECTIONS: int = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+    UPSTREAM_MAX_KEEPALIVE: int = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+    UPSTREAM_KEEPALIVE_EXPIRY: float = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+    UPSTREAM_CONNECT_TIMEOUT: float = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "2"))
+    UPSTREAM_READ_TIMEOUT: float = float(os.getenv("UPSTREAM_READ_TIMEOUT", "15"))
+    UPSTREAM_WRITE_TIMEOUT: float = float(os.getenv("UPSTREAM_WRITE_TIMEOUT", "15"))
+    UPSTREAM_POOL_TIMEOUT: float = float(os.getenv("UPSTREAM_POOL_TIMEOUT", "5"))
+    # HTTP/2 needs the 'h2' package and is only negotiated on https upstreams
+    UPSTREAM_HTTP2: bool = env_bool("UPSTREAM_HTTP2", False)
+    # Circuit breaker (see resilience.py): consecutive failures that open it, calls slower
+    # than SLOW_MS count as failures (0 = off), seconds open, probe calls when half-open
+    UPSTREAM_BREAKER_FAILURES: int = int(os.getenv("UPSTREAM_BREAKER_FAILURES", "5"))
+    UPSTREAM_BREAKER_SLOW_MS: float = float(os.getenv("UPSTREAM_BREAKER_SLOW_MS", "0"))
+    UPSTREAM_BREAKER_OPEN_SECONDS: float = float(os.getenv("UPSTREAM_BREAKER_OPEN_SECONDS", "10"))
+    UPSTREAM_BREAKER_PROBES: int = int(os.getenv("UPSTREAM_BREAKER_PROBES", "1"))
+    # Retries of idempotent calls after a transport error or 502/503/504, with full-jitter
+    # backoff; RETRY_BUDGET caps them (and hedges) at that share of recent calls
+    UPSTREAM_RETRIES: int = int(os.getenv("UPSTREAM_RETRIES", "2"))
+    UPSTREAM_RETRY_METHODS: str = os.getenv("UPSTREAM_RETRY_METHODS", "GET,HEAD,OPTIONS")
+    UPSTREAM_RETRY_BACKOFF_MS: float = float(os.getenv("UPSTREAM_RETRY_BACKOFF_MS", "50"))
+    UPSTREAM_RETRY_MAX_BACKOFF_MS: float = float(os.getenv("UPSTREAM_RETRY_MAX_BACKOFF_MS", "1000"))
+    UPSTREAM_RETRY_BUDGET: float = float(os.getenv("UPSTREAM_RETRY_BUDGET", "0.2"))
+    # Hedged requests: a second attempt for idempotent calls slower than the recent p95
+    # (never earlier than HEDGE_MIN_MS)
+    UPSTREAM_HEDGE: bool = env_bool("UPSTREAM_HEDGE", False)
+    UPSTREAM_HEDGE_MIN_MS: float = float(os.getenv("UPSTREAM_HEDGE_MIN_MS", "20"))
+
+    # Admission control (see admission.py): an adaptive concurrency limit per upstream,
+    # a bounded priority queue with a deadline, then 503 + Retry-After
+    ADMISSION_ENABLED: bool = env_bool("ADMISSION_ENABLED", True)
+    ADMISSION_INITIAL_LIMIT: int = int(os.getenv("ADMISSION_INITIAL_LIMIT", "20"))
+    ADMISSION_MIN_LIMIT: int = int(os.getenv("ADMISSION_MIN_LIMIT", "4"))
+    ADMISSION_MAX_LIMIT: int = int(os.getenv("ADMISSION_MAX_LIMIT", "100"))
+    # how far latency may rise over its long-run baseline before the limit shrinks
+    ADMISSION_RTT_TOLERANCE: float = float(os.getenv("ADMISSION_RTT_TOLERANCE", "2.0"))
+    ADMISSION_QUEUE_SIZE: int = int(os.getenv("ADMISSION_QUEUE_SIZE", "100"))
+    ADMISSION_QUEUE_TIMEOUT_MS: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "1000"))
+    # share of the limit that low-priority routes may use
+    ADMISSION_LOW_PRIORITY_SHARE: float = float(os.getenv("ADMISSION_LOW_PRIORITY_SHARE", "0.75"))
+    ADMISSION_RETRY_AFTER: float = float(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+    # "<METHOD> <upstream>/<path>=<high|normal|low>", comma separated; '*' matches one path segment
+    ADMISSION_PRIORITIES: str = os.getenv(
+        "ADMISSION_PRIORITIES",
+        "POST users/auth/login=high,PATCH orders/orders/*/status=high,PATCH orders/orders/status:batch=high,"
+        "GET orders/orders=low,GET users/users=low",
+    )
+
+    # Response cache for authenticated GETs (per user, invalidated by writes)
+    RESPONSE_CACHE_ENABLED: bool = env_bool("RESPONSE_CACHE_ENABLED", True)
+    RESPONSE_CACHE_TTL: float = float(os.getenv("RESPONSE_CACHE_TTL", "5"))
+    RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+    RESPONSE_CACHE_MAX_BYTES: int = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    RESPONSE_CACHE_MAX_ENTRY_BYTES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRY_BYTES", str(1024 * 1024)))
 
-    # Rate limiting (slowapi format)
-    RATE_LIMIT: str = os.getenv("RATE_LIMIT", "100/minute")
+    # Single-flight: identical concurrent GETs (same path, query and user) share one
+    # upstream call. Routes are "<upstream>/<path>" patterns, '*' matches one path segment
+    COALESCE_ENABLED: bool = env_bool("COALESCE_ENABLED", True)
+    COALESCE_ROUTES: str = os.getenv("COALESCE_ROUTES", "orders/orders,orders/orders/*")
+    COALESCE_MAX_WAITERS: int = int(os.getenv("COALESCE_MAX_WAITERS", "100"))
+    COALESCE_MAX_BODY_BYTES: int = int(os.getenv("COALESCE_MAX_BODY_BYTES", str(1024 * 1024)))
+
+    # Pass the verified claims downstream in X-Authenticated-User so services can
+    # skip re-verification (they must opt in with TRUST_IDENTITY_HEADER)
+    FORWARD_IDENTITY: bool = env_bool("FORWARD_IDENTITY", False)
+
+    # Rate limiting (GCRA): "<count>/<second|minute|hour|day>" per JWT sub;
+    # anonymous auth routes (register/login) are limited per client IP
+    RATE_LIMIT_ENABLED: bool = env_bool("RATE_LIMIT_ENABLED", True)
+    RATE_LIMIT: str = os.getenv("RATE_LIMIT", "200/minute")
+    RATE_LIMIT_ANONYMOUS: str = os.getenv("RATE_LIMIT_ANONYMOUS", "200/minute")
+    # request weights, "<METHOD> <upstream>/<path>=<cost>" comma separated; '*' matches one path segment
+    RATE_LIMIT_COSTS: str = os.getenv(
+        "RATE_LIMIT_COSTS",
+        "POST users/auth/register=5,POST orders/orders:batch=10,PATCH orders/orders/status:batch=10",
+    )
+    # 'memory' (per process), 'sqlite' (shared by the workers of one host) or 'redis'
+    RATE_LIMIT_STORE: str = os.getenv("RATE_LIMIT_STORE", "memory")
+    RATE_LIMIT_SQLITE_PATH: str = os.getenv("RATE_LIMIT_SQLITE_PATH", os.path.join(tempfile.gettempdir(), "fixflow-ratelimit.db"))
+    RATE_LIMIT_REDIS_URL: str = os.getenv("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
 
     # CORS origins (comma separated or single * for all)
     _cors = os.getenv("CORS_ORIGINS", "*")
@@ -26,10 +98,5 @@ class Settings:
     else:
         CORS_ORIGINS: List[str] = [s.strip() for s in _cors.split(",") if s.strip()]
 
-    # Optional observability
-    OTEL_COLLECTOR_URL: str | None = os.getenv("OTEL_COLLECTOR_URL")
-    # Password hashing algorithm for consistency across services (not used by gateway)
-    HASH_ALGORITHM: str = os.getenv("HASH_ALGORITHM", "pbkdf2_sha256")
-
 
 settings = Settings()
@@ -1,24 +1,33 @@
 from fastapi import FastAPI, Request, Depends, HTTPException
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from httpx import AsyncClient
+from starlette.background import BackgroundTask
 from .config import settings
-from .middleware import XRequestIDMiddleware
+from .upstream import UPSTREAM_DURATION, UPSTREAM_ERRORS, UpstreamPools
+from .cache import ResponseCache, etag_matches
+from .coalesce import SingleFlight
+from .resilience import RETRY_STATUSES, Resilience, UpstreamUnavailable
+from .admission import AdmissionControl, Overloaded
+from .ratelimit import RateLimiter, client_ip
 from .auth import get_current_user
-from .logging import setup_logging
-from .tracing import setup_tracing
+from fixflow_common.auth import identity_header, IDENTITY_HEADER
+from fixflow_common.middleware import RequestContextMiddleware
+from fixflow_common.responses import JSONResponse
+from fixflow_common.logging import log_stats, setup_logging
+from fixflow_common.metrics import register_callback, setup_metrics
+from fixflow_common.tracing import setup_tracing, span
 import logging
+import math
+import time
 
-app = FastAPI(title="API Gateway", openapi_prefix="/v1")
-app.add_middleware(XRequestIDMiddleware)
+app = FastAPI(title="API Gateway", openapi_prefix="/v1", default_response_class=JSONResponse)
+app.add_middleware(RequestContextMiddleware, logger_name="gateway")
 
 # structured logging
 setup_logging()
 # tracing (optional)
 tracer = setup_tracing(app, service_name="api_gateway")
+setup_metrics(app, service_name="api_gateway")
 
 # CORS
 app.add_middleware(
@@ -29,15 +38,73 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# rate limit (use setting if present)
-limiter = Limiter(key_func=get_remote_address, default_limits=[settings.RATE_LIMIT])
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-
 logger = logging.getLogger("gateway")
 logger.setLevel(logging.INFO)
 
-async_client = AsyncClient()
+upstreams = UpstreamPools()
+resilience = Resilience()
+admission = AdmissionControl(
+    enabled=settings.ADMISSION_ENABLED,
+    initial=settings.ADMISSION_INITIAL_LIMIT,
+    min_limit=settings.ADMISSION_MIN_LIMIT,
+    max_limit=settings.ADMISSION_MAX_LIMIT,
+    tolerance=settings.ADMISSION_RTT_TOLERANCE,
+    queue_size=settings.ADMISSION_QUEUE_SIZE,
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT_MS / 1000,
+    low_share=settings.ADMISSION_LOW_PRIORITY_SHARE,
+    priorities=settings.ADMISSION_PRIORITIES,
+)
+response_cache = ResponseCache(
+    ttl=settings.RESPONSE_CACHE_TTL,
+    max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    max_bytes=settings.RESPONSE_CACHE_MAX_BYTES,
+    max_entry_bytes=settings.RESPONSE_CACHE_MAX_ENTRY_BYTES,
+    enabled=settings.RESPONSE_CACHE_ENABLED,
+)
+coalescer = SingleFlight(
+    routes=settings.COALESCE_ROUTES,
+    max_waiters=settings.COALESCE_MAX_WAITERS,
+    max_body_bytes=settings.COALESCE_MAX_BODY_BYTES,
+    enabled=settings.COALESCE_ENABLED,
+)
+rate_limiter = RateLimiter() if settings.RATE_LIMIT_ENABLED else None
+
+
+def _pool_usage():
+    # reads the module global, so a pool swapped in by tests is reported
+    return {(name, state): pool[state] for name, pool in upstreams.stats().items() for state in ("active", "idle", "waiting")}
+
+
+register_callback("gateway_upstream_connections", "Upstream pool connections (active, idle) and requests waiting for one.", _pool_usage, ("upstream", "state"))
+register_callback("gateway_cache_requests_total", "Response cache lookups by result.", lambda: {("hit",): response_cache.hits, ("miss",): response_cache.misses}, ("result",), "counter")
+register_callback(
+    "gateway_coalesced_requests_total", "Single-flight GETs: calls made (leader), answered from one (shared), or sent on their own (unshared, overflow).",
+    lambda: {(k,): getattr(coalescer, k) for k in ("leaders", "shared", "unshared", "overflow")}, ("result",), "counter",
+)
+register_callback(
+    "gateway_circuit_state", "Circuit breaker per upstream: 0 closed, 1 half-open, 2 open.",
+    lambda: {(name,): ("closed", "half_open", "open").index(s["state"]) for name, s in resilience.stats().items()}, ("upstream",),
+)
+
+
+def _admission(key: str):
+    return lambda: {(name,): limiter.stats()[key] for name, limiter in admission.limiters.items()}
+
+
+register_callback("gateway_admission_limit", "Current adaptive concurrency limit per upstream.", _admission("limit"), ("upstream",))
+register_callback("gateway_admission_in_flight", "Admitted upstream calls in progress.", _admission("in_flight"), ("upstream",))
+register_callback("gateway_admission_queued", "Calls waiting for admission.", _admission("queued"), ("upstream",))
+register_callback("gateway_rate_limited_total", "Requests rejected with 429.", lambda: {(): rate_limiter.limited if rate_limiter else 0}, kind="counter")
+
+@app.on_event("startup")
+async def open_upstreams():
+    await upstreams.open()
+
+@app.on_event("shutdown")
+async def close_upstreams():
+    await upstreams.aclose()
+    if rate_limiter is not None:
+        await rate_limiter.aclose()
 
 def json_ok(data=None):
     return {"success": True, "data": data}
@@ -46,47 +113,233 @@ def json_ok(data=None):
 async def health():
     return json_ok({"status": "ok"})
 
-# Proxy helper
-async def proxy(request: Request, base_url: str, path: str):
-    url = f"{base_url}/{path}"
+@app.get("/health/upstreams")
+async def health_upstreams():
+    breakers = resilience.stats()
+    return json_ok({name: {**pool, "circuit": breakers[name]} for name, pool in upstreams.stats().items()})
+
+@app.get("/health/cache")
+async def health_cache():
+    return json_ok(response_cache.stats())
+
+@app.get("/health/coalescing")
+async def health_coalescing():
+    return json_ok(coalescer.stats())
+
+@app.get("/health/admission")
+async def health_admission():
+    return json_ok(admission.stats())
+
+@app.get("/health/logging")
+async def health_logging():
+    return json_ok(log_stats())
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+# Hop-by-hop headers are connection-specific and must not be forwarded (RFC 7230, 6.1)
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade", "host",
+}
+
+
+def _forward_headers(headers):
+    # a client-supplied identity header is never trusted, only the one set below
+    return [
+        (k, v) for k, v in headers.items()
+        if k.lower() not in HOP_BY_HOP_HEADERS and k.lower() != IDENTITY_HEADER.lower()
+    ]
+
+
+def _response_headers(upstream):
+    return [(k, v) for k, v in upstream.headers.multi_items() if k not in HOP_BY_HOP_HEADERS]
+
+
+def _cached_response(request: Request, entry, cache_status: str):
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        response = Response(status_code=304)
+        response.raw_headers = [(b"etag", entry.etag.encode("latin-1"))]
+    else:
+        response = Response(content=entry.body, status_code=entry.status_code)
+        response.raw_headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in entry.headers]
+    response.raw_headers.append((b"x-cache", cache_status.encode("latin-1")))
+    return response
+
+
+def _cacheable(upstream) -> bool:
+    if upstream.status_code != 200 or "no-store" in upstream.headers.get("cache-control", ""):
+        return False
+    # the key covers Accept-Encoding and nothing else the representation may vary on
+    vary = {v.strip().lower() for v in upstream.headers.get("vary", "").split(",") if v.strip()}
+    if vary - {"accept-encoding"}:
+        return False
+    length = upstream.headers.get("content-length")
+    return length is not None and length.isdigit() and int(length) <= response_cache.max_entry_bytes
+
+
+async def proxy(request: Request, upstream_name: str, path: str):
+    # cached and coalesced GETs are keyed per user, so one user never sees another's data
+    cache_key, generation = None, 0
+    user = getattr(request.state, "user", None)
+    authorized_get = request.method == "GET" and bool(user and user.get("sub"))
+    if authorized_get and response_cache.enabled:
+        cache_key = response_cache.key(upstream_name, path, str(request.query_params), user["sub"], request.headers.get("accept-encoding"))
+        entry = response_cache.get(cache_key)
+        if entry is not None:
+            return _cached_response(request, entry, "HIT")
+        generation = response_cache.generation(upstream_name, path)
+    if authorized_get and coalescer.applies(upstream_name, path):
+        return await _coalesced(request, upstream_name, path, user, cache_key, generation)
+    response, _ = await _forward(request, upstream_name, path, user, cache_key, generation)
+    return response
+
+
+async def _coalesced(request: Request, upstream_name: str, path: str, user: dict, cache_key, generation: int):
+    # the representation also depends on these request headers
+    vary = (request.headers.get("accept-encoding"), request.headers.get("if-none-match"))
+    key = coalescer.key(upstream_name, path, str(request.query_params), user["sub"], vary)
+    flight, leader = coalescer.join(key)
+    if flight is not None and not leader:
+        entry = await coalescer.wait(flight)
+        if entry is not None:
+            return _cached_response(request, entry, "COALESCED")
+    if not leader:
+        # no room on the flight, or its response was streamed: make our own call
+        response, _ = await _forward(request, upstream_name, path, user, cache_key, generation)
+        return response
+    entry = error = None
+    try:
+        response, entry = await _forward(request, upstream_name, path, user, cache_key, generation, share=True)
+    except Exception as exc:
+        error = exc
+        raise
+    finally:
+        coalescer.finish(key, flight, entry, error)
+    return response
+
+
+# Streams the request body upstream and the response body back chunk by chunk,
+# so neither is ever held in memory as a whole. Returns the response and, when
+# the body was read in full (to cache or to share it), the entry built from it
+async def _forward(request: Request, upstream_name: str, path: str, user, cache_key, generation: int, share: bool = False):
+    url = f"{upstreams.base_url(upstream_name)}/{path}"
+    client = upstreams.client(upstream_name)
     method = request.method
-    headers = dict(request.headers)
-    headers.pop("host", None)
-    headers.setdefault("X-Request-ID", request.state.request_id)
-    body = await request.body()
-    # optional tracing span around proxy call
+    headers = _forward_headers(request.headers)
+    if "x-request-id" not in request.headers:
+        headers.append(("X-Request-ID", request.state.request_id))
+    if settings.FORWARD_IDENTITY and user:
+        headers.append((IDENTITY_HEADER, identity_header(user)))
+    has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
+
+    def build():
+        return client.build_request(
+            method,
+            url,
+            headers=headers,
+            content=request.stream() if has_body else None,
+            params=request.query_params,
+        )
+
+    attributes = {"http.method": method, "http.url": url, "request_id": request.state.request_id}
+    with span("gateway.proxy", attributes) as s:
+        start = time.perf_counter()
+        try:
+            # a streamed request body can only be sent once
+            upstream = await _send(upstream_name, path, client, build, method, replayable=not has_body)
+        except Exception:
+            UPSTREAM_ERRORS.inc(upstream_name)
+            raise
+        # time to the upstream's response headers; the body is streamed afterwards
+        UPSTREAM_DURATION.observe(time.perf_counter() - start, upstream_name)
+        if s is not None:
+            s.set_attribute("http.status_code", upstream.status_code)
+
+    if method in WRITE_METHODS:
+        if response_cache.enabled:
+            response_cache.invalidate(upstream_name, path)
+        coalescer.invalidate(upstream_name, path)
+
+    cacheable = cache_key is not None and _cacheable(upstream)
+    if cacheable or (share and coalescer.shareable(upstream)):
+        try:
+            # raw bytes, so a content-encoded body is cached exactly as the upstream sent it
+            body = b"".join([chunk async for chunk in upstream.aiter_raw()])
+        finally:
+            await upstream.aclose()
+        if cacheable:
+            entry = response_cache.put(cache_key, upstream.status_code, _response_headers(upstream), body, generation)
+        else:
+            entry = response_cache.make_entry(upstream.status_code, _response_headers(upstream), body)
+        return _cached_response(request, entry, "MISS"), entry
+
+    # aiter_raw() keeps the upstream content-encoding intact, so content-length
+    # and content-encoding can be passed through as-is
+    response = StreamingResponse(
+        upstream.aiter_raw(),
+        status_code=upstream.status_code,
+        background=BackgroundTask(upstream.aclose),
+    )
+    response.raw_headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in _response_headers(upstream)]
+    return response, None
+
+async def _send(upstream_name: str, path: str, client, build, method: str, replayable: bool):
+    if not admission.enabled:
+        return await resilience.send(upstream_name, client, build, method, replayable)
     try:
-        from opentelemetry import trace as otel_trace
-        tracer_local = tracer or otel_trace.get_tracer(__name__)
-        with tracer_local.start_as_current_span("gateway.proxy") as span:
-            span.set_attribute("http.method", method)
-            span.set_attribute("http.url", url)
-            span.set_attribute("request_id", request.state.request_id)
-            resp = await async_client.request(method, url, headers=headers, content=body, params=request.query_params)
+        async with admission.admit(upstream_name, method, path) as ticket:
             try:
-                span.set_attribute("http.status_code", resp.status_code)
-                span.set_attribute("response_size", len(resp.content) if resp.content is not None else 0)
-            except Exception:
-                pass
-    except Exception:
-        resp = await async_client.request(method, url, headers=headers, content=body, params=request.query_params)
+                upstream = await resilience.send(upstream_name, client, build, method, replayable)
+            except UpstreamUnavailable as exc:
+                # an open circuit answered without calling the upstream
+                ticket.skip = exc.code == "upstream_unavailable"
+                raise
+            ticket.ok = upstream.status_code not in RETRY_STATUSES
+            return upstream
+    except Overloaded as exc:
+        raise UpstreamUnavailable(
+            upstream_name, 503, "overloaded", f"{upstream_name} is overloaded ({exc.reason})", retry_after=settings.ADMISSION_RETRY_AFTER,
+        ) from exc
 
-    content = resp.content
-    return StreamingResponse(content=iter([content]), status_code=resp.status_code, media_type=resp.headers.get("content-type"))
+# Rate limits are per user (JWT sub); the anonymous auth routes fall back to the client IP
+async def limited_proxy(request: Request, upstream_name: str, path: str, user: dict | None):
+    decision = None
+    if rate_limiter is not None:
+        key = f"sub:{user['sub']}" if user else f"ip:{client_ip(request)}"
+        decision = await rate_limiter.hit(key, request.method, f"{upstream_name}/{path}", anonymous=user is None)
+        if not decision.allowed:
+            return JSONResponse(
+                status_code=429,
+                content={"success": False, "error": {"code": "rate_limited", "message": "Too many requests"}},
+                headers=dict(decision.headers()),
+            )
+    response = await proxy(request, upstream_name, path)
+    if decision is not None:
+        response.raw_headers.extend((k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in decision.headers())
+    return response
 
 # Open paths: registration and login on users
+OPEN_USER_ROUTES = {("POST", "auth/register"), ("POST", "auth/login")}
+
 @app.api_route("/users/{path:path}", methods=["GET","POST","PUT","PATCH","DELETE","OPTIONS"])
-@limiter.limit("200/minute")
 async def users_proxy(path: str, request: Request):
-    if (request.method, path) not in [("POST", "auth/register"), ("POST", "auth/login")]:
-        await get_current_user(request.headers.get("authorization"), request)
-    return await proxy(request, settings.USERS_URL, path)
+    user = None
+    if (request.method, path) not in OPEN_USER_ROUTES:
+        user = await get_current_user(request.headers.get("authorization"), request)
+    return await limited_proxy(request, "users", path, user)
 
 @app.api_route("/orders/{path:path}", methods=["GET","POST","PUT","PATCH","DELETE","OPTIONS"])
-@limiter.limit("200/minute")
 async def orders_proxy(path: str, request: Request):
-    await get_current_user(request.headers.get("authorization"), request)
-    return await proxy(request, settings.ORDERS_URL, path)
+    user = await get_current_user(request.headers.get("authorization"), request)
+    return await limited_proxy(request, "orders", path, user)
+
+@app.exception_handler(UpstreamUnavailable)
+async def upstream_unavailable_handler(request: Request, exc: UpstreamUnavailable):
+    headers = {}
+    if exc.retry_after is not None:
+        headers["Retry-After"] = str(max(1, math.ceil(exc.retry_after)))
+    error = {"code": exc.code, "message": str(exc), "upstream": exc.upstream}
+    return JSONResponse(status_code=exc.status_code, content={"success": False, "error": error}, headers=headers)
 
 # Global exception handler
 @app.exception_handler(Exception)
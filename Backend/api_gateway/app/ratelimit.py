@@ -0,0 +1,221 @@
+"""Rate limiting for proxied routes (GCRA, the "virtual scheduling" token bucket).
+Requests are keyed by JWT sub, or by client IP on the anonymous auth routes,
+and weighted by a per-route cost. State is one float per key (the theoretical
+arrival time), kept in a pluggable store:
+  memory - per process, the default
+  sqlite - a file shared by all gateway workers on one host
+  redis  - shared by all gateways (needs the 'redis' package)
+A shared store that cannot answer (locked file, Redis down) lets the request
+through: the limiter must not take the gateway down with it.
+"""
+import asyncio
+import logging
+import math
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from .config import settings
+
+logger = logging.getLogger("gateway.ratelimit")
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_rate(rate: str) -> tuple:
+    """'200/minute' -> (200, 60.0)."""
+    count, _, period = rate.strip().partition("/")
+    period = period.strip().lower().rstrip("s")
+    if period not in _PERIODS:
+        raise ValueError(f"Invalid rate limit: {rate}")
+    return int(count), float(_PERIODS[period])
+
+
+def parse_costs(spec: str) -> list:
+    """'POST users/auth/register=5,PATCH orders/*/status=2' -> [(regex, cost)].
+    Patterns are matched against "<METHOD> <upstream>/<path>"; '*' spans one segment."""
+    costs = []
+    for entry in filter(None, (e.strip() for e in spec.split(","))):
+        pattern, _, cost = entry.rpartition("=")
+        regex = "[^/]*".join(re.escape(part) for part in pattern.strip().split("*"))
+        costs.append((re.compile(regex + "$"), int(cost)))
+    return costs
+
+
+class MemoryStore:
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._tat: dict = {}
+
+    async def update(self, key: str, increment: float, tau: float) -> tuple:
+        # runs without awaiting, so the read-modify-write is atomic on the loop
+        now = time.monotonic()
+        tat = max(self._tat.get(key, now), now)
+        if tat + increment - tau > now:
+            return False, tat, now
+        if len(self._tat) >= self.max_keys and key not in self._tat:
+            self._evict(now)
+        self._tat[key] = tat + increment
+        return True, tat + increment, now
+
+    def _evict(self, now: float):
+        # keys whose TAT has passed hold a full bucket and can be forgotten
+        self._tat = {k: v for k, v in self._tat.items() if v > now}
+        while len(self._tat) >= self.max_keys:
+            self._tat.pop(next(iter(self._tat)))
+
+    async def aclose(self):
+        pass
+
+
+class SQLiteStore:
+    """One row per key in a local file. BEGIN IMMEDIATE serialises the update
+    across processes. The transaction runs on a thread of its own, so waiting
+    for another worker's lock never blocks the event loop; if the lock is not
+    free within busy_timeout the request is allowed."""
+
+    def __init__(self, path: str, busy_timeout_ms: int = 50):
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS ratelimit (key TEXT PRIMARY KEY, tat REAL NOT NULL)")
+        # one thread: the connection is used by one transaction at a time
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ratelimit-sqlite")
+
+    async def update(self, key: str, increment: float, tau: float) -> tuple:
+        # wall clock: monotonic clocks are not comparable across processes
+        now = time.time()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._update, key, increment, tau, now)
+        except sqlite3.OperationalError as exc:
+            logger.warning("Rate limit store unavailable, allowing request: %s", exc)
+            return True, now, now
+
+    def _update(self, key: str, increment: float, tau: float, now: float) -> tuple:
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tat FROM ratelimit WHERE key = ?", (key,)).fetchone()
+            tat = max(row[0], now) if row else now
+            allowed = tat + increment - tau <= now
+            if allowed:
+                tat += increment
+                conn.execute("INSERT OR REPLACE INTO ratelimit (key, tat) VALUES (?, ?)", (key, tat))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, tat, now
+
+    async def aclose(self):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._conn.close)
+        self._executor.shutdown()
+
+
+# same algorithm as MemoryStore.update, on the server clock, in one round trip
+_GCRA_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local increment = tonumber(ARGV[1])
+local tau = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then tat = now end
+if tat + increment - tau > now then
+  return {0, tostring(tat), tostring(now)}
+end
+tat = tat + increment
+redis.call('SET', KEYS[1], tostring(tat), 'PX', math.ceil((tat - now) * 1000) + 1000)
+return {1, tostring(tat), tostring(now)}
+"""
+
+
+class RedisStore:
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+        from redis.exceptions import RedisError
+        self._redis = redis.from_url(url)
+        self._script = self._redis.register_script(_GCRA_LUA)
+        self._errors = (RedisError, OSError)
+
+    async def update(self, key: str, increment: float, tau: float) -> tuple:
+        try:
+            allowed, tat, now = await self._script(keys=[f"ratelimit:{key}"], args=[increment, tau])
+        except self._errors as exc:
+            logger.warning("Rate limit store unavailable, allowing request: %s", exc)
+            now = time.time()
+            return True, now, now
+        return bool(allowed), float(tat), float(now)
+
+    async def aclose(self):
+        await self._redis.aclose()
+
+
+def build_store(kind: str | None = None):
+    kind = kind or settings.RATE_LIMIT_STORE
+    if kind == "sqlite":
+        return SQLiteStore(settings.RATE_LIMIT_SQLITE_PATH)
+    if kind == "redis":
+        try:
+            return RedisStore(settings.RATE_LIMIT_REDIS_URL)
+        except ImportError:
+            logger.warning("RATE_LIMIT_STORE=redis requested but 'redis' package not available; using memory")
+    elif kind != "memory":
+        raise ValueError(f"Unknown RATE_LIMIT_STORE: {kind}")
+    return MemoryStore()
+
+
+@dataclass
+class Decision:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset: float
+    retry_after: float
+
+    def headers(self) -> list:
+        # RateLimit header fields (draft-ietf-httpapi-ratelimit-headers)
+        headers = [
+            ("RateLimit-Limit", str(self.limit)),
+            ("RateLimit-Remaining", str(self.remaining)),
+            ("RateLimit-Reset", str(math.ceil(self.reset))),
+        ]
+        if not self.allowed:
+            headers.append(("Retry-After", str(max(1, math.ceil(self.retry_after)))))
+        return headers
+
+
+class RateLimiter:
+    def __init__(self, store=None, rate: str | None = None, anonymous_rate: str | None = None, costs: str | None = None):
+        self.store = store or build_store()
+        self.rate = parse_rate(rate or settings.RATE_LIMIT)
+        self.anonymous_rate = parse_rate(anonymous_rate or settings.RATE_LIMIT_ANONYMOUS)
+        self.costs = parse_costs(settings.RATE_LIMIT_COSTS if costs is None else costs)
+        self.limited = 0
+
+    def cost(self, method: str, route: str) -> int:
+        target = f"{method} {route}"
+        for regex, cost in self.costs:
+            if regex.match(target):
+                return cost
+        return 1
+
+    async def hit(self, key: str, method: str, route: str, anonymous: bool = False) -> Decision:
+        count, period = self.anonymous_rate if anonymous else self.rate
+        # one request every `interval` seconds, with bursts of up to `count`
+        interval = period / count
+        cost = self.cost(method, route)
+        allowed, tat, now = await self.store.update(key, interval * cost, period)
+        remaining = max(0, int((period - (tat - now)) / interval))
+        if not allowed:
+            self.limited += 1
+            return Decision(False, count, remaining, tat - now, tat + interval * cost - period - now)
+        return Decision(True, count, remaining, tat - now, 0.0)
+
+    async def aclose(self):
+        await self.store.aclose()
+
+
+def client_ip(request) -> str:
+    return request.client.host if request.client else "unknown"
@@ -0,0 +1,282 @@
+"""Failure isolation for the upstream calls of the gateway, per upstream.
+
+  circuit breaker - opens after BREAKER_FAILURES consecutive failures
+                    (transport errors, timeouts, 502/503/504, and calls slower
+                    than BREAKER_SLOW_MS if set); while open every call fails
+                    fast with 503; after BREAKER_OPEN_SECONDS up to
+                    BREAKER_PROBES calls go through, and the first of them
+                    decides between closed and open again
+  retries         - only for RETRY_METHODS (idempotent, no request body), at
+                    most RETRIES more attempts with full-jitter exponential
+                    backoff, and only while the retry budget (a share of the
+                    recent calls) lasts, so retries cannot multiply an outage
+  hedging         - optional: an idempotent call still without response
+                    headers after the recent p95 latency gets a second, parallel
+                    attempt; the first response wins
+Every setting is UPSTREAM_<KEY>, overridable per upstream (ORDERS_UPSTREAM_<KEY>).
+"""
+import asyncio
+import math
+import random
+import time
+from collections import deque
+import httpx
+from fixflow_common.metrics import Counter
+from .upstream import UPSTREAMS, _as_bool, _pool_setting
+
+UPSTREAM_RETRIES = Counter("gateway_upstream_retries_total", "Upstream calls retried, per upstream.", ("upstream",))
+UPSTREAM_HEDGES = Counter("gateway_upstream_hedges_total", "Hedged second attempts sent, per upstream.", ("upstream",))
+CIRCUIT_REJECTED = Counter("gateway_circuit_rejected_total", "Requests failed fast because the circuit was open.", ("upstream",))
+
+# upstream answers that mean "not now" rather than "no"
+RETRY_STATUSES = {502, 503, 504}
+
+
+class UpstreamUnavailable(Exception):
+    """An upstream call that produced no usable response: 503 when the circuit
+    is open, 504 on a timeout, 502 for any other transport error."""
+
+    def __init__(self, upstream: str, status_code: int, code: str, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.upstream = upstream
+        self.status_code = status_code
+        self.code = code
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, failures: int, slow_seconds: float, open_seconds: float, probes: int):
+        self.failure_threshold = failures
+        self.slow_seconds = slow_seconds
+        self.open_seconds = open_seconds
+        self.probes = probes
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = 0
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._probing = 0
+        return self._state
+
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def acquire(self) -> tuple:
+        """(allowed, probe): may a call go through now, and did it take one of
+        the half-open probe slots? Pass `probe` on to the matching release()."""
+        state = self.state
+        if state == self.CLOSED:
+            return True, False
+        if state == self.HALF_OPEN and self._probing < self.probes:
+            self._probing += 1
+            return True, True
+        return False, False
+
+    def release(self, ok: bool | None, seconds: float = 0.0, probe: bool = False):
+        """Outcome of an acquired call; None when it was cancelled."""
+        if probe:
+            self._probing = max(0, self._probing - 1)
+        if ok is None:
+            return
+        if ok and self.slow_seconds and seconds >= self.slow_seconds:
+            ok = False
+        # only a probe decides, and only while no other probe has yet; a call
+        # acquired before the circuit opened just updates the failure count
+        probe = probe and self._state == self.HALF_OPEN
+        if ok:
+            self._failures = 0
+            if probe:
+                self._state = self.CLOSED
+            return
+        self._failures += 1
+        if probe or (self._state == self.CLOSED and self._failures >= self.failure_threshold):
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+            self.opened += 1
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self._failures, "opened": self.opened, "retry_after": round(self.retry_after(), 3)}
+
+
+class RetryBudget:
+    """Every call deposits `ratio` tokens (up to `cap`), every retry or hedge
+    spends one: extra attempts stay below ratio x calls."""
+
+    def __init__(self, ratio: float, cap: float = 10.0):
+        self.ratio = ratio
+        self.cap = cap
+        self.tokens = cap
+
+    def deposit(self):
+        self.tokens = min(self.cap, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class LatencyWindow:
+    """The last `size` response times; the p95 is recomputed every 32 samples."""
+
+    def __init__(self, size: int = 256, min_samples: int = 32):
+        self.samples = deque(maxlen=size)
+        self.min_samples = min_samples
+        self._p95 = None
+        self._stale = 0
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+        self._stale += 1
+
+    def p95(self) -> float | None:
+        if len(self.samples) < self.min_samples:
+            return None
+        if self._p95 is None or self._stale >= 32:
+            ordered = sorted(self.samples)
+            self._p95 = ordered[min(len(ordered) - 1, math.ceil(len(ordered) * 0.95) - 1)]
+            self._stale = 0
+        return self._p95
+
+
+class UpstreamPolicy:
+    def __init__(self, name: str):
+        self.name = name
+        self.breaker = CircuitBreaker(
+            failures=_pool_setting(name, "BREAKER_FAILURES", int),
+            slow_seconds=_pool_setting(name, "BREAKER_SLOW_MS", float) / 1000,
+            open_seconds=_pool_setting(name, "BREAKER_OPEN_SECONDS", float),
+            probes=_pool_setting(name, "BREAKER_PROBES", int),
+        )
+        self.retries = _pool_setting(name, "RETRIES", int)
+        self.retry_methods = {m.strip().upper() for m in _pool_setting(name, "RETRY_METHODS", str).split(",") if m.strip()}
+        self.backoff = _pool_setting(name, "RETRY_BACKOFF_MS", float) / 1000
+        self.max_backoff = _pool_setting(name, "RETRY_MAX_BACKOFF_MS", float) / 1000
+        self.budget = RetryBudget(_pool_setting(name, "RETRY_BUDGET", float))
+        self.hedge = _pool_setting(name, "HEDGE", _as_bool)
+        self.hedge_min = _pool_setting(name, "HEDGE_MIN_MS", float) / 1000
+        self.latency = LatencyWindow()
+
+    def hedge_delay(self) -> float | None:
+        p95 = self.latency.p95()
+        return None if p95 is None else max(p95, self.hedge_min)
+
+    def stats(self) -> dict:
+        p95 = self.latency.p95()
+        return {
+            **self.breaker.stats(),
+            "retry_tokens": round(self.budget.tokens, 2),
+            "p95_ms": None if p95 is None else round(p95 * 1000, 1),
+        }
+
+
+class Resilience:
+    def __init__(self):
+        self._policies: dict = {}
+
+    def policy(self, name: str) -> UpstreamPolicy:
+        policy = self._policies.get(name)
+        if policy is None:
+            policy = self._policies[name] = UpstreamPolicy(name)
+        return policy
+
+    def reset(self):
+        """Forget all state and re-read the settings (tests)."""
+        self._policies.clear()
+
+    def stats(self) -> dict:
+        return {name: self.policy(name).stats() for name in UPSTREAMS}
+
+    async def send(self, name: str, client: httpx.AsyncClient, build, method: str, replayable: bool) -> httpx.Response:
+        """Send the request made by `build()` through the policy of upstream
+        `name` and return the streamed response. `replayable` says whether
+        the request may be sent more than once (no streamed body)."""
+        policy = self.policy(name)
+        policy.budget.deposit()
+        idempotent = replayable and method in policy.retry_methods
+        attempts = 1 + (policy.retries if idempotent else 0)
+        for attempt in range(attempts):
+            allowed, probe = policy.breaker.acquire()
+            if not allowed:
+                CIRCUIT_REJECTED.inc(name)
+                raise UpstreamUnavailable(
+                    name, 503, "upstream_unavailable", f"{name} is unavailable", retry_after=policy.breaker.retry_after(),
+                )
+            last = attempt + 1 == attempts
+            start = time.perf_counter()
+            outcome = None
+            try:
+                if idempotent and policy.hedge:
+                    response = await self._hedged(policy, client, build)
+                else:
+                    response = await client.send(build(), stream=True)
+            except httpx.TransportError as exc:
+                outcome = False
+                if last or not policy.budget.withdraw():
+                    if isinstance(exc, httpx.TimeoutException):
+                        raise UpstreamUnavailable(name, 504, "upstream_timeout", f"{name} timed out") from exc
+                    raise UpstreamUnavailable(name, 502, "upstream_error", f"{name} failed: {exc.__class__.__name__}") from exc
+            else:
+                seconds = time.perf_counter() - start
+                outcome = response.status_code not in RETRY_STATUSES
+                policy.latency.observe(seconds)
+                if outcome or last or not policy.budget.withdraw():
+                    return response
+                await response.aclose()
+            finally:
+                policy.breaker.release(outcome, time.perf_counter() - start, probe)
+            UPSTREAM_RETRIES.inc(name)
+            # full jitter: uniform in [0, backoff * 2^attempt], capped
+            await asyncio.sleep(random.uniform(0, min(policy.max_backoff, policy.backoff * 2 ** attempt)))
+
+    async def _hedged(self, policy: UpstreamPolicy, client: httpx.AsyncClient, build) -> httpx.Response:
+        attempts = [asyncio.ensure_future(client.send(build(), stream=True))]
+        won = None
+        try:
+            delay = policy.hedge_delay()
+            if delay is not None:
+                done, _ = await asyncio.wait(attempts, timeout=delay)
+                if not done and policy.budget.withdraw():
+                    UPSTREAM_HEDGES.inc(policy.name)
+                    attempts.append(asyncio.ensure_future(client.send(build(), stream=True)))
+            pending, error = set(attempts), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif won is None:
+                        won = task
+                if won is not None:
+                    return won.result()
+            raise error
+        finally:
+            # losers, and every attempt when the caller went away
+            for task in attempts:
+                if task is not won:
+                    _discard(task)
+
+
+_closing: set = set()
+
+
+def _discard(task: asyncio.Future):
+    """Cancel an attempt whose response is not wanted; if it produced one
+    anyway (now or before the cancel lands), give its connection back."""
+
+    def close(task: asyncio.Future):
+        if not task.cancelled() and task.exception() is None:
+            closing = asyncio.ensure_future(task.result().aclose())
+            _closing.add(closing)
+            closing.add_done_callback(_closing.discard)
+
+    task.cancel()
+    task.add_done_callback(close)
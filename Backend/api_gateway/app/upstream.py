@@ -0,0 +1,97 @@
+"""Connection pools for the downstream services.
+One httpx.AsyncClient per upstream, so a burst against one service cannot
+exhaust the connections of the other.
+"""
+import os
+import logging
+import httpx
+from fixflow_common.metrics import Counter, Histogram
+from .config import settings
+
+logger = logging.getLogger("gateway.upstream")
+
+try:
+    import h2  # noqa: F401
+    H2_AVAILABLE = True
+except Exception:
+    H2_AVAILABLE = False
+
+# upstream name -> settings attribute holding its base URL
+UPSTREAMS = {"users": "USERS_URL", "orders": "ORDERS_URL"}
+
+UPSTREAM_DURATION = Histogram("gateway_upstream_duration_seconds", "Time to the upstream's response headers, per upstream.", ("upstream",))
+UPSTREAM_ERRORS = Counter("gateway_upstream_errors_total", "Proxied requests that failed without an upstream response.", ("upstream",))
+
+
+def _pool_setting(name: str, key: str, cast):
+    override = os.getenv(f"{name.upper()}_UPSTREAM_{key}")
+    if override is not None and override.strip():
+        return cast(override)
+    return getattr(settings, f"UPSTREAM_{key}")
+
+
+def _as_bool(raw: str) -> bool:
+    return raw.lower() in ("1", "true", "yes")
+
+
+class UpstreamPools:
+    def __init__(self, transport: httpx.AsyncBaseTransport | None = None):
+        # an explicit transport (e.g. httpx.ASGITransport in tests) replaces the network pools
+        self._transport = transport
+        self._clients: dict[str, httpx.AsyncClient] = {}
+
+    def base_url(self, name: str) -> str:
+        # read at call time so URL changes in settings are picked up
+        return getattr(settings, UPSTREAMS[name])
+
+    def _build_client(self, name: str) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=_pool_setting(name, "MAX_CONNECTIONS", int),
+            max_keepalive_connections=_pool_setting(name, "MAX_KEEPALIVE", int),
+            keepalive_expiry=_pool_setting(name, "KEEPALIVE_EXPIRY", float),
+        )
+        timeout = httpx.Timeout(
+            connect=_pool_setting(name, "CONNECT_TIMEOUT", float),
+            read=_pool_setting(name, "READ_TIMEOUT", float),
+            write=_pool_setting(name, "WRITE_TIMEOUT", float),
+            pool=_pool_setting(name, "POOL_TIMEOUT", float),
+        )
+        http2 = _pool_setting(name, "HTTP2", _as_bool)
+        if http2 and not H2_AVAILABLE:
+            logger.warning("UPSTREAM_HTTP2 requested for %s but 'h2' package not available; using HTTP/1.1", name)
+            http2 = False
+        return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2, transport=self._transport)
+
+    def client(self, name: str) -> httpx.AsyncClient:
+        # created lazily as well, for apps mounted without running their startup hooks
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._clients[name] = self._build_client(name)
+        return client
+
+    async def open(self):
+        for name in UPSTREAMS:
+            self.client(name)
+
+    async def aclose(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+    def stats(self) -> dict:
+        out = {}
+        for name in UPSTREAMS:
+            client = self._clients.get(name)
+            # httpx does not expose pool usage publicly; read it from the httpcore pool
+            pool = getattr(getattr(client, "_transport", None), "_pool", None)
+            connections = list(getattr(pool, "connections", []))
+            requests = list(getattr(pool, "_requests", []))
+            idle = sum(1 for c in connections if c.is_idle())
+            out[name] = {
+                "open": client is not None and not client.is_closed,
+                "max_connections": _pool_setting(name, "MAX_CONNECTIONS", int),
+                "active": len(connections) - idle,
+                "idle": idle,
+                "waiting": sum(1 for r in requests if r.is_queued()),
+            }
+        return out
@@ -0,0 +1,6 @@
+"""Load and latency benchmarks for the gateway -> services path.
+
+Run from the Backend directory:
+    python -m bench --workload mixed --concurrency 32 --duration 20 --out report.json
+See `python -m bench --help` and the README section "Бенчмарки".
+"""
@@ -0,0 +1,62 @@
+import argparse
+import asyncio
+import json
+import sys
+from .harness import AsgiTarget, SocketTarget, compare, load_json, run_workload, write_json
+from .workloads import WORKLOADS
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Load test the gateway -> services path.")
+    parser.add_argument("--workload", choices=sorted(WORKLOADS), default="mixed",
+                        help="; ".join(f"{name}: {w.description}" for name, w in sorted(WORKLOADS.items())))
+    parser.add_argument("--target", choices=("asgi", "socket"), default="asgi",
+                        help="asgi: one in-process composite app; socket: three local uvicorn servers")
+    parser.add_argument("--concurrency", type=int, default=16, help="virtual users")
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds of load before measuring")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers per app (socket target)")
+    parser.add_argument("--port", type=int, default=18000, help="first of three ports (socket target)")
+    parser.add_argument("--rate-limit", action="store_true", help="keep the gateway rate limiter on")
+    parser.add_argument("--access-logs", action="store_true", help="keep per-request access logging on")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="report to compare against; exit 1 on regression")
+    parser.add_argument("--metric", default="p95_ms", choices=("p50_ms", "p95_ms", "p99_ms", "mean_ms"),
+                        help="latency compared against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown, 0.15 = 15%%")
+    parser.add_argument("--save-baseline", help="also write the report here, as the next baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.target == "socket":
+        target = SocketTarget(args.concurrency, args.workers, args.port, args.access_logs, args.rate_limit)
+    else:
+        target = AsgiTarget(args.concurrency, args.access_logs, args.rate_limit)
+    workload = WORKLOADS[args.workload]()
+    report = asyncio.run(run_workload(target, workload, args.concurrency, args.duration, args.warmup))
+
+    if args.out:
+        write_json(args.out, report)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.save_baseline:
+        write_json(args.save_baseline, report)
+    print(f"{report['workload']} on {report['target']}: {report['requests']} requests, "
+          f"{report['throughput_rps']} req/s, {report['errors']} errors", file=sys.stderr)
+    for route, r in report["routes"].items():
+        print(f"  {route:36} {r['rps']:>8} req/s  p50 {r['p50_ms']:>8} ms  p95 {r['p95_ms']:>8} ms  p99 {r['p99_ms']:>8} ms", file=sys.stderr)
+
+    if args.baseline:
+        regressions = compare(report, load_json(args.baseline), args.tolerance, args.metric)
+        for r in regressions:
+            print(f"REGRESSION {r['route']} {r['metric']}: {r['baseline']} -> {r['current']}", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"no regressions against {args.baseline} (tolerance {args.tolerance:.0%})", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+"""How the hot queries scale with the size of the data.
+
+    python -m bench.db_scaling --steps 10000,100000,1000000 --out db-scaling.json
+
+For each step the seeder grows the users and orders databases to that many
+orders (and --users-ratio times as many users), then every case below is
+called --repeat times against the users and orders apps in-process, straight
+through httpx.ASGITransport with no gateway and no caches in between. The SQL
+each case runs is captured from the engine and its EXPLAIN QUERY PLAN stored
+next to the latencies. Plan lines starting with SEARCH look rows up through an
+index; SCAN lines walk a whole table or index and are listed separately; with
+an ORDER BY ... LIMIT they may stop early, unless a filter rejects most rows.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from contextvars import ContextVar
+import httpx
+from .harness import BACKEND_DIR, bench_environment, migrate_databases, percentile, write_json
+from .seed import Seeder, table_counts
+
+# (label, service, method, path template); {order_id}, {q} and {q_rare} are filled per call
+CASES = (
+    ("list_orders", "orders", "GET", "/v1/orders?limit=20"),
+    ("list_orders sort=total", "orders", "GET", "/v1/orders?limit=20&sort=total"),
+    ("list_orders include_total", "orders", "GET", "/v1/orders?limit=20&include_total=true"),
+    ("list_orders offset=1000", "orders", "GET", "/v1/orders?limit=20&offset=1000"),
+    ("get_order", "orders", "GET", "/v1/orders/{order_id}"),
+    ("update_status", "orders", "PATCH", "/v1/orders/{order_id}/status"),
+    ("list_users", "users", "GET", "/v1/users?limit=20"),
+    ("list_users q=common", "users", "GET", "/v1/users?limit=20&q={q}"),
+    ("list_users q=rare", "users", "GET", "/v1/users?limit=20&q={q_rare}"),
+    ("list_users q= include_total", "users", "GET", "/v1/users?limit=20&q={q}&include_total=true"),
+)
+STATUSES = ("created", "in_work", "completed")
+
+
+# set around a captured call; ASGITransport runs the app in the caller's context,
+# so background tasks such as the outbox relay are left out
+_capturing: ContextVar = ContextVar("capturing", default=None)
+
+
+class SqlCapture:
+    """Collects the statements the engines run inside `with capture:`."""
+
+    def __init__(self, *engines):
+        from sqlalchemy import event
+        self.statements = []
+        self._token = None
+        for engine in engines:
+            event.listen(engine.sync_engine, "before_cursor_execute", self._record)
+
+    def __enter__(self):
+        self.statements = []
+        self._token = _capturing.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _capturing.reset(self._token)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if _capturing.get() is self and not executemany:
+            self.statements.append((statement, tuple(parameters or ())))
+
+
+def explain(db_file: str, statement: str, parameters: tuple) -> list:
+    conn = sqlite3.connect(db_file)
+    try:
+        rows = conn.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+    finally:
+        conn.close()
+    depth = {0: -1}
+    lines = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node] + detail)
+    return lines
+
+
+def scans(plan: list) -> list:
+    # "SCAN t" reads the table, "SCAN t USING [COVERING] INDEX i" all of index i
+    return [line.strip() for line in plan if line.strip().startswith("SCAN ")]
+
+
+class Bench:
+    def __init__(self, workdir: str, args):
+        self.workdir = workdir
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.env = bench_environment(workdir)
+        # counts must hit the database on every call; access logs would dominate fast cases
+        self.env.update({"COUNT_CACHE_TTL": "0", "LOG_ACCESS_SAMPLE_RATE": "0", "USER_CACHE_TTL": "0"})
+        self.seeder = Seeder(self.env["USERS_DB_FILE"], self.env["ORDERS_DB_FILE"], buyers=args.buyers, skew=args.skew, seed=args.seed)
+
+    async def start(self):
+        os.environ.update(self.env)
+        os.environ.pop("USERS_DATABASE_URL", None)
+        os.environ.pop("ORDERS_DATABASE_URL", None)
+        migrate_databases({**os.environ})
+        if BACKEND_DIR not in sys.path:
+            sys.path.insert(0, BACKEND_DIR)
+        import logging
+        from fastapi import FastAPI
+        from service_users.app import db as users_db
+        from service_users.app.auth import create_access_token
+        from service_users.app.main import app as users_app
+        from service_orders.app import db as orders_db
+        from service_orders.app.main import app as orders_app
+
+        logging.getLogger().setLevel(logging.WARNING)
+        self.create_access_token = create_access_token
+        self.dbs = {"users": users_db, "orders": orders_db}
+        self.capture = {
+            "users": SqlCapture(*{users_db.engine, users_db.read_engine}),
+            "orders": SqlCapture(*{orders_db.engine, orders_db.read_engine}),
+        }
+        composite = FastAPI()
+        composite.mount("/users", users_app)
+        composite.mount("/orders", orders_app)
+        self.apps = [users_app, orders_app]
+        for app in self.apps:
+            await app.router.startup()
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=composite), base_url="http://bench", timeout=120)
+
+    async def stop(self):
+        await self.client.aclose()
+        for app in reversed(self.apps):
+            await app.router.shutdown()
+
+    def _sample(self):
+        """Tokens and ids to query with, re-read after every growth step."""
+        users = sqlite3.connect(self.env["USERS_DB_FILE"])
+        orders = sqlite3.connect(self.env["ORDERS_DB_FILE"])
+        try:
+            admin_id, admin_email = users.execute("SELECT id, email FROM users ORDER BY rowid LIMIT 1").fetchone()
+            # the buyer with the most orders: the worst case for the per-user lists
+            heavy = orders.execute('SELECT user_id FROM "order" GROUP BY user_id ORDER BY count(*) DESC LIMIT 1').fetchone()[0]
+            heavy_orders = orders.execute('SELECT count(*) FROM "order" WHERE user_id = ?', (heavy,)).fetchone()[0]
+            max_rowid = orders.execute('SELECT max(rowid) FROM "order"').fetchone()[0]
+            rowids = [self.rng.randint(1, max_rowid) for _ in range(self.args.repeat + 1)]
+            order_ids = [r[0] for r in orders.execute(
+                f'SELECT id FROM "order" WHERE rowid IN ({",".join("?" * len(rowids))})', rowids,
+            ).fetchall()]
+            rare = users.execute("SELECT email FROM users ORDER BY rowid DESC LIMIT 1").fetchone()[0]
+        finally:
+            users.close()
+            orders.close()
+        return {
+            "admin": {"Authorization": f"Bearer {self.create_access_token(admin_id, admin_email, ['admin'])}"},
+            "heavy": {"Authorization": f"Bearer {self.create_access_token(heavy, 'heavy@seed.local', ['user'])}"},
+            "heavy_orders": heavy_orders,
+            "order_ids": order_ids,
+            "q": "ivan",
+            # matches a single user; LIKE '%...%' still has to look at every row
+            "q_rare": rare.split("@")[0],
+        }
+
+    async def _call(self, sample: dict, service: str, method: str, path: str):
+        order_id = self.rng.choice(sample["order_ids"])
+        url = f"/{service}" + path.format(order_id=order_id, q=sample["q"], q_rare=sample["q_rare"])
+        # per-user lists run as the heaviest buyer, everything else as the admin
+        headers = sample["heavy"] if service == "orders" and "{order_id}" not in path else sample["admin"]
+        kwargs = {"json": {"status": self.rng.choice(STATUSES)}} if method == "PATCH" else {}
+        start = time.perf_counter()
+        response = await self.client.request(method, url, headers=headers, **kwargs)
+        elapsed = time.perf_counter() - start
+        if response.status_code != 200:
+            raise RuntimeError(f"{method} {url}: {response.status_code} {response.text[:200]}")
+        return elapsed
+
+    async def run_case(self, sample: dict, service: str, method: str, path: str) -> dict:
+        capture = self.capture[service]
+        with capture:
+            await self._call(sample, service, method, path)
+        statements = []
+        for statement, parameters in capture.statements:
+            plan = explain(self.dbs[service].DB_FILE, statement, parameters)
+            statements.append({"sql": " ".join(statement.split()), "plan": plan, "scans": scans(plan)})
+
+        timings = sorted([await self._call(sample, service, method, path) for _ in range(self.args.repeat)])
+        return {
+            "mean_ms": round(sum(timings) / len(timings) * 1000, 3),
+            "p50_ms": round(percentile(timings, 50) * 1000, 3),
+            "p95_ms": round(percentile(timings, 95) * 1000, 3),
+            "p99_ms": round(percentile(timings, 99) * 1000, 3),
+            "statements": statements,
+        }
+
+    async def run_step(self, orders: int) -> dict:
+        users = max(self.args.buyers + 1, int(orders * self.args.users_ratio))
+        # the apps' pooled connections would keep reading the old pages and statistics
+        for db in self.dbs.values():
+            await db.dispose_engines()
+        seeding = self.seeder.grow(users, orders)
+        if self.args.analyze:
+            self.seeder.analyze()
+        sample = self._sample()
+        cases = {}
+        for label, service, method, path in CASES:
+            cases[label] = await self.run_case(sample, service, method, path)
+        size = sum(os.path.getsize(self.env[k]) for k in ("USERS_DB_FILE", "ORDERS_DB_FILE"))
+        return {
+            "counts": table_counts(self.env["USERS_DB_FILE"], self.env["ORDERS_DB_FILE"]),
+            "heaviest_buyer_orders": sample["heavy_orders"],
+            "db_size_mb": round(size / 2**20, 1),
+            "seeding": seeding,
+            "cases": cases,
+        }
+
+
+def summary(steps: list) -> str:
+    sizes = [s["counts"]["order"] for s in steps]
+    lines = [f"{'case':30}" + "".join(f"{n:>12,}" for n in sizes) + "   p50 ms by orders"]
+    for label, *_ in CASES:
+        lines.append(f"{label:30}" + "".join(f"{s['cases'][label]['p50_ms']:>12}" for s in steps))
+    found = {}
+    for label, *_ in CASES:
+        for statement in steps[-1]["cases"][label]["statements"]:
+            for scan in statement["scans"]:
+                found.setdefault(label, set()).add(scan)
+    for label, plans in found.items():
+        lines.append(f"{label}: {', '.join(sorted(plans))}")
+    return "\n".join(lines)
+
+
+async def run(args) -> dict:
+    with tempfile.TemporaryDirectory(prefix="fixflow-dbbench-") as tmp:
+        workdir = args.workdir or tmp
+        os.makedirs(workdir, exist_ok=True)
+        bench = Bench(workdir, args)
+        await bench.start()
+        steps = []
+        try:
+            for orders in args.steps:
+                steps.append(await bench.run_step(orders))
+                print(f"{orders:,} orders done", file=sys.stderr)
+        finally:
+            await bench.stop()
+    return {
+        "repeat": args.repeat,
+        "buyers": args.buyers,
+        "skew": args.skew,
+        "users_ratio": args.users_ratio,
+        "analyzed": args.analyze,
+        "steps": steps,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.db_scaling", description="Query latency and plans as the data grows.")
+    parser.add_argument("--steps", type=lambda v: [int(x) for x in v.split(",")], default=[10000, 100000, 1000000],
+                        help="comma-separated order counts, ascending")
+    parser.add_argument("--users-ratio", type=float, default=0.1, help="users per order at each step")
+    parser.add_argument("--buyers", type=int, default=2000, help="users that own orders")
+    parser.add_argument("--skew", type=float, default=2.0, help="see python -m bench.seed --help")
+    parser.add_argument("--repeat", type=int, default=50, help="timed calls per case and step")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--analyze", action="store_true", help="run ANALYZE after each growth step")
+    parser.add_argument("--workdir", help="keep the seeded databases here instead of a temporary directory")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    if args.out:
+        write_json(args.out, report)
+    else:
+        print(json.dumps(report, indent=2))
+    print(summary(report["steps"]), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
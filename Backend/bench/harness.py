@@ -0,0 +1,312 @@
+"""Targets, the load loop, reports and baseline comparison.
+
+Two targets serve the same gateway URLs:
+  asgi   - gateway, users and orders mounted in one FastAPI app and driven
+           through httpx.ASGITransport, as in tests/test_e2e.py: no sockets,
+           no server, one event loop; good for comparing code changes
+  socket - the three apps started as uvicorn processes on local ports;
+           adds HTTP parsing, the network stack and worker processes
+Both use fresh SQLite files in a temporary directory, never data/*.db.
+"""
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the root logger and the app loggers that write access lines; the apps set
+# their own logger to INFO, so quieting the root alone leaves those on
+APP_LOGGERS = ("", "gateway", "service_users", "service_orders")
+
+
+def bench_environment(workdir: str, rate_limit: bool = False) -> dict:
+    """Settings for the apps under test; must be in os.environ before they are imported."""
+    return {
+        "USERS_DB_FILE": os.path.join(workdir, "users.db"),
+        "ORDERS_DB_FILE": os.path.join(workdir, "orders.db"),
+        "ORDERS_EVENTS_FILE": os.path.join(workdir, "orders-events.jsonl"),
+        "USERS_EVENTS_FILE": os.path.join(workdir, "users-events.jsonl"),
+        "RATE_LIMIT_ENABLED": "true" if rate_limit else "false",
+        "RATE_LIMIT_SQLITE_PATH": os.path.join(workdir, "ratelimit.db"),
+    }
+
+
+def migrate_databases(env: dict):
+    """Bring the users and orders databases named in `env` to the head revision."""
+    for service in ("service_users", "service_orders"):
+        subprocess.run(
+            [sys.executable, "-c", f"import asyncio; from {service}.app.db import migrate_db; asyncio.run(migrate_db())"],
+            cwd=BACKEND_DIR, env=env, check=True,
+        )
+
+
+class AsgiTarget:
+    prefix = "/v1"
+
+    def __init__(self, concurrency: int, access_logs: bool = False, rate_limit: bool = False):
+        self.concurrency = concurrency
+        self.access_logs = access_logs
+        self.rate_limit = rate_limit
+        self._workdir = tempfile.TemporaryDirectory(prefix="fixflow-bench-")
+        self._apps = []
+        self._log_levels = {}
+
+    async def start(self) -> httpx.AsyncClient:
+        os.environ.update(bench_environment(self._workdir.name, self.rate_limit))
+        if BACKEND_DIR not in sys.path:
+            sys.path.insert(0, BACKEND_DIR)
+        import logging
+        from fastapi import FastAPI
+        from api_gateway.app import main as gateway_main
+        from api_gateway.app.config import settings as gateway_settings
+        from api_gateway.app.upstream import UpstreamPools
+        from service_users.app.main import app as users_app
+        from service_orders.app.main import app as orders_app
+
+        if not self.access_logs:
+            for name in APP_LOGGERS:
+                logger = logging.getLogger(name)
+                self._log_levels[name] = logger.level
+                logger.setLevel(logging.WARNING)
+        composite = FastAPI()
+        composite.mount("/v1", gateway_main.app)
+        composite.mount("/users", users_app)
+        composite.mount("/orders", orders_app)
+        gateway_settings.USERS_URL = "http://bench/users/v1"
+        gateway_settings.ORDERS_URL = "http://bench/orders/v1"
+        transport = httpx.ASGITransport(app=composite)
+        gateway_main.upstreams = UpstreamPools(transport=transport)
+        # mounted apps do not get lifespan events; run their startup hooks directly
+        self._apps = [users_app, orders_app, gateway_main.app]
+        for app in self._apps:
+            await app.router.startup()
+        return httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60)
+
+    async def stop(self):
+        for app in reversed(self._apps):
+            await app.router.shutdown()
+        import logging
+        for name, level in self._log_levels.items():
+            logging.getLogger(name).setLevel(level)
+        self._log_levels = {}
+        self._workdir.cleanup()
+
+
+class SocketTarget:
+    prefix = ""
+
+    def __init__(self, concurrency: int, workers: int = 1, base_port: int = 18000, access_logs: bool = False, rate_limit: bool = False):
+        self.concurrency = concurrency
+        self.workers = workers
+        self.ports = {"gateway": base_port, "users": base_port + 1, "orders": base_port + 2}
+        self.access_logs = access_logs
+        self.rate_limit = rate_limit
+        self._workdir = tempfile.TemporaryDirectory(prefix="fixflow-bench-")
+        self._procs = []
+
+    def _spawn(self, module: str, port: int, env: dict):
+        cmd = [
+            sys.executable, "-m", "uvicorn", f"{module}:app", "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(self.workers), "--no-access-log",
+        ]
+        log = open(os.path.join(self._workdir.name, f"{port}.log"), "wb")
+        self._procs.append((subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdout=log, stderr=log), log))
+
+    async def _wait_ready(self, url: str, timeout: float = 30.0):
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as client:
+            while True:
+                try:
+                    if (await client.get(url)).status_code == 200:
+                        return
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{url} not ready after {timeout}s; see logs in {self._workdir.name}")
+                await asyncio.sleep(0.2)
+
+    async def start(self) -> httpx.AsyncClient:
+        env = {**os.environ, **bench_environment(self._workdir.name, self.rate_limit)}
+        if not self.access_logs:
+            env["LOG_ACCESS_SAMPLE_RATE"] = "0"
+        if self.workers > 1:
+            env["SQLITE_MODE"] = env.get("SQLITE_MODE", "tuned")
+        # migrate the fresh files up front, so several workers do not race to do it
+        migrate_databases(env)
+        self._spawn("service_users.app.main", self.ports["users"], env)
+        await self._wait_ready(f"http://127.0.0.1:{self.ports['users']}/v1/health/hashing")
+        self._spawn("service_orders.app.main", self.ports["orders"], env)
+        await self._wait_ready(f"http://127.0.0.1:{self.ports['orders']}/v1/health/events")
+        env["USERS_URL"] = f"http://127.0.0.1:{self.ports['users']}/v1"
+        env["ORDERS_URL"] = f"http://127.0.0.1:{self.ports['orders']}/v1"
+        self._spawn("api_gateway.app.main", self.ports["gateway"], env)
+        await self._wait_ready(f"http://127.0.0.1:{self.ports['gateway']}/health")
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        return httpx.AsyncClient(base_url=f"http://127.0.0.1:{self.ports['gateway']}", limits=limits, timeout=60)
+
+    async def stop(self):
+        for proc, log in self._procs:
+            proc.terminate()
+        for proc, log in self._procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+            log.close()
+        self._workdir.cleanup()
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict = {}
+        self.errors: dict = {}
+        self.statuses: dict = {}
+        self.recording = False
+
+    def record(self, route: str, seconds: float, status: int | None):
+        if not self.recording:
+            return
+        self.latencies.setdefault(route, []).append(seconds)
+        key = str(status) if status is not None else "transport_error"
+        statuses = self.statuses.setdefault(route, {})
+        statuses[key] = statuses.get(key, 0) + 1
+        if status is None or status >= 400:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+
+class Session:
+    """What a workload sees: one virtual user's view of the gateway."""
+
+    def __init__(self, client: httpx.AsyncClient, prefix: str, recorder: Recorder):
+        self.client = client
+        self.prefix = prefix
+        self.recorder = recorder
+
+    async def call(self, route: str, method: str, path: str, measured: bool = True, **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, self.prefix + path, **kwargs)
+        except httpx.TransportError:
+            if measured:
+                self.recorder.record(route, time.perf_counter() - start, None)
+            raise
+        if measured:
+            self.recorder.record(route, time.perf_counter() - start, response.status_code)
+        elif response.status_code >= 400:
+            raise RuntimeError(f"setup request {route} failed: {response.status_code} {response.text[:200]}")
+        return response
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    # nearest rank
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+async def run_workload(target, workload, concurrency: int, duration: float, warmup: float) -> dict:
+    client = await target.start()
+    recorder = Recorder()
+    session = Session(client, target.prefix, recorder)
+    stop_at = None
+
+    async def virtual_user():
+        state = await workload.setup(session)
+        while stop_at is None or time.perf_counter() < stop_at:
+            try:
+                await workload.step(session, state)
+            except (httpx.TransportError, KeyError, ValueError):
+                # already recorded as an error; keep the load going
+                await asyncio.sleep(0)
+
+    try:
+        users = [asyncio.create_task(virtual_user()) for _ in range(concurrency)]
+        await asyncio.sleep(warmup)
+        recorder.recording = True
+        started = time.perf_counter()
+        stop_at = started + duration
+        await asyncio.gather(*users)
+        elapsed = time.perf_counter() - started
+    finally:
+        await client.aclose()
+        await target.stop()
+    return build_report(recorder, workload.name, type(target).__name__, concurrency, elapsed)
+
+
+def build_report(recorder: Recorder, workload: str, target: str, concurrency: int, elapsed: float) -> dict:
+    routes = {}
+    for route, values in sorted(recorder.latencies.items()):
+        values.sort()
+        routes[route] = {
+            "count": len(values),
+            "errors": recorder.errors.get(route, 0),
+            "statuses": recorder.statuses.get(route, {}),
+            "rps": round(len(values) / elapsed, 1),
+            "mean_ms": round(sum(values) / len(values) * 1000, 3),
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+            "max_ms": round(values[-1] * 1000, 3),
+        }
+    total = sum(r["count"] for r in routes.values())
+    return {
+        "workload": workload,
+        "target": target,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 3),
+        "requests": total,
+        "errors": sum(r["errors"] for r in routes.values()),
+        "throughput_rps": round(total / elapsed, 1),
+        "routes": routes,
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "commit": _git_commit(),
+        },
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return out.stdout.strip() or None
+
+
+def compare(report: dict, baseline: dict, tolerance: float, metric: str = "p95_ms") -> list:
+    """Regressions of `report` against `baseline`: routes whose `metric` grew,
+    or whose throughput fell, by more than `tolerance` (0.15 = 15%)."""
+    regressions = []
+    for route, base in baseline.get("routes", {}).items():
+        current = report["routes"].get(route)
+        if current is None:
+            continue
+        if base[metric] > 0 and current[metric] > base[metric] * (1 + tolerance):
+            regressions.append({"route": route, "metric": metric, "baseline": base[metric], "current": current[metric]})
+        if base["rps"] > 0 and current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append({"route": route, "metric": "rps", "baseline": base["rps"], "current": current["rps"]})
+    if baseline.get("throughput_rps") and report["throughput_rps"] < baseline["throughput_rps"] * (1 - tolerance):
+        regressions.append({"route": "*", "metric": "throughput_rps", "baseline": baseline["throughput_rps"], "current": report["throughput_rps"]})
+    return regressions
+
+
+def load_json(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_json(path: str, data: dict):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
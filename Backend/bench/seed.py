@@ -0,0 +1,278 @@
+"""Bulk-load realistic volumes into the users and orders SQLite databases.
+
+    python -m bench.seed --users 200000 --orders 2000000 --buyers 5000
+
+Rows are appended until the tables reach the requested counts, so running it
+again with larger numbers grows an existing data set. The schema comes from
+the services' migrations; rows go in through sqlite3 executemany in large
+transactions, bypassing the ORM and the outbox (no events are published).
+Orders belong to the first --buyers users, skewed so that a few of them own
+many orders (--skew 1 spreads them evenly). Every seeded user can log in with
+--password.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+import uuid
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from .harness import BACKEND_DIR, migrate_databases
+
+FIRST_NAMES = (
+    "Anna", "Ivan", "Maria", "Sergey", "Olga", "Dmitry", "Elena", "Alexey", "Natalia", "Pavel",
+    "Irina", "Nikolai", "Tatiana", "Andrey", "Svetlana", "Mikhail", "Yulia", "Artem", "Ekaterina", "Roman",
+)
+LAST_NAMES = (
+    "Ivanov", "Smirnov", "Kuznetsov", "Popov", "Vasiliev", "Petrov", "Sokolov", "Mikhailov", "Novikov", "Fedorov",
+    "Morozov", "Volkov", "Alekseev", "Lebedev", "Semenov", "Egorov", "Pavlov", "Kozlov", "Stepanov", "Nikolaev",
+)
+# created 15%, in work 10%, completed 70%, cancelled 5%
+STATUS_WEIGHTS = (("created", 15), ("in_work", 10), ("completed", 70), ("cancelled", 5))
+SKUS = 5000
+
+
+def _timestamp(dt: datetime) -> str:
+    # the format SQLAlchemy's DateTime uses on SQLite; keyset cursors compare these strings
+    return dt.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, isolation_level=None)
+    # a crash mid-load may corrupt the file; it is a generated data set
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-262144")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def _count(conn: sqlite3.Connection, table: str) -> int:
+    return conn.execute(f'SELECT count(*) FROM "{table}"').fetchone()[0]
+
+
+class _IndexesDropped:
+    """Drop the secondary indexes of `tables` for a large load and rebuild them
+    afterwards: one sort per index instead of a B-tree insert per row."""
+
+    def __init__(self, conn: sqlite3.Connection, tables: tuple):
+        self.conn = conn
+        self.tables = tables
+        self.indexes = []
+
+    def __enter__(self):
+        marks = ",".join("?" * len(self.tables))
+        # sql is NULL for the automatic primary key / unique constraint indexes
+        self.indexes = self.conn.execute(
+            f"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({marks})",
+            self.tables,
+        ).fetchall()
+        for name, _ in self.indexes:
+            self.conn.execute(f'DROP INDEX "{name}"')
+        return self
+
+    def __exit__(self, *exc):
+        for _, sql in self.indexes:
+            self.conn.execute(sql)
+
+
+class Seeder:
+    def __init__(self, users_db: str, orders_db: str, buyers: int = 2000, skew: float = 2.0, days: int = 365,
+                 batch_size: int = 50000, password: str = "seed-password", seed: int = 42):
+        self.users_db = users_db
+        self.orders_db = orders_db
+        self.buyers = buyers
+        self.skew = skew
+        self.days = days
+        self.batch_size = batch_size
+        self.password = password
+        self.seed = seed
+        self.now = datetime.utcnow()
+        self._hashed = None
+
+    def _rng(self, offset: int) -> random.Random:
+        # deterministic per starting row, so growing in steps gives stable data
+        return random.Random(self.seed * 1_000_003 + offset)
+
+    def _uuid(self, rng: random.Random) -> str:
+        return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+    def _when(self, rng: random.Random) -> datetime:
+        return self.now - timedelta(seconds=rng.random() * self.days * 86400)
+
+    def hashed_password(self) -> str:
+        if self._hashed is None:
+            # one hash shared by every seeded user; settings come from the environment
+            if BACKEND_DIR not in sys.path:
+                sys.path.insert(0, BACKEND_DIR)
+            from service_users.app.auth import hash_password
+            self._hashed = hash_password(self.password)
+        return self._hashed
+
+    def _users(self, start: int, stop: int):
+        rng = self._rng(start)
+        hashed = self.hashed_password()
+        for n in range(start, stop):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            created = _timestamp(self._when(rng))
+            roles = '["admin"]' if n == 0 else '["user"]'
+            yield (self._uuid(rng), f"{first.lower()}.{last.lower()}.{n}@seed.local", hashed, f"{first} {last}", roles, created, created)
+
+    def _orders(self, start: int, stop: int, buyer_ids: list):
+        """(order rows, item rows) per batch of at most batch_size orders."""
+        rng = self._rng(start)
+        statuses = [s for s, _ in STATUS_WEIGHTS]
+        weights = [w for _, w in STATUS_WEIGHTS]
+        orders, items = [], []
+        for n in range(start, stop):
+            order_id = self._uuid(rng)
+            # rng.random() ** skew piles orders onto the first buyers
+            user_id = buyer_ids[int(len(buyer_ids) * rng.random() ** self.skew)]
+            total = 0.0
+            for _ in range(rng.randint(1, 4)):
+                qty, price = rng.randint(1, 5), round(rng.uniform(1, 100), 2)
+                total += qty * price
+                items.append((order_id, f"SKU-{rng.randint(1, SKUS)}", qty, price))
+            created = _timestamp(self._when(rng))
+            orders.append((order_id, user_id, rng.choices(statuses, weights)[0], round(total, 2), created, created))
+            if len(orders) >= self.batch_size:
+                yield orders, items
+                orders, items = [], []
+        if orders:
+            yield orders, items
+
+    def _batches(self, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def grow_users(self, target: int) -> int:
+        conn = _connect(self.users_db)
+        try:
+            existing = _count(conn, "users")
+            if target <= existing:
+                return 0
+            # rebuilding beats maintaining the indexes once the load is at least as big as the table
+            rebuild = target - existing >= existing
+            with (_IndexesDropped(conn, ("users",)) if rebuild else nullcontext()):
+                for batch in self._batches(self._users(existing, target)):
+                    conn.execute("BEGIN")
+                    conn.executemany(
+                        "INSERT INTO users (id, email, hashed_password, name, roles, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        batch,
+                    )
+                    conn.execute("COMMIT")
+            return target - existing
+        finally:
+            conn.close()
+
+    def buyer_ids(self) -> list:
+        conn = sqlite3.connect(self.users_db)
+        try:
+            # the admin (first user) owns no orders
+            rows = conn.execute("SELECT id FROM users ORDER BY rowid LIMIT ? OFFSET 1", (self.buyers,)).fetchall()
+        finally:
+            conn.close()
+        if not rows:
+            raise ValueError("Seed users before orders")
+        return [r[0] for r in rows]
+
+    def grow_orders(self, target: int) -> int:
+        buyer_ids = self.buyer_ids()
+        conn = _connect(self.orders_db)
+        try:
+            existing = _count(conn, "order")
+            if target <= existing:
+                return 0
+            rebuild = target - existing >= existing
+            with (_IndexesDropped(conn, ("order", "order_item")) if rebuild else nullcontext()):
+                for orders, items in self._orders(existing, target, buyer_ids):
+                    conn.execute("BEGIN")
+                    conn.executemany(
+                        'INSERT INTO "order" (id, user_id, status, total, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                        orders,
+                    )
+                    conn.executemany("INSERT INTO order_item (order_id, sku, qty, price) VALUES (?, ?, ?, ?)", items)
+                    conn.execute("COMMIT")
+            return target - existing
+        finally:
+            conn.close()
+
+    def grow(self, users: int, orders: int) -> dict:
+        """Append rows until there are `users` users and `orders` orders."""
+        started = time.perf_counter()
+        added_users = self.grow_users(users)
+        users_s = time.perf_counter() - started
+        added_orders = self.grow_orders(orders)
+        orders_s = time.perf_counter() - started - users_s
+        return {
+            "users_added": added_users,
+            "orders_added": added_orders,
+            "users_seconds": round(users_s, 2),
+            "orders_seconds": round(orders_s, 2),
+        }
+
+    def analyze(self):
+        for path in (self.users_db, self.orders_db):
+            conn = sqlite3.connect(path)
+            try:
+                conn.execute("ANALYZE")
+                conn.commit()
+            finally:
+                conn.close()
+
+
+def table_counts(users_db: str, orders_db: str) -> dict:
+    counts = {}
+    for path, tables in ((users_db, ("users",)), (orders_db, ("order", "order_item"))):
+        conn = sqlite3.connect(path)
+        try:
+            for table in tables:
+                counts[table] = _count(conn, table)
+        finally:
+            conn.close()
+    return counts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench.seed", description="Bulk-load users and orders into the SQLite databases.")
+    parser.add_argument("--users", type=int, default=100000, help="total users after seeding")
+    parser.add_argument("--orders", type=int, default=1000000, help="total orders after seeding")
+    parser.add_argument("--buyers", type=int, default=2000, help="users that own orders")
+    parser.add_argument("--skew", type=float, default=2.0, help="1 = orders spread evenly over buyers; higher piles them on a few")
+    parser.add_argument("--days", type=int, default=365, help="created_at spread over this many past days")
+    parser.add_argument("--users-db", default=os.getenv("USERS_DB_FILE", os.path.join(BACKEND_DIR, "data", "users.db")))
+    parser.add_argument("--orders-db", default=os.getenv("ORDERS_DB_FILE", os.path.join(BACKEND_DIR, "data", "orders.db")))
+    parser.add_argument("--password", default="seed-password", help="password of every seeded user")
+    parser.add_argument("--batch-size", type=int, default=50000, help="rows per transaction")
+    parser.add_argument("--seed", type=int, default=42, help="random seed")
+    parser.add_argument("--analyze", action="store_true", help="run ANALYZE afterwards (query planner statistics)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    users_db, orders_db = os.path.abspath(args.users_db), os.path.abspath(args.orders_db)
+    env = {**os.environ, "USERS_DB_FILE": users_db, "ORDERS_DB_FILE": orders_db}
+    # the services must not use DATABASE_URL here: the seeder only writes these files
+    env.pop("USERS_DATABASE_URL", None)
+    env.pop("ORDERS_DATABASE_URL", None)
+    migrate_databases(env)
+    seeder = Seeder(users_db, orders_db, args.buyers, args.skew, args.days, args.batch_size, args.password, args.seed)
+    stats = seeder.grow(args.users, args.orders)
+    if args.analyze:
+        seeder.analyze()
+    stats["counts"] = table_counts(users_db, orders_db)
+    print(json.dumps(stats, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
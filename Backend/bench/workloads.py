@@ -0,0 +1,105 @@
+"""Scripted workloads. Each virtual user runs `setup` once (not measured)
+and then `step` in a loop until the run ends; every request goes through
+Session.call, which records it under a route label such as
+"GET /orders/orders/{id}".
+"""
+import random
+import uuid
+
+ORDER_STATUSES = ("created", "in_work", "completed")
+
+
+def _email(prefix: str) -> str:
+    return f"{prefix}-{uuid.uuid4().hex[:12]}@bench.local"
+
+
+def _order_payload() -> dict:
+    items = [{"sku": f"SKU-{random.randint(1, 500)}", "qty": random.randint(1, 5), "price": round(random.uniform(1, 100), 2)} for _ in range(random.randint(1, 4))]
+    return {"items": items, "total": round(sum(i["qty"] * i["price"] for i in items), 2)}
+
+
+async def _sign_up(session, measured: bool = False) -> dict:
+    email = _email("vu")
+    body = {"email": email, "password": "bench-password", "name": "Bench"}
+    await session.call("POST /users/auth/register", "POST", "/users/auth/register", json=body, measured=measured)
+    r = await session.call("POST /users/auth/login", "POST", "/users/auth/login", json=body, measured=measured)
+    return {"Authorization": f"Bearer {r.json()['data']['access_token']}"}
+
+
+async def _create_order(session, headers: dict, measured: bool = True) -> str | None:
+    r = await session.call("POST /orders/orders", "POST", "/orders/orders", json=_order_payload(), headers=headers, measured=measured)
+    return r.json()["data"]["id"] if r.status_code == 200 else None
+
+
+class Workload:
+    name = ""
+    description = ""
+
+    async def setup(self, session) -> dict:
+        return {}
+
+    async def step(self, session, state: dict):
+        raise NotImplementedError
+
+
+class AuthStorm(Workload):
+    name = "auth"
+    description = "register a new user and log in (password hashing bound)"
+
+    async def step(self, session, state):
+        await _sign_up(session, measured=True)
+
+
+class CreateBurst(Workload):
+    name = "create"
+    description = "logged-in users creating orders back to back"
+
+    async def setup(self, session):
+        return {"headers": await _sign_up(session)}
+
+    async def step(self, session, state):
+        await _create_order(session, state["headers"])
+
+
+class Polling(Workload):
+    name = "polling"
+    description = "clients refreshing their order list, an order and their profile"
+
+    async def setup(self, session):
+        headers = await _sign_up(session)
+        ids = [await _create_order(session, headers, measured=False) for _ in range(5)]
+        return {"headers": headers, "ids": [i for i in ids if i]}
+
+    async def step(self, session, state):
+        headers = state["headers"]
+        await session.call("GET /orders/orders", "GET", "/orders/orders", params={"limit": 20}, headers=headers)
+        await session.call("GET /orders/orders/{id}", "GET", f"/orders/orders/{random.choice(state['ids'])}", headers=headers)
+        await session.call("GET /users/users/me", "GET", "/users/users/me", headers=headers)
+
+
+class Mixed(Workload):
+    name = "mixed"
+    description = "70% polling reads, 20% creates, 7% status updates, 3% logins"
+
+    async def setup(self, session):
+        return await Polling().setup(session)
+
+    async def step(self, session, state):
+        headers = state["headers"]
+        roll = random.random()
+        if roll < 0.70:
+            await Polling().step(session, state)
+        elif roll < 0.90:
+            order_id = await _create_order(session, headers)
+            if order_id:
+                state["ids"].append(order_id)
+        elif roll < 0.97:
+            await session.call(
+                "PATCH /orders/orders/{id}/status", "PATCH", f"/orders/orders/{random.choice(state['ids'])}/status",
+                json={"status": random.choice(ORDER_STATUSES)}, headers=headers,
+            )
+        else:
+            await _sign_up(session, measured=True)
+
+
+WORKLOADS = {w.name: w for w in (AuthStorm, CreateBurst, Polling, Mixed)}
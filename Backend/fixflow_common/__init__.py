@@ -0,0 +1,4 @@
+"""Code shared by the gateway and both services: settings helpers, JWT
+verification, JSON logging, tracing setup and the request-context middleware.
+Each process imports it as a top-level package next to its own `app`.
+"""
@@ -0,0 +1,91 @@
+from fastapi import HTTPException
+import jwt
+import json
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Optional
+
+# Header carrying the verified JWT claims from the gateway to the services
+IDENTITY_HEADER = "X-Authenticated-User"
+
+
+class TokenCache:
+    """Bounded LRU of verified token payloads, keyed by token hash.
+    An entry never outlives the token's own `exp`.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token: str):
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        payload, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return payload
+
+    def put(self, token: str, payload: dict):
+        if self.max_size <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        if "exp" in payload:
+            expires_at = min(expires_at, float(payload["exp"]))
+        key = self._key(token)
+        self._entries[key] = (payload, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+def verify_token(token: str, secret: str, cache: TokenCache) -> dict:
+    payload = cache.get(token)
+    if payload is not None:
+        return payload
+    try:
+        payload = jwt.decode(token, secret, algorithms=["HS256"])
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    cache.put(token, payload)
+    return payload
+
+
+def bearer_token(authorization: Optional[str]) -> str:
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Missing Authorization header")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Invalid auth scheme")
+    return token
+
+
+def identity_header(payload: dict) -> str:
+    # ensure_ascii keeps the value a valid latin-1 header
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=True)
+
+
+def trusted_identity(identity: Optional[str], enabled: bool) -> Optional[dict]:
+    # claims already verified by the gateway; only honoured when explicitly enabled
+    if not identity or not enabled:
+        return None
+    try:
+        data = json.loads(identity)
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if not isinstance(data, dict) or "sub" not in data or float(data.get("exp", 0)) <= time.time():
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return data
@@ -0,0 +1,90 @@
+import os
+
+
+def env_bool(name: str, default: bool = False) -> bool:
+    raw = os.getenv(name)
+    if raw is None or not raw.strip():
+        return default
+    return raw.strip().lower() in ("1", "true", "yes")
+
+
+def read_secret(name: str, default: str) -> str:
+    # <NAME>_FILE wins over <NAME> (useful for Docker secrets)
+    path = os.getenv(f"{name}_FILE")
+    if path and path.strip() and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    return os.getenv(name, default)
+
+
+class CommonSettings:
+    """Settings read by every process. Each service subclasses this, adding
+    its own settings and overriding any default that differs for it."""
+
+    JWT_SECRET: str = read_secret("JWT_SECRET", "CHANGE_ME_SECRET")
+    # Verified-token cache (entries never outlive the token's exp)
+    TOKEN_CACHE_SIZE: int = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+    TOKEN_CACHE_TTL: float = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+    # Logging: 'async' hands records to a background writer thread through a
+    # bounded queue (overflow is dropped and counted), 'sync' writes inline
+    LOG_MODE: str = os.getenv("LOG_MODE", "async")
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    # lines per write() in async mode
+    LOG_BATCH_SIZE: int = int(os.getenv("LOG_BATCH_SIZE", "256"))
+    # share of "request" access lines kept; errors (5xx) and slow requests always are
+    LOG_ACCESS_SAMPLE_RATE: float = float(os.getenv("LOG_ACCESS_SAMPLE_RATE", "1.0"))
+    LOG_SLOW_REQUEST_MS: float = float(os.getenv("LOG_SLOW_REQUEST_MS", "500"))
+    # /metrics across uvicorn workers: a directory shared by the workers of a
+    # service (emptied before they start); unset for a single process
+    METRICS_MULTIPROC_DIR: str | None = os.getenv("METRICS_MULTIPROC_DIR")
+    METRICS_FLUSH_INTERVAL: float = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+    # Optional observability
+    OTEL_COLLECTOR_URL: str | None = os.getenv("OTEL_COLLECTOR_URL")
+    # Tracing: exporter 'otlp', 'console' or 'none' (tracing off); by default
+    # 'otlp' when OTEL_COLLECTOR_URL is set and 'none' otherwise
+    TRACE_EXPORTER: str | None = os.getenv("TRACE_EXPORTER") or None
+    # share of new traces kept; with TRACE_PARENT_BASED an incoming traceparent decides instead
+    TRACE_SAMPLE_RATIO: float = float(os.getenv("TRACE_SAMPLE_RATIO", "1.0"))
+    TRACE_PARENT_BASED: bool = env_bool("TRACE_PARENT_BASED", True)
+    # keep traces dropped by the ratio anyway when their root span took at least
+    # this long or failed; 0 disables (recording them costs CPU)
+    TRACE_SLOW_MS: float = float(os.getenv("TRACE_SLOW_MS", "0"))
+    TRACE_TAIL_MAX_TRACES: int = int(os.getenv("TRACE_TAIL_MAX_TRACES", "1000"))
+    # spans waiting for export; beyond that they are dropped
+    TRACE_MAX_QUEUE_SIZE: int = int(os.getenv("TRACE_MAX_QUEUE_SIZE", "2048"))
+    TRACE_MAX_EXPORT_BATCH_SIZE: int = int(os.getenv("TRACE_MAX_EXPORT_BATCH_SIZE", "512"))
+    # spans per SQL statement / outgoing httpx request
+    TRACE_SQLALCHEMY: bool = env_bool("TRACE_SQLALCHEMY", False)
+    TRACE_HTTPX: bool = env_bool("TRACE_HTTPX", False)
+    # Password hashing algorithm: 'bcrypt' or 'pbkdf2_sha256' (only the users service hashes)
+    HASH_ALGORITHM: str = os.getenv("HASH_ALGORITHM", "pbkdf2_sha256")
+
+
+class ServiceSettings(CommonSettings):
+    """Settings shared by the orders and users services (not the gateway).
+    Each service subclasses this with its DB_FILE, DATABASE_URL and
+    EVENTS_FILE, read from ORDERS_/USERS_-prefixed variables."""
+
+    # Accept the gateway's X-Authenticated-User header instead of re-verifying the JWT.
+    # Enable only when the service is reachable exclusively through the gateway.
+    TRUST_IDENTITY_HEADER: bool = env_bool("TRUST_IDENTITY_HEADER", False)
+    # SQLite profile: 'default' or 'tuned' (WAL, pragmas, reader pool, single writer)
+    SQLITE_MODE: str = os.getenv("SQLITE_MODE", "default")
+    SQLITE_READERS: int = int(os.getenv("SQLITE_READERS", "4"))
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_MMAP_SIZE: int = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    SQLITE_CACHE_SIZE_KB: int = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+    # how long a write may wait for the writer connection, seconds
+    SQLITE_WRITE_TIMEOUT: float = float(os.getenv("SQLITE_WRITE_TIMEOUT", "30"))
+    # TTL of cached counts returned by list endpoints with include_total=true, seconds
+    COUNT_CACHE_TTL: float = float(os.getenv("COUNT_CACHE_TTL", "10"))
+    # Domain events: transport 'log', 'file' (JSON lines in EVENTS_FILE) or
+    # 'package.module:Class' for a broker adapter (see fixflow_common.events.EventTransport)
+    EVENTS_TRANSPORT: str = os.getenv("EVENTS_TRANSPORT", "log")
+    EVENTS_BATCH_SIZE: int = int(os.getenv("EVENTS_BATCH_SIZE", "100"))
+    # committed events waiting for the relay; overflow is left to the sweep
+    EVENTS_QUEUE_SIZE: int = int(os.getenv("EVENTS_QUEUE_SIZE", "10000"))
+    # outbox rows older than EVENTS_SWEEP_AGE seconds are republished every EVENTS_SWEEP_INTERVAL
+    EVENTS_SWEEP_INTERVAL: float = float(os.getenv("EVENTS_SWEEP_INTERVAL", "5"))
+    EVENTS_SWEEP_AGE: float = float(os.getenv("EVENTS_SWEEP_AGE", "30"))
+
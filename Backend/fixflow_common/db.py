@@ -0,0 +1,137 @@
+"""Async engines, sessions and migrations of a service database.
+
+Each service builds one Database from its settings (DB_FILE, DATABASE_URL and
+the SQLITE_* profile) and its Alembic migrations directory, and exposes the
+pieces its handlers use from its own `app.db` module.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from sqlalchemy import MetaData, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from . import metrics
+from .tracing import instrument_db
+
+
+def async_database_url(settings) -> str:
+    # DATABASE_URL (e.g. postgresql://...) wins over the local sqlite file
+    url = settings.DATABASE_URL
+    if not url:
+        Path(settings.DB_FILE).parent.mkdir(parents=True, exist_ok=True)
+        return f"sqlite+aiosqlite:///{settings.DB_FILE}"
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    if url.startswith("postgresql://"):
+        return "postgresql+asyncpg://" + url[len("postgresql://"):]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+
+def _tuned_pragmas(settings, read_only: bool):
+    def on_connect(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        # WAL lets readers run alongside the writer; NORMAL only fsyncs at checkpoints
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}")
+        # negative cache_size is in KiB
+        cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+    return on_connect
+
+
+def _current_revision(connection):
+    from alembic.runtime.migration import MigrationContext
+    return MigrationContext.configure(connection).get_current_revision()
+
+
+def _drop_everything(connection):
+    metadata = MetaData()
+    metadata.reflect(connection)
+    metadata.drop_all(connection)
+
+
+class Database:
+    def __init__(self, settings, migrations_dir: Path):
+        self.DB_FILE = settings.DB_FILE
+        self.url = async_database_url(settings)
+        self.migrations_dir = Path(migrations_dir)
+
+        if settings.SQLITE_MODE == "tuned" and self.url.startswith("sqlite"):
+            # a single writer connection: sessions queue for it in the pool instead of
+            # failing with "database is locked"; reads use their own pool
+            self.engine = create_async_engine(self.url, pool_size=1, max_overflow=0, pool_timeout=settings.SQLITE_WRITE_TIMEOUT)
+            self.read_engine = create_async_engine(self.url, pool_size=settings.SQLITE_READERS, max_overflow=0)
+            event.listen(self.engine.sync_engine, "connect", _tuned_pragmas(settings, read_only=False))
+            event.listen(self.read_engine.sync_engine, "connect", _tuned_pragmas(settings, read_only=True))
+        else:
+            self.engine = self.read_engine = create_async_engine(self.url)
+
+        # per-span DB timing (free while tracing is disabled) and SQL metrics
+        instrument_db(self.engine)
+        metrics.instrument_db(self.engine, "main")
+        if self.read_engine is not self.engine:
+            instrument_db(self.read_engine)
+            metrics.instrument_db(self.read_engine, "read")
+
+        self.async_session = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+        self.async_read_session = async_sessionmaker(self.read_engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def dispose_engines(self):
+        await self.engine.dispose()
+        if self.read_engine is not self.engine:
+            await self.read_engine.dispose()
+
+    def alembic_config(self):
+        from alembic.config import Config
+        cfg = Config()
+        cfg.set_main_option("script_location", str(self.migrations_dir))
+        cfg.set_main_option("sqlalchemy.url", self.url)
+        return cfg
+
+    def head_revision(self):
+        from alembic.script import ScriptDirectory
+        return ScriptDirectory.from_config(self.alembic_config()).get_current_head()
+
+    def _upgrade(self, connection, revision="head"):
+        from alembic import command
+        cfg = self.alembic_config()
+        cfg.attributes["connection"] = connection
+        command.upgrade(cfg, revision)
+
+    async def migrate_db(self):
+        """Apply pending migrations. A warm restart only reads the schema version."""
+        async with self.engine.connect() as conn:
+            current = await conn.run_sync(_current_revision)
+        if current == self.head_revision():
+            return
+        async with self.engine.begin() as conn:
+            await conn.run_sync(self._upgrade)
+
+    async def _reset_db(self):
+        async with self.engine.begin() as conn:
+            await conn.run_sync(_drop_everything)
+        await self.migrate_db()
+        # connections are bound to the loop that opened them
+        await self.dispose_engines()
+
+    def reset_db(self):
+        """Test-only: drop all tables and re-apply migrations from scratch."""
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(asyncio.run, self._reset_db()).result()
+
+    async def get_session(self):
+        # read-write session; in tuned sqlite mode this holds the single writer
+        # connection until the request ends, so keep slow work out of it
+        async with self.async_session() as session:
+            yield session
+
+    async def get_read_session(self):
+        async with self.async_read_session() as session:
+            yield session
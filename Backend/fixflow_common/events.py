@@ -0,0 +1,219 @@
+"""Domain events with at-least-once delivery through a transactional outbox.
+
+Handlers stage events into the outbox table in the same transaction as the
+change itself. Once that transaction commits, the staged events are put on an
+in-process asyncio queue; a relay task publishes them in batches through the
+configured transport and deletes the delivered rows. Rows left behind by a
+crash or a full queue are picked up by a periodic sweep, so events may be
+delivered more than once (consumers dedupe by event id) but are never lost.
+Publishing never runs inside the request.
+
+The bus is generic: each service builds one with its outbox model, settings
+(EVENTS_*) and session factories, and adds its own publish_* helpers.
+"""
+import asyncio
+import importlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from sqlmodel import Session, delete, select
+from .metrics import register_callback
+
+logger = logging.getLogger("events")
+
+
+class EventTransport:
+    """Broker adapter interface. `publish` must raise unless the whole batch
+    was accepted; the batch is retried otherwise."""
+
+    async def publish(self, events: list) -> None:
+        raise NotImplementedError
+
+    async def aclose(self) -> None:
+        pass
+
+
+class LogTransport(EventTransport):
+    # the default: one structured log line per event
+    async def publish(self, events: list) -> None:
+        for e in events:
+            logger.info(f"event.{e['type']}", extra={"event_id": e["id"], **e["payload"]})
+
+
+class FileTransport(EventTransport):
+    """Appends events as JSON lines and fsyncs before acknowledging.
+    For tests and single-node deployments."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _write(self, lines: str):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def publish(self, events: list) -> None:
+        await asyncio.to_thread(self._write, "".join(json.dumps(e) + "\n" for e in events))
+
+
+def build_transport(settings, kind: str | None = None) -> EventTransport:
+    # 'log', 'file' or 'package.module:Class' for a broker adapter
+    kind = kind or settings.EVENTS_TRANSPORT
+    if kind == "log":
+        return LogTransport()
+    if kind == "file":
+        return FileTransport(settings.EVENTS_FILE)
+    module, _, name = kind.partition(":")
+    if not name:
+        raise ValueError(f"Unknown EVENTS_TRANSPORT: {kind}")
+    return getattr(importlib.import_module(module), name)()
+
+
+class EventBus:
+    """`outbox` is the service's outbox table model (id, type, payload,
+    created_at); `session` and `read_session` are its async session factories."""
+
+    def __init__(self, name: str, outbox, settings, session, read_session, transport: EventTransport | None = None):
+        self.name = name
+        self.outbox = outbox
+        self.settings = settings
+        self._session = session
+        self._read_session = read_session
+        self.transport = transport or build_transport(settings)
+        self.batch_size = settings.EVENTS_BATCH_SIZE
+        self.queue_size = settings.EVENTS_QUEUE_SIZE
+        # staged events travel in session.info under a key of their own
+        self._key = f"outbox:{name}"
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list = []
+        self.published = 0
+        self.dropped = 0
+        self.failures = 0
+        event.listen(Session, "after_commit", self._on_commit)
+        event.listen(Session, "after_rollback", self._on_rollback)
+        register_callback("events_queue_depth", "Committed events waiting for the relay.", self._depth, ("bus",))
+        register_callback("events_published_total", "Events accepted by the transport.", lambda: {(self.name,): self.published}, ("bus",), "counter")
+        register_callback("events_dropped_total", "Events left to the outbox sweep because the queue was full.", lambda: {(self.name,): self.dropped}, ("bus",), "counter")
+
+    def stage(self, session, event_type: str, payload: dict):
+        """Add an event to the outbox of `session`; it is published after the session commits."""
+        row = self.outbox(type=event_type, payload=json.dumps(payload))
+        session.add(row)
+        session.info.setdefault(self._key, []).append(self._envelope(row, payload))
+
+    @staticmethod
+    def _envelope(row, payload: dict) -> dict:
+        return {"id": row.id, "type": row.type, "created_at": row.created_at.isoformat(), "payload": payload}
+
+    def _depth(self) -> dict:
+        return {(self.name,): self._queue.qsize() if self._queue is not None else 0}
+
+    def _on_commit(self, session):
+        envelopes = session.info.pop(self._key, None)
+        if not envelopes or self._queue is None:
+            # not running: the rows stay in the outbox for the sweep
+            return
+        for envelope in envelopes:
+            try:
+                self._queue.put_nowait(envelope)
+            except asyncio.QueueFull:
+                self.dropped += 1
+
+    def _on_rollback(self, session):
+        session.info.pop(self._key, None)
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._relay()), asyncio.create_task(self._sweep_loop())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        queue, self._queue = self._queue, None
+        pending = []
+        while queue is not None and not queue.empty():
+            pending.append(queue.get_nowait())
+        try:
+            if pending:
+                await self.transport.publish(pending)
+                await self._ack([e["id"] for e in pending])
+        except Exception:
+            # still in the outbox; the next start sweeps them
+            logger.exception("events.flush_failed")
+        await self.transport.aclose()
+
+    async def _relay(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._deliver(batch)
+
+    async def _deliver(self, batch: list) -> bool:
+        delay = 0.1
+        while True:
+            try:
+                await self.transport.publish(batch)
+                break
+            except Exception:
+                self.failures += 1
+                logger.exception("events.publish_failed")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+        self.published += len(batch)
+        try:
+            await self._ack([e["id"] for e in batch])
+        except Exception:
+            # delivered but not acknowledged: the sweep delivers it again
+            logger.exception("events.ack_failed")
+            return False
+        return True
+
+    async def _ack(self, ids: list):
+        async with self._session() as session:
+            await session.exec(delete(self.outbox).where(self.outbox.id.in_(ids)))
+            await session.commit()
+
+    async def sweep(self, min_age: float | None = None) -> int:
+        """Publish outbox rows older than `min_age` seconds: leftovers of a
+        crash, a failed ack or a full queue. Returns the number published."""
+        min_age = self.settings.EVENTS_SWEEP_AGE if min_age is None else min_age
+        swept = 0
+        while True:
+            cutoff = datetime.utcnow() - timedelta(seconds=min_age)
+            async with self._read_session() as session:
+                outbox = self.outbox
+                q = select(outbox).where(outbox.created_at <= cutoff).order_by(outbox.created_at).limit(self.batch_size)
+                rows = (await session.exec(q)).all()
+            if not rows:
+                return swept
+            acked = await self._deliver([self._envelope(row, json.loads(row.payload)) for row in rows])
+            swept += len(rows)
+            # unacknowledged rows would be read again; leave them to the next sweep
+            if not acked or len(rows) < self.batch_size:
+                return swept
+
+    async def _sweep_loop(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("events.sweep_failed")
+            await asyncio.sleep(self.settings.EVENTS_SWEEP_INTERVAL)
+
+    def stats(self) -> dict:
+        return {
+            "transport": type(self.transport).__name__,
+            "running": bool(self._tasks),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "published": self.published,
+            "dropped": self.dropped,
+            "failures": self.failures,
+        }
+
@@ -0,0 +1,201 @@
+"""JSON logging for all services.
+
+In 'async' mode (LOG_MODE, the default) the calling thread only stamps the
+request id, renders the message and puts the record on a bounded queue; a
+QueueListener thread formats the JSON and writes it in batches. When the
+queue is full the record is dropped and counted, so logging never blocks the
+event loop. The per-request "request" line can be sampled
+(LOG_ACCESS_SAMPLE_RATE); errors and slow requests are always kept.
+"""
+import atexit
+import logging
+import logging.handlers
+import json
+import contextvars
+import queue
+import random
+import sys
+import time
+from .config import CommonSettings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+request_id_ctx = contextvars.ContextVar("request_id", default=None)
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_ctx.get()
+        return True
+
+
+class AccessLogSampler(logging.Filter):
+    """Keeps `rate` of the "request" access lines, plus every 5xx and every
+    request slower than `slow_ms`. Other records always pass."""
+
+    def __init__(self, rate: float = 1.0, slow_ms: float = 500.0):
+        super().__init__()
+        self.rate = rate
+        self.slow_ms = slow_ms
+        self.sampled_out = 0
+
+    def filter(self, record):
+        if self.rate >= 1.0 or record.msg != "request":
+            return True
+        if getattr(record, "status", 0) >= 500 or getattr(record, "duration_ms", 0) >= self.slow_ms:
+            return True
+        if random.random() < self.rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+# LogRecord's own attributes; everything else on a record came from `extra`
+_RECORD_ATTRS = frozenset(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "request_id"}
+
+if orjson is not None:
+    def _dumps(payload) -> str:
+        return orjson.dumps(payload, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+else:
+    def _dumps(payload) -> str:
+        return json.dumps(payload, default=str)
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            "ts": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        if record.exc_info or record.exc_text:
+            # exc_text is already rendered when the record came through BoundedQueueHandler
+            payload["exc_info"] = record.exc_text or self.formatException(record.exc_info)
+        # extra attributes; values JSON does not know are written as str()
+        for k, v in record.__dict__.items():
+            if k not in _RECORD_ATTRS:
+                payload[k] = v
+        return _dumps(payload)
+
+
+_exception_formatter = logging.Formatter()
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks: a record that does not fit in the queue is dropped."""
+
+    def __init__(self, maxsize: int):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+
+    def prepare(self, record):
+        # the default prepare() copies and formats the whole record here; leave
+        # the JSON to the listener and only resolve what may change after the
+        # call returns: the message arguments and the traceback
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchStreamHandler(logging.StreamHandler):
+    """Listener-side handler: buffers formatted lines and writes them with one
+    write() and flush() per `batch_size` lines, or as soon as the queue runs dry."""
+
+    def __init__(self, source: queue.Queue, stream=None, batch_size: int = 256):
+        super().__init__(stream)
+        self.source = source
+        self.batch_size = batch_size
+        self._lines = []
+
+    def emit(self, record):
+        try:
+            self._lines.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self._lines) >= self.batch_size or self.source.empty():
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if self._lines:
+                lines, self._lines = self._lines, []
+                self.stream.write("\n".join(lines) + "\n")
+            if self.stream and hasattr(self.stream, "flush"):
+                self.stream.flush()
+
+
+_handler = None
+_listener = None
+_sampler = None
+
+
+def setup_logging(level=logging.INFO, mode: str | None = None):
+    global _handler, _listener, _sampler
+    stop_logging()
+    mode = mode or CommonSettings.LOG_MODE
+    if mode == "async":
+        handler = BoundedQueueHandler(CommonSettings.LOG_QUEUE_SIZE)
+        writer = BatchStreamHandler(handler.queue, sys.stderr, CommonSettings.LOG_BATCH_SIZE)
+        writer.setFormatter(JSONFormatter())
+        _listener = logging.handlers.QueueListener(handler.queue, writer)
+        _listener.start()
+    elif mode == "sync":
+        handler = logging.StreamHandler()
+        handler.setFormatter(JSONFormatter())
+    else:
+        raise ValueError(f"Unknown LOG_MODE: {mode}")
+    # filters run on the calling thread, where the request id contextvar is set
+    handler.addFilter(RequestIdFilter())
+    _sampler = AccessLogSampler(CommonSettings.LOG_ACCESS_SAMPLE_RATE, CommonSettings.LOG_SLOW_REQUEST_MS)
+    handler.addFilter(_sampler)
+    _handler = handler
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.handlers = [handler]
+
+
+def stop_logging():
+    """Write out whatever is still queued and stop the writer thread."""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        while True:
+            try:
+                listener.stop()
+                break
+            except queue.Full:
+                # no room for the stop sentinel yet; the writer is draining
+                time.sleep(0.01)
+        for handler in listener.handlers:
+            try:
+                handler.flush()
+            except (OSError, ValueError):
+                # stream already closed at interpreter exit, as logging.shutdown() tolerates
+                pass
+
+
+atexit.register(stop_logging)
+
+
+def log_stats() -> dict:
+    queued = isinstance(_handler, BoundedQueueHandler)
+    return {
+        "mode": "async" if queued else "sync",
+        "queued": _handler.queue.qsize() if queued else 0,
+        "dropped": _handler.dropped if queued else 0,
+        "sampled_out": _sampler.sampled_out if _sampler is not None else 0,
+    }
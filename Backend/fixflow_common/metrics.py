@@ -0,0 +1,335 @@
+"""Prometheus metrics without a client library, served at /metrics.
+
+Counters, gauges and histograms keep one shard of cells per thread: a thread
+only ever writes its own shard, so updates take no lock, and a scrape sums
+the shards. Values read at scrape time (queue depths, pool usage) are
+registered as callbacks.
+
+With uvicorn --workers N each worker is a separate process. When
+METRICS_MULTIPROC_DIR is set, every worker writes a snapshot of its metrics
+to that directory every METRICS_FLUSH_INTERVAL seconds (and on each scrape);
+/metrics, whichever worker serves it, reports the sum over all snapshots of
+the service. Counters and histograms of exited workers are kept, their
+gauges are not.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from threading import get_ident
+from .config import CommonSettings
+from .logging import log_stats
+
+logger = logging.getLogger("fixflow.metrics")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# every metric created in this process, in registration order
+_registry: dict = {}
+
+
+def _register(metric):
+    if metric.name in _registry:
+        raise ValueError(f"Duplicate metric: {metric.name}")
+    _registry[metric.name] = metric
+    return metric
+
+
+class _Sharded:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        # thread id -> {label values: cell}
+        self._shards: dict = {}
+        _register(self)
+
+    def _cell(self, labels: tuple):
+        shard = self._shards.get(get_ident())
+        if shard is None:
+            shard = self._shards.setdefault(get_ident(), {})
+        cell = shard.get(labels)
+        if cell is None:
+            cell = shard[labels] = self._new_cell()
+        return cell
+
+    def collect(self) -> dict:
+        """{label values: merged cell} over all shards."""
+        merged = {}
+        for shard in list(self._shards.values()):
+            for labels, cell in list(shard.items()):
+                total = merged.get(labels)
+                merged[labels] = list(cell) if total is None else [a + b for a, b in zip(total, cell)]
+        return merged
+
+
+class Counter(_Sharded):
+    kind = "counter"
+
+    @staticmethod
+    def _new_cell():
+        return [0.0]
+
+    def inc(self, *labels, amount: float = 1.0):
+        self._cell(labels)[0] += amount
+
+
+class Gauge(Counter):
+    # in-process gauges only move by inc/dec; absolute readings are callbacks
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1.0):
+        self._cell(labels)[0] -= amount
+
+
+class Histogram(_Sharded):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labels)
+
+    def _new_cell(self):
+        # one count per bucket (not cumulative), +Inf, then the sum
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def observe(self, value: float, *labels):
+        cell = self._cell(labels)
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+
+class Callback:
+    """A metric read when scraped: each fn returns {label values tuple: value}.
+    Registering the same name again adds another source, e.g. one per event bus."""
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), kind: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.kind = kind
+        self.sources = []
+        _register(self)
+
+    def collect(self) -> dict:
+        out = {}
+        for fn in self.sources:
+            try:
+                values = fn()
+            except Exception:
+                logger.exception("metrics.callback_failed", extra={"metric": self.name})
+                continue
+            for labels, value in values.items():
+                if value is not None:
+                    out[tuple(labels)] = [float(value)]
+        return out
+
+
+def register_callback(name: str, documentation: str, fn, labels: tuple = (), kind: str = "gauge") -> Callback:
+    metric = _registry.get(name)
+    if metric is None:
+        metric = Callback(name, documentation, labels, kind)
+    elif not isinstance(metric, Callback) or metric.kind != kind or metric.labels != tuple(labels):
+        raise ValueError(f"Duplicate metric: {name}")
+    metric.sources.append(fn)
+    return metric
+
+
+# metrics every app gets from RequestContextMiddleware and instrument_db
+HTTP_REQUESTS = Counter("http_requests_total", "Requests served, by route template and status.", ("method", "route", "status"))
+HTTP_DURATION = Histogram("http_request_duration_seconds", "Request latency by route template.", ("method", "route"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being served.")
+DB_QUERIES = Histogram("db_query_duration_seconds", "SQL statement latency by engine and statement kind.", ("engine", "statement"), SQL_BUCKETS)
+
+
+def _log_stats(key: str):
+    return lambda: {(): log_stats()[key]}
+
+
+register_callback("log_queue_depth", "Log records waiting for the writer thread.", _log_stats("queued"))
+register_callback("log_records_dropped_total", "Log records dropped because the log queue was full.", _log_stats("dropped"), kind="counter")
+register_callback("log_access_sampled_out_total", "Access log lines skipped by sampling.", _log_stats("sampled_out"), kind="counter")
+
+
+def observe_request(method: str, route: str, status: int, seconds: float):
+    HTTP_REQUESTS.inc(method, route, str(status))
+    HTTP_DURATION.observe(seconds, method, route)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._fixflow_metrics_start = time.perf_counter()
+
+
+def instrument_db(engine, role: str):
+    """Record every statement of `engine` (sync or async) as db_query_duration_seconds{engine=role}."""
+    from sqlalchemy import event
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_fixflow_metrics_start", None)
+        if start is not None:
+            kind = statement.lstrip()[:6].upper()
+            DB_QUERIES.observe(time.perf_counter() - start, role, kind if kind.isalpha() else "OTHER")
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", after_cursor_execute)
+
+
+# --- snapshots and exposition ---
+
+def snapshot() -> dict:
+    metrics = {}
+    for metric in list(_registry.values()):
+        metrics[metric.name] = {
+            "kind": metric.kind,
+            "help": metric.documentation,
+            "labels": list(metric.labels),
+            "buckets": list(getattr(metric, "buckets", ())),
+            "samples": [[list(labels), cell] for labels, cell in metric.collect().items()],
+        }
+    return {"pid": os.getpid(), "metrics": metrics}
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class _Exporter:
+    def __init__(self):
+        self.service = "fixflow"
+        self.directory = None
+        self._task = None
+
+    def path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"{self.service}.{pid}.json")
+
+    def write(self, snap: dict):
+        path = self.path(snap["pid"])
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snap, f)
+        os.replace(tmp, path)
+
+    def gather(self) -> list:
+        own = snapshot()
+        if not self.directory:
+            return [own]
+        self.write(own)
+        snaps = [own]
+        prefix = f"{self.service}."
+        for name in os.listdir(self.directory):
+            if not (name.startswith(prefix) and name.endswith(".json")) or name == os.path.basename(self.path(own["pid"])):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                    snaps.append(json.load(f))
+            except (OSError, ValueError):
+                # being replaced right now, or a leftover; skip it this time
+                continue
+        return snaps
+
+    async def _flush_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.write, snapshot())
+            except Exception:
+                logger.exception("metrics.flush_failed")
+
+    async def start(self):
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._task = asyncio.create_task(self._flush_loop(CommonSettings.METRICS_FLUSH_INTERVAL))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.directory:
+            # the final counts of this worker stay in the aggregate
+            self.write(snapshot())
+
+
+exporter = _Exporter()
+
+
+def _merge(snaps: list) -> dict:
+    merged = {}
+    for snap in snaps:
+        alive = snap["pid"] == os.getpid() or _pid_alive(snap["pid"])
+        for name, metric in snap["metrics"].items():
+            if metric["kind"] == "gauge" and not alive:
+                continue
+            target = merged.setdefault(name, {**metric, "samples": {}})
+            for labels, cell in metric["samples"]:
+                key = tuple(labels)
+                total = target["samples"].get(key)
+                target["samples"][key] = cell if total is None else [a + b for a, b in zip(total, cell)]
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render() -> str:
+    """All metrics of the service in the Prometheus text format."""
+    lines = []
+    for name, metric in _merge(exporter.gather()).items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        names = metric["labels"]
+        for values, cell in sorted(metric["samples"].items()):
+            if metric["kind"] != "histogram":
+                lines.append(f"{name}{_labels(names, values)} {_number(cell[0])}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["buckets"] + ["+Inf"], cell):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{name}_bucket{_labels(names, values, le)} {_number(cumulative)}")
+            lines.append(f"{name}_sum{_labels(names, values)} {_number(cell[-1])}")
+            lines.append(f"{name}_count{_labels(names, values)} {_number(cumulative)}")
+    return "\n".join(lines) + "\n"
+
+
+def setup_metrics(app, service_name: str, path: str = "/metrics"):
+    """Serve `path` on `app` and, with METRICS_MULTIPROC_DIR, share snapshots
+    with the other workers of `service_name`."""
+    from starlette.responses import Response
+
+    exporter.service = service_name
+    exporter.directory = CommonSettings.METRICS_MULTIPROC_DIR or None
+
+    async def metrics_endpoint(request):
+        body = await asyncio.to_thread(render) if exporter.directory else render()
+        return Response(body, media_type=CONTENT_TYPE)
+
+    app.add_route(path, metrics_endpoint, include_in_schema=False)
+    app.add_event_handler("startup", exporter.start)
+    app.add_event_handler("shutdown", exporter.stop)
@@ -0,0 +1,75 @@
+"""Request context as a plain ASGI middleware: one pass per request sets the
+request id (scope state, contextvar, response header, current span) and
+writes the access log line with the request's duration, which also feeds
+the per-route metrics. Unlike BaseHTTPMiddleware it adds no extra task and
+leaves streaming untouched.
+"""
+import logging
+import time
+import uuid
+from .logging import request_id_ctx
+from .metrics import HTTP_IN_FLIGHT, observe_request
+
+try:
+    from opentelemetry import trace as otel_trace
+except Exception:
+    otel_trace = None
+
+REQUEST_ID_HEADER = b"x-request-id"
+
+
+class RequestContextMiddleware:
+    def __init__(self, app, logger_name: str = "request"):
+        self.app = app
+        self.logger = logging.getLogger(logger_name)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for key, value in scope["headers"]:
+            if key == REQUEST_ID_HEADER:
+                request_id = value.decode("latin-1")
+                break
+        if not request_id:
+            request_id = str(uuid.uuid4())
+        # request.state.request_id
+        scope.setdefault("state", {})["request_id"] = request_id
+        if otel_trace is not None:
+            span = otel_trace.get_current_span()
+            if span.is_recording():
+                span.set_attribute("request_id", request_id)
+
+        status_code = 500
+        raw_request_id = request_id.encode("latin-1")
+
+        async def send_with_request_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = message.setdefault("headers", [])
+                if not any(key.lower() == REQUEST_ID_HEADER for key, _ in headers):
+                    headers.append((REQUEST_ID_HEADER, raw_request_id))
+            await send(message)
+
+        token = request_id_ctx.set(request_id)
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_FLIGHT.dec()
+            # the router leaves the matched route in the scope; its template keeps the label set small
+            route = getattr(scope.get("route"), "path", None) or "<unmatched>"
+            observe_request(scope["method"], route, status_code, elapsed)
+            duration_ms = elapsed * 1000
+            self.logger.info("request", extra={
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status_code,
+                "duration_ms": round(duration_ms, 3),
+            })
+            request_id_ctx.reset(token)
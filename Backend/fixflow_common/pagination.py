@@ -0,0 +1,78 @@
+"""Keyset (cursor) pagination helpers.
+A cursor is an opaque, url-safe token holding the sort key and id of the last
+row of the previous page, so the next page is an index seek instead of OFFSET.
+"""
+import base64
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+
+def parse_sort(sort: str, allowed: dict):
+    """'created_at' / '-created_at' -> (name, column, descending); 400 if not allowlisted."""
+    descending = sort.startswith("-")
+    name = sort[1:] if descending else sort
+    if name not in allowed:
+        raise HTTPException(status_code=400, detail=f"Invalid sort; allowed: {', '.join(sorted(allowed))}")
+    return name, allowed[name], descending
+
+
+def encode_cursor(sort: str, value, row_id: str) -> str:
+    if isinstance(value, datetime):
+        value = {"dt": value.isoformat()}
+    raw = json.dumps([sort, value, row_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, value, row_id = json.loads(raw)
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value["dt"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if cursor_sort != sort:
+        raise HTTPException(status_code=400, detail="Cursor does not match sort")
+    return value, row_id
+
+
+def apply_keyset(query, column, id_column, descending: bool, cursor: str | None, sort: str):
+    if cursor:
+        value, row_id = decode_cursor(cursor, sort)
+        key = tuple_(column, id_column)
+        query = query.where(key < (value, row_id) if descending else key > (value, row_id))
+    if descending:
+        return query.order_by(column.desc(), id_column.desc())
+    return query.order_by(column, id_column)
+
+
+class CountCache:
+    """Short-TTL cache for COUNT(*) results used by include_total."""
+
+    def __init__(self, ttl: float, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return entry[0]
+
+    def put(self, key, value: int):
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, predicate=None):
+        if predicate is None:
+            self._entries.clear()
+            return
+        for key in [k for k in self._entries if predicate(k)]:
+            del self._entries[key]
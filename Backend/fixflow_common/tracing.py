@@ -0,0 +1,281 @@
+"""Optional OpenTelemetry setup and the span helper used by the handlers.
+
+Tracing is off unless an exporter is configured: TRACE_EXPORTER defaults to
+'otlp' when OTEL_COLLECTOR_URL is set and to 'none' otherwise. While it is
+off, or the packages are not available, setup_tracing returns None and
+`span` hands back a shared no-op context manager.
+
+Sampling is head-based (TRACE_SAMPLE_RATIO, by default following the
+parent's decision). With TRACE_SLOW_MS set, traces the ratio drops are
+still recorded and exported after all when their local root span took at
+least that long or any span in them failed.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from contextvars import ContextVar
+from functools import wraps
+from .config import CommonSettings
+
+logger = logging.getLogger("fixflow.tracing")
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor, TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    from opentelemetry.sdk.trace.sampling import (
+        ALWAYS_OFF, ALWAYS_ON, Decision, ParentBased, Sampler, SamplingResult, TraceIdRatioBased,
+    )
+    OTEL_AVAILABLE = True
+except Exception:
+    OTEL_AVAILABLE = False
+
+try:
+    from opentelemetry.instrumentation.asgi import OpenTelemetryMiddleware
+except Exception:
+    OpenTelemetryMiddleware = None
+
+
+if OTEL_AVAILABLE:
+    class RecordDropped(Sampler):
+        """Wraps a sampler so spans it drops are still recorded (RECORD_ONLY),
+        for TailLatencyProcessor to decide on once the trace has finished."""
+
+        def __init__(self, sampler):
+            self._sampler = sampler
+
+        def should_sample(self, parent_context, trace_id, name, kind=None, attributes=None, links=None, trace_state=None):
+            result = self._sampler.should_sample(parent_context, trace_id, name, kind, attributes, links, trace_state)
+            if result.decision is Decision.DROP:
+                return SamplingResult(Decision.RECORD_ONLY, result.attributes, result.trace_state)
+            return result
+
+        def get_description(self) -> str:
+            return f"RecordDropped{{{self._sampler.get_description()}}}"
+
+    class TailLatencyProcessor(SpanProcessor):
+        """Sampled spans go straight to `delegate`. Recorded-only spans wait,
+        grouped by trace, for the local root span; the trace is exported when
+        the root took at least `slow_ms` or any span ended with an error.
+        At most `max_traces` traces are held, the oldest is discarded first."""
+
+        def __init__(self, delegate, slow_ms: float, max_traces: int = 1000):
+            self.delegate = delegate
+            self.slow_ns = slow_ms * 1_000_000
+            self.max_traces = max_traces
+            self._pending = OrderedDict()
+            # spans end on whichever thread ran them
+            self._lock = threading.Lock()
+            self.kept = 0
+            self.discarded = 0
+
+        def on_start(self, span, parent_context=None):
+            pass
+
+        def on_end(self, span):
+            context = span.context
+            if context.trace_flags.sampled:
+                self.delegate.on_end(span)
+                return
+            is_root = span.parent is None or span.parent.is_remote
+            with self._lock:
+                if not is_root:
+                    self._pending.setdefault(context.trace_id, []).append(span)
+                    if len(self._pending) > self.max_traces:
+                        self._pending.popitem(last=False)
+                        self.discarded += 1
+                    return
+                spans = self._pending.pop(context.trace_id, [])
+            spans.append(span)
+            if span.end_time - span.start_time < self.slow_ns and not any(not s.status.is_ok for s in spans):
+                self.discarded += 1
+                return
+            self.kept += 1
+            for s in spans:
+                self.delegate.on_end(_as_sampled(s))
+
+        def shutdown(self):
+            self.delegate.shutdown()
+
+        def force_flush(self, timeout_millis: int = 30000) -> bool:
+            return self.delegate.force_flush(timeout_millis)
+
+    def _as_sampled(span):
+        # exporters (and BatchSpanProcessor) only take spans flagged as sampled
+        context = span.context
+        sampled = trace.SpanContext(
+            context.trace_id, context.span_id, context.is_remote,
+            trace.TraceFlags(context.trace_flags | trace.TraceFlags.SAMPLED), context.trace_state,
+        )
+        return ReadableSpan(
+            name=span.name, context=sampled, parent=span.parent, resource=span.resource,
+            attributes=span.attributes, events=span.events, links=span.links, kind=span.kind,
+            status=span.status, start_time=span.start_time, end_time=span.end_time,
+            instrumentation_scope=span.instrumentation_scope,
+        )
+
+
+def _sampler():
+    ratio = CommonSettings.TRACE_SAMPLE_RATIO
+    sampler = ALWAYS_ON if ratio >= 1 else ALWAYS_OFF if ratio <= 0 else TraceIdRatioBased(ratio)
+    if CommonSettings.TRACE_PARENT_BASED:
+        sampler = ParentBased(sampler)
+    if CommonSettings.TRACE_SLOW_MS > 0 and ratio < 1:
+        sampler = RecordDropped(sampler)
+    return sampler
+
+
+def _exporter(kind: str, collector: str | None):
+    if kind == "console":
+        return ConsoleSpanExporter()
+    if kind == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        # an explicit endpoint is used verbatim by the OTLP/HTTP exporter
+        return OTLPSpanExporter(endpoint=collector.rstrip("/") + "/v1/traces" if collector else None)
+    raise ValueError(f"Unknown TRACE_EXPORTER: {kind}")
+
+
+def setup_tracing(app=None, service_name: str = "fixflow", collector: str | None = None):
+    collector = collector or CommonSettings.OTEL_COLLECTOR_URL
+    kind = CommonSettings.TRACE_EXPORTER or ("otlp" if collector else "none")
+    if kind == "none":
+        return None
+    if not OTEL_AVAILABLE:
+        logger.debug("OpenTelemetry not available; tracing disabled")
+        return None
+
+    try:
+        exporter = _exporter(kind, collector)
+    except ImportError:
+        logger.warning("TRACE_EXPORTER=%s requested but its exporter package is not available; tracing disabled", kind)
+        return None
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}), sampler=_sampler())
+    processor = BatchSpanProcessor(
+        exporter,
+        max_queue_size=CommonSettings.TRACE_MAX_QUEUE_SIZE,
+        max_export_batch_size=min(CommonSettings.TRACE_MAX_EXPORT_BATCH_SIZE, CommonSettings.TRACE_MAX_QUEUE_SIZE),
+    )
+    if CommonSettings.TRACE_SLOW_MS > 0 and CommonSettings.TRACE_SAMPLE_RATIO < 1:
+        processor = TailLatencyProcessor(processor, CommonSettings.TRACE_SLOW_MS, CommonSettings.TRACE_TAIL_MAX_TRACES)
+    provider.add_span_processor(processor)
+    trace.set_tracer_provider(provider)
+
+    if app is not None and OpenTelemetryMiddleware is not None:
+        try:
+            app.add_middleware(OpenTelemetryMiddleware)
+        except Exception:
+            logger.exception("Failed to add OpenTelemetry ASGI middleware")
+    if CommonSettings.TRACE_HTTPX:
+        _instrument_httpx()
+
+    global _tracer
+    _tracer = trace.get_tracer(service_name)
+    for engine in _engines:
+        _instrument_sqlalchemy(engine)
+    return _tracer
+
+
+def _instrument_httpx():
+    try:
+        from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+    except ImportError:
+        logger.warning("TRACE_HTTPX requested but opentelemetry-instrumentation-httpx is not available")
+        return
+    HTTPXClientInstrumentor().instrument()
+
+
+# engines passed to instrument_db, and those already given SQLAlchemy spans
+_engines: list = []
+_sqlalchemy_instrumented: set = set()
+
+
+def _instrument_sqlalchemy(engine):
+    if _tracer is None or not CommonSettings.TRACE_SQLALCHEMY or id(engine) in _sqlalchemy_instrumented:
+        return
+    try:
+        from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
+    except ImportError:
+        logger.warning("TRACE_SQLALCHEMY requested but opentelemetry-instrumentation-sqlalchemy is not available")
+        return
+    SQLAlchemyInstrumentor().instrument(engine=engine)
+    _sqlalchemy_instrumented.add(id(engine))
+
+
+# set by setup_tracing; while None every span() is the shared no-op below
+_tracer = None
+_NOOP = nullcontext(None)
+# [seconds, statements] of SQL run inside the innermost open span
+_db_time: ContextVar = ContextVar("db_time", default=None)
+
+
+class _Span:
+    __slots__ = ("_name", "_attributes", "_cm", "_span", "_token")
+
+    def __init__(self, name: str, attributes: dict | None):
+        self._name = name
+        self._attributes = attributes
+
+    def __enter__(self):
+        self._cm = _tracer.start_as_current_span(self._name, attributes=self._attributes)
+        self._span = self._cm.__enter__()
+        self._token = _db_time.set([0.0, 0])
+        return self._span
+
+    def __exit__(self, *exc_info):
+        seconds, statements = _db_time.get()
+        _db_time.reset(self._token)
+        parent = _db_time.get()
+        if parent is not None:
+            parent[0] += seconds
+            parent[1] += statements
+        if statements:
+            self._span.set_attribute("db.duration_ms", round(seconds * 1000, 3))
+            self._span.set_attribute("db.statements", statements)
+        return self._cm.__exit__(*exc_info)
+
+
+def span(name: str, attributes: dict | None = None):
+    """Context manager for a span named `name`; yields the span, or None when
+    tracing is off. Records the time spent in SQL inside it. Never swallows
+    or retries anything: exceptions propagate unchanged."""
+    if _tracer is None:
+        return _NOOP
+    return _Span(name, attributes)
+
+
+def traced(name: str):
+    """Decorator form of `span` for async functions."""
+    def decorator(fn):
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _db_time.get() is not None:
+        context._fixflow_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timer = _db_time.get()
+    start = getattr(context, "_fixflow_query_start", None)
+    if timer is not None and start is not None:
+        timer[0] += time.perf_counter() - start
+        timer[1] += 1
+
+
+def instrument_db(engine):
+    """Feed SQL timings of `engine` (sync or async) into the enclosing span."""
+    from sqlalchemy import event
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    # a span per statement as well, with TRACE_SQLALCHEMY, once tracing is set up
+    _engines.append(sync_engine)
+    _instrument_sqlalchemy(sync_engine)
@@ -1,16 +1,20 @@
-from fastapi import Header, HTTPException
-import jwt
+from fastapi import Header
+from fixflow_common.auth import TokenCache, bearer_token, trusted_identity, verify_token
 from .config import settings
 from typing import Optional
 
-def get_current_user(authorization: Optional[str] = Header(None)):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Missing Authorization")
-    scheme, _, token = authorization.partition(" ")
-    if scheme.lower() != "bearer":
-        raise HTTPException(status_code=401, detail="Invalid scheme")
-    try:
-        data = jwt.decode(token, settings.JWT_SECRET, algorithms=["HS256"])
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Token error")
-    return data  # contains sub, email, roles
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+
+
+def decode_token(token: str) -> dict:
+    return verify_token(token, settings.JWT_SECRET, token_cache)
+
+
+async def get_current_user(
+    authorization: Optional[str] = Header(None),
+    x_authenticated_user: Optional[str] = Header(None),
+):
+    data = trusted_identity(x_authenticated_user, settings.TRUST_IDENTITY_HEADER)
+    if data is not None:
+        return data
+    return decode_token(bearer_token(authorization))  # contains sub, email, roles
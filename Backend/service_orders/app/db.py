@@ -1,16 +1,19 @@
-from sqlmodel import SQLModel, create_engine, Session
+"""Database of the orders service; engines, sessions and migrations come from
+fixflow_common.db, configured by this service's settings."""
 from pathlib import Path
+from fixflow_common.db import Database
 from .config import settings
 
-DB_FILE = settings.DB_FILE
-Path(DB_FILE).parent.mkdir(parents=True, exist_ok=True)
-engine = create_engine(f"sqlite:///./{DB_FILE}", connect_args={"check_same_thread": False})
+database = Database(settings, Path(__file__).parent / "migrations")
 
-def init_db():
-    # ensure clean schema for test runs (drops existing tables then recreates)
-    SQLModel.metadata.drop_all(engine)
-    SQLModel.metadata.create_all(engine)
-
-def get_session():
-    with Session(engine) as session:
-        yield session
+DB_FILE = database.DB_FILE
+DATABASE_URL = database.url
+engine = database.engine
+read_engine = database.read_engine
+async_session = database.async_session
+async_read_session = database.async_read_session
+dispose_engines = database.dispose_engines
+migrate_db = database.migrate_db
+reset_db = database.reset_db
+get_session = database.get_session
+get_read_session = database.get_read_session
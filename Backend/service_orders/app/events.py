@@ -1,8 +1,16 @@
-import logging
-logger = logging.getLogger("events")
+"""Domain events of the orders service, staged in its transactional outbox
+(orders_outbox) and relayed by the shared bus in fixflow_common.events."""
+from fixflow_common.events import EventBus
+from .config import settings
+from .db import async_read_session, async_session
+from .models import OutboxEvent
 
-def publish_order_created(order):
-    logger.info("event.order.created", extra={"order_id": order.id, "user_id": order.user_id})
+event_bus = EventBus("service_orders", OutboxEvent, settings, async_session, async_read_session)
 
-def publish_order_status_changed(order):
-    logger.info("event.order.status_changed", extra={"order_id": order.id, "status": order.status})
+
+def publish_order_created(session, order):
+    event_bus.stage(session, "order.created", {"order_id": order.id, "user_id": order.user_id, "total": order.total})
+
+
+def publish_order_status_changed(session, order):
+    event_bus.stage(session, "order.status_changed", {"order_id": order.id, "status": order.status})
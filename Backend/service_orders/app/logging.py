@@ -1,41 +0,0 @@
-import logging
-import json
-import contextvars
-
-request_id_ctx = contextvars.ContextVar("request_id", default=None)
-
-
-class RequestIdFilter(logging.Filter):
-    def filter(self, record):
-        record.request_id = request_id_ctx.get()
-        return True
-
-
-class JSONFormatter(logging.Formatter):
-    def format(self, record):
-        payload = {
-            "ts": self.formatTime(record, self.datefmt),
-            "level": record.levelname,
-            "logger": record.name,
-            "msg": record.getMessage(),
-            "request_id": getattr(record, "request_id", None),
-        }
-        if record.exc_info:
-            payload["exc_info"] = self.formatException(record.exc_info)
-        for k, v in record.__dict__.items():
-            if k not in ("name", "msg", "args", "levelname", "levelno", "pathname", "filename", "module", "exc_info", "exc_text", "stack_info", "lineno", "funcName", "created", "msecs", "relativeCreated", "thread", "threadName", "processName", "process", "request_id"):
-                try:
-                    json.dumps(v)
-                    payload[k] = v
-                except Exception:
-                    payload[k] = str(v)
-        return json.dumps(payload)
-
-
-def setup_logging(level=logging.INFO):
-    root = logging.getLogger()
-    handler = logging.StreamHandler()
-    handler.setFormatter(JSONFormatter())
-    handler.addFilter(RequestIdFilter())
-    root.setLevel(level)
-    root.handlers = [handler]
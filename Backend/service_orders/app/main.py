@@ -1,156 +1,333 @@
 from fastapi import FastAPI, Depends, HTTPException, Header
-from .db import init_db, get_session
-from .models import Order
-from .schemas import OrderCreate, OrderOut
+from .db import migrate_db, get_session, get_read_session, dispose_engines
+from sqlmodel.ext.asyncio.session import AsyncSession
+from .models import Order, OrderItem
+from .schemas import (
+    OrderBatchCreate, OrderBatchResult, OrderBatchStatus, OrderCreate, OrderOut, OrderPage,
+    OrderRef, OrderSelection, OrderStats, OrderStatusChange, OrderStatusOut,
+)
 from .auth import get_current_user
-from .middleware import XRequestIDMiddleware
-from .logging import setup_logging
-from .tracing import setup_tracing
-from .events import publish_order_created, publish_order_status_changed
-from sqlmodel import select
-import json
+from fixflow_common.middleware import RequestContextMiddleware
+from fixflow_common.responses import Envelope, JSONResponse, envelope
+from fixflow_common.logging import log_stats, setup_logging
+from fixflow_common.metrics import setup_metrics
+from fixflow_common.tracing import setup_tracing, span
+from .events import event_bus, publish_order_created, publish_order_status_changed
+from .config import settings
+from fixflow_common.pagination import CountCache, apply_keyset, encode_cursor, parse_sort
+from sqlmodel import select, func, update
+from sqlalchemy import insert
+from pydantic import ValidationError
+from typing import Any, Dict, Optional, Union
 
 setup_logging()
-app = FastAPI(title="Orders Service")
-app.add_middleware(XRequestIDMiddleware)
+app = FastAPI(title="Orders Service", default_response_class=JSONResponse)
+app.add_middleware(RequestContextMiddleware, logger_name="service_orders")
 # optional tracing
 tracer = setup_tracing(app, service_name="service_orders")
-
-# Ensure DB/tables exist on import for test environment
-init_db()
+setup_metrics(app, service_name="service_orders")
 
 @app.on_event("startup")
-def on_startup():
-    init_db()
-
-@app.post("/v1/orders", response_model=dict)
-def create_order(payload: OrderCreate, user=Depends(get_current_user)):
-    session = next(get_session())
-    try:
-        from opentelemetry import trace as otel_trace
-        tracer_local = tracer or otel_trace.get_tracer(__name__)
-        with tracer_local.start_as_current_span("orders.create") as span:
-            span.set_attribute("order.user_id", user["sub"])
-            order = Order(user_id=user["sub"], items=json.dumps(payload.items), total=payload.total)
-            session.add(order)
-            session.commit()
-            session.refresh(order)
-    except Exception:
-        order = Order(user_id=user["sub"], items=json.dumps(payload.items), total=payload.total)
-        session.add(order)
-        session.commit()
-        session.refresh(order)
-
-    publish_order_created(order)
-    return {"success": True, "data": {"id": order.id}}
-
-@app.get("/v1/orders/{order_id}", response_model=dict)
-def get_order(order_id: str, user=Depends(get_current_user)):
-    session = next(get_session())
-    try:
-        from opentelemetry import trace as otel_trace
-        tracer_local = tracer or otel_trace.get_tracer(__name__)
-        with tracer_local.start_as_current_span("orders.get") as span:
-            span.set_attribute("order.id", order_id)
-            order = session.get(Order, order_id)
-            if not order:
-                raise HTTPException(status_code=404, detail="Not found")
-            if order.user_id != user["sub"] and "admin" not in user.get("roles", []):
-                raise HTTPException(status_code=403, detail="Forbidden")
-    except Exception:
-        order = session.get(Order, order_id)
+async def on_startup():
+    # only applies pending migrations; never drops data
+    await migrate_db()
+    await event_bus.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await event_bus.stop()
+    await dispose_engines()
+
+def _new_order(user_id: str, payload: OrderCreate):
+    order = Order(user_id=user_id, total=payload.total)
+    items = [OrderItem(order_id=order.id, sku=i.sku, qty=i.qty, price=i.price) for i in payload.items]
+    return order, items
+
+
+async def _load_items(session: AsyncSession, order_ids: list) -> dict:
+    """Items for many orders in one query, grouped by order id."""
+    grouped = {order_id: [] for order_id in order_ids}
+    if order_ids:
+        # plain rows, not ORM instances: they only become dicts in the response
+        q = (
+            select(OrderItem.order_id, OrderItem.sku, OrderItem.qty, OrderItem.price)
+            .where(OrderItem.order_id.in_(order_ids))
+            .order_by(OrderItem.order_id, OrderItem.id)
+        )
+        for order_id, sku, qty, price in (await session.exec(q)).all():
+            grouped[order_id].append({"sku": sku, "qty": qty, "price": price})
+    return grouped
+
+
+@app.post("/v1/orders", response_model=Envelope[OrderRef])
+async def create_order(payload: OrderCreate, user=Depends(get_current_user), session: AsyncSession = Depends(get_session)):
+    with span("orders.create", {"order.user_id": user["sub"]}):
+        order, items = _new_order(user["sub"], payload)
+        session.add_all([order, *items])
+        publish_order_created(session, order)
+        await session.commit()
+        await session.refresh(order)
+
+    order_counts.invalidate(lambda key: key == order.user_id)
+    return envelope({"id": order.id})
+
+ORDER_STATUSES = ("created", "in_work", "completed", "cancelled")
+MAX_BATCH_SIZE = 100
+
+
+def _check_batch_size(entries: list):
+    if len(entries) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch too large; max {MAX_BATCH_SIZE} entries")
+
+
+def _batch_error(index: int, status_code: int, detail, **extra) -> dict:
+    return {"index": index, "success": False, **extra, "error": {"status_code": status_code, "detail": detail}}
+
+
+def _validation_detail(exc: ValidationError) -> list:
+    return exc.errors(include_url=False, include_context=False)
+
+
+# Batch routes validate every entry on its own and report per-entry results;
+# all valid entries are written in a single transaction.
+@app.post("/v1/orders:batch", response_model=Envelope[OrderBatchResult])
+async def create_orders_batch(payload: OrderBatchCreate, user=Depends(get_current_user), session: AsyncSession = Depends(get_session)):
+    _check_batch_size(payload.orders)
+    results, created, item_rows = [], [], []
+    for index, raw in enumerate(payload.orders):
+        try:
+            order_in = OrderCreate.model_validate(raw)
+        except ValidationError as exc:
+            results.append(_batch_error(index, 422, _validation_detail(exc)))
+            continue
+        order = Order(user_id=user["sub"], total=order_in.total)
+        created.append(order)
+        item_rows += [{"order_id": order.id, "sku": i.sku, "qty": i.qty, "price": i.price} for i in order_in.items]
+        results.append({"index": index, "success": True, "id": order.id})
+
+    if created:
+        # one executemany per table: orders carry their ids, and item ids are
+        # not needed back, so no per-row RETURNING round-trips
+        session.add_all(created)
+        await session.flush()
+        if item_rows:
+            await session.exec(insert(OrderItem), params=item_rows)
+        for order in created:
+            publish_order_created(session, order)
+        await session.commit()
+        order_counts.invalidate(lambda key: key == user["sub"])
+    return envelope({"items": results, "created": len(created), "failed": len(results) - len(created)})
+
+
+@app.patch("/v1/orders/status:batch", response_model=Envelope[OrderBatchResult])
+async def update_status_batch(payload: OrderBatchStatus, user=Depends(get_current_user), session: AsyncSession = Depends(get_session)):
+    _check_batch_size(payload.updates)
+    results = [None] * len(payload.updates)
+    changes = {}
+    for index, raw in enumerate(payload.updates):
+        try:
+            change = OrderStatusChange.model_validate(raw)
+        except ValidationError as exc:
+            results[index] = _batch_error(index, 422, _validation_detail(exc))
+            continue
+        if change.status not in ORDER_STATUSES:
+            results[index] = _batch_error(index, 400, "Invalid status", id=change.id)
+            continue
+        changes[index] = change
+
+    ids = {change.id for change in changes.values()}
+    orders = {}
+    if ids:
+        orders = {o.id: o for o in (await session.exec(select(Order).where(Order.id.in_(ids)))).all()}
+    # order id -> new status; a later entry for the same order wins
+    final = {}
+    for index, change in changes.items():
+        order = orders.get(change.id)
+        if order is None:
+            results[index] = _batch_error(index, 404, "Not found", id=change.id)
+        elif order.user_id != user["sub"] and "admin" not in user.get("roles", []):
+            results[index] = _batch_error(index, 403, "Forbidden", id=change.id)
+        else:
+            final[order.id] = change.status
+            results[index] = {"index": index, "success": True, "id": order.id, "status": change.status}
+
+    if final:
+        by_status = {}
+        for order_id, new_status in final.items():
+            by_status.setdefault(new_status, []).append(order_id)
+        # at most one UPDATE per target status, all in one transaction
+        for new_status, order_ids in by_status.items():
+            await session.exec(update(Order).where(Order.id.in_(order_ids)).values(status=new_status))
+        for order_id in final:
+            publish_order_status_changed(session, orders[order_id])
+        await session.commit()
+    updated = sum(1 for r in results if r["success"])
+    return envelope({"items": results, "updated": updated, "failed": len(results) - updated})
+
+
+@app.get("/v1/health/events", response_model=Envelope[Dict[str, Any]])
+async def events_health():
+    return envelope(event_bus.stats())
+
+@app.get("/v1/health/logging", response_model=Envelope[Dict[str, Any]])
+async def logging_health():
+    return envelope(log_stats())
+
+
+STATS_GROUPS = ("sku", "status")
+
+
+# declared before /v1/orders/{order_id} so "stats" is not taken for an id
+@app.get("/v1/orders/stats", response_model=Envelope[OrderStats])
+async def order_stats(group_by: str = "status", user=Depends(get_current_user), session: AsyncSession = Depends(get_read_session)):
+    """Aggregates over the caller's orders (all orders for admins)."""
+    if group_by not in STATS_GROUPS:
+        raise HTTPException(status_code=400, detail=f"Invalid group_by; allowed: {', '.join(STATS_GROUPS)}")
+    if group_by == "sku":
+        q = (
+            select(
+                OrderItem.sku,
+                func.count(func.distinct(OrderItem.order_id)),
+                func.sum(OrderItem.qty),
+                func.sum(OrderItem.qty * OrderItem.price),
+            )
+            .join(Order, Order.id == OrderItem.order_id)
+            .group_by(OrderItem.sku)
+            .order_by(OrderItem.sku)
+        )
+        keys = ("sku", "orders", "qty", "amount")
+    else:
+        q = select(Order.status, func.count(), func.sum(Order.total)).group_by(Order.status).order_by(Order.status)
+        keys = ("status", "orders", "total")
+    if "admin" not in user.get("roles", []):
+        q = q.where(Order.user_id == user["sub"])
+    rows = (await session.exec(q)).all()
+    return envelope({"group_by": group_by, "items": [dict(zip(keys, row)) for row in rows]})
+
+
+@app.get("/v1/orders/{order_id}", response_model=Envelope[OrderOut])
+async def get_order(order_id: str, user=Depends(get_current_user), session: AsyncSession = Depends(get_read_session)):
+    with span("orders.get", {"order.id": order_id}):
+        order = await session.get(Order, order_id)
         if not order:
             raise HTTPException(status_code=404, detail="Not found")
         if order.user_id != user["sub"] and "admin" not in user.get("roles", []):
             raise HTTPException(status_code=403, detail="Forbidden")
+        items = (await _load_items(session, [order.id]))[order.id]
 
-    return {"success": True, "data": {
+    return envelope({
         "id": order.id,
         "user_id": order.user_id,
-        "items": json.loads(order.items),
+        "items": items,
         "status": order.status,
-        "total": order.total
-    }}
-
-@app.get("/v1/orders", response_model=dict)
-def list_orders(limit: int = 10, offset: int = 0, sort: str = "created_at", user=Depends(get_current_user)):
-    session = next(get_session())
-    try:
-        from opentelemetry import trace as otel_trace
-        tracer_local = tracer or otel_trace.get_tracer(__name__)
-        with tracer_local.start_as_current_span("orders.list") as span:
-            span.set_attribute("orders.user_id", user["sub"])
-            q = select(Order).where(Order.user_id == user["sub"]).offset(offset).limit(limit)
-            orders = session.exec(q).all()
-    except Exception:
-        q = select(Order).where(Order.user_id == user["sub"]).offset(offset).limit(limit)
-        orders = session.exec(q).all()
-
-    items = []
-    for o in orders:
-        items.append({"id": o.id, "items": json.loads(o.items), "status": o.status, "total": o.total})
-    return {"success": True, "data": {"items": items, "limit": limit, "offset": offset}}
-
-@app.patch("/v1/orders/{order_id}/status", response_model=dict)
-def update_status(order_id: str, payload: dict, user=Depends(get_current_user)):
-    session = next(get_session())
-    try:
-        from opentelemetry import trace as otel_trace
-        tracer_local = tracer or otel_trace.get_tracer(__name__)
-        with tracer_local.start_as_current_span("orders.update_status") as span:
-            span.set_attribute("order.id", order_id)
-            order = session.get(Order, order_id)
-            if not order:
-                raise HTTPException(status_code=404, detail="Not found")
-            if order.user_id != user["sub"] and "admin" not in user.get("roles", []):
-                raise HTTPException(status_code=403, detail="Forbidden")
-            new_status = payload.get("status")
-            if new_status not in ["created", "in_work", "completed", "cancelled"]:
-                raise HTTPException(status_code=400, detail="Invalid status")
-            order.status = new_status
-            session.add(order)
-            session.commit()
-    except Exception:
-        order = session.get(Order, order_id)
+        "total": order.total,
+    })
+
+# sort keys allowed for list_orders, each backed by a (user_id, <key>, id) index
+ORDER_SORTS = {"created_at": Order.created_at, "total": Order.total}
+MAX_PAGE_SIZE = 100
+order_counts = CountCache(ttl=settings.COUNT_CACHE_TTL)
+
+
+def _orders_page_query(user_id: str, limit: int, offset: int, cursor: Optional[str], sort: str):
+    _, column, descending = parse_sort(sort, ORDER_SORTS)
+    q = apply_keyset(select(Order).where(Order.user_id == user_id), column, Order.id, descending, cursor, sort)
+    if offset and not cursor:
+        # legacy offset paging, O(offset); prefer next_cursor
+        q = q.offset(offset)
+    # one extra row tells whether there is a next page
+    return q.limit(limit + 1), column
+
+
+def _order_summary(order: Order, items: list) -> dict:
+    return {"id": order.id, "items": items, "status": order.status, "total": order.total}
+
+
+async def _orders_by_ids(session: AsyncSession, user: dict, raw_ids: str) -> dict:
+    ids = list(dict.fromkeys(i.strip() for i in raw_ids.split(",") if i.strip()))
+    if len(ids) > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"Too many ids; max {MAX_PAGE_SIZE}")
+    found = {}
+    if ids:
+        q = select(Order).where(Order.id.in_(ids))
+        if "admin" not in user.get("roles", []):
+            q = q.where(Order.user_id == user["sub"])
+        found = {o.id: o for o in (await session.exec(q)).all()}
+    order_items = await _load_items(session, list(found))
+    # orders the caller may not see are reported as missing, not as forbidden
+    return {
+        "items": [_order_summary(found[i], order_items[i]) for i in ids if i in found],
+        "missing": [i for i in ids if i not in found],
+    }
+
+
+async def _count_orders(session: AsyncSession, user_id: str) -> int:
+    total = order_counts.get(user_id)
+    if total is None:
+        total = (await session.exec(select(func.count()).select_from(Order).where(Order.user_id == user_id))).one()
+        order_counts.put(user_id, total)
+    return total
+
+
+@app.get("/v1/orders", response_model=Envelope[Union[OrderPage, OrderSelection]])
+async def list_orders(
+    limit: int = 10,
+    offset: int = 0,
+    sort: str = "created_at",
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    ids: Optional[str] = None,
+    user=Depends(get_current_user),
+    session: AsyncSession = Depends(get_read_session),
+):
+    if ids is not None:
+        # batch fetch: ?ids=a,b,c returns those orders in the requested order
+        return envelope(await _orders_by_ids(session, user, ids))
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    q, sort_column = _orders_page_query(user["sub"], limit, offset, cursor, sort)
+    with span("orders.list", {"orders.user_id": user["sub"]}):
+        orders = (await session.exec(q)).all()
+        next_cursor = None
+        if len(orders) > limit:
+            orders = orders[:limit]
+            last = orders[-1]
+            next_cursor = encode_cursor(sort, getattr(last, sort_column.key), last.id)
+        order_items = await _load_items(session, [o.id for o in orders])
+    items = [_order_summary(o, order_items[o.id]) for o in orders]
+    data = {"items": items, "limit": limit, "offset": offset, "next_cursor": next_cursor}
+    if include_total:
+        data["total"] = await _count_orders(session, user["sub"])
+    return envelope(data)
+
+@app.patch("/v1/orders/{order_id}/status", response_model=Envelope[OrderStatusOut])
+async def update_status(order_id: str, payload: dict, user=Depends(get_current_user), session: AsyncSession = Depends(get_session)):
+    with span("orders.update_status", {"order.id": order_id}):
+        new_status = payload.get("status")
+        if new_status not in ORDER_STATUSES:
+            raise HTTPException(status_code=400, detail="Invalid status")
+        order = await session.get(Order, order_id)
         if not order:
             raise HTTPException(status_code=404, detail="Not found")
         if order.user_id != user["sub"] and "admin" not in user.get("roles", []):
             raise HTTPException(status_code=403, detail="Forbidden")
-        new_status = payload.get("status")
-        if new_status not in ["created", "in_work", "completed", "cancelled"]:
-            raise HTTPException(status_code=400, detail="Invalid status")
         order.status = new_status
         session.add(order)
-        session.commit()
-
-    publish_order_status_changed(order)
-    return {"success": True, "data": {"id": order.id, "status": order.status}}
-
-@app.delete("/v1/orders/{order_id}", response_model=dict)
-def cancel_order(order_id: str, user=Depends(get_current_user)):
-    session = next(get_session())
-    try:
-        from opentelemetry import trace as otel_trace
-        tracer_local = tracer or otel_trace.get_tracer(__name__)
-        with tracer_local.start_as_current_span("orders.cancel") as span:
-            span.set_attribute("order.id", order_id)
-            order = session.get(Order, order_id)
-            if not order:
-                raise HTTPException(status_code=404, detail="Not found")
-            if order.user_id != user["sub"] and "admin" not in user.get("roles", []):
-                raise HTTPException(status_code=403, detail="Forbidden")
-            order.status = "cancelled"
-            session.add(order)
-            session.commit()
-    except Exception:
-        order = session.get(Order, order_id)
+        publish_order_status_changed(session, order)
+        await session.commit()
+
+    return envelope({"id": order.id, "status": order.status})
+
+@app.delete("/v1/orders/{order_id}", response_model=Envelope[OrderStatusOut])
+async def cancel_order(order_id: str, user=Depends(get_current_user), session: AsyncSession = Depends(get_session)):
+    with span("orders.cancel", {"order.id": order_id}):
+        order = await session.get(Order, order_id)
         if not order:
             raise HTTPException(status_code=404, detail="Not found")
         if order.user_id != user["sub"] and "admin" not in user.get("roles", []):
             raise HTTPException(status_code=403, detail="Forbidden")
         order.status = "cancelled"
         session.add(order)
-        session.commit()
+        publish_order_status_changed(session, order)
+        await session.commit()
 
-    publish_order_status_changed(order)
-    return {"success": True, "data": {"id": order.id, "status": order.status}}
+    return envelope({"id": order.id, "status": order.status})
@@ -0,0 +1,25 @@
+"""keyset pagination indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_order_user_created", "order", ["user_id", "created_at", "id"])
+    op.create_index("ix_order_user_total", "order", ["user_id", "total", "id"])
+    # covered by the leading column of ix_order_user_created
+    op.drop_index("ix_order_user_id", table_name="order")
+
+
+def downgrade():
+    op.create_index("ix_order_user_id", "order", ["user_id"])
+    op.drop_index("ix_order_user_total", table_name="order")
+    op.drop_index("ix_order_user_created", table_name="order")
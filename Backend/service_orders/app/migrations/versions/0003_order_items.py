@@ -0,0 +1,80 @@
+"""normalize order items into order_item
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+import json
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+BATCH = 1000
+
+
+def _item_row(order_id, raw):
+    # same aliases as schemas.OrderItemIn
+    if not isinstance(raw, dict):
+        raw = {}
+    sku = raw.get("sku", raw.get("product_id", raw.get("product", "")))
+    qty = raw.get("qty", raw.get("quantity", 1))
+    try:
+        qty = int(qty)
+    except (TypeError, ValueError):
+        qty = 1
+    try:
+        price = float(raw.get("price", 0.0))
+    except (TypeError, ValueError):
+        price = 0.0
+    return {"order_id": order_id, "sku": str(sku), "qty": qty, "price": price}
+
+
+def upgrade():
+    order_item = op.create_table(
+        "order_item",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("order_id", sa.String(), sa.ForeignKey("order.id"), nullable=False),
+        sa.Column("sku", sa.String(), nullable=False),
+        sa.Column("qty", sa.Integer(), nullable=False),
+        sa.Column("price", sa.Float(), nullable=False),
+    )
+    op.create_index("ix_order_item_order_id", "order_item", ["order_id"])
+    op.create_index("ix_order_item_sku", "order_item", ["sku"])
+
+    # move the JSON blobs over in batches
+    bind = op.get_bind()
+    rows = bind.execute(sa.text('SELECT id, items FROM "order"'))
+    while True:
+        chunk = rows.fetchmany(BATCH)
+        if not chunk:
+            break
+        values = []
+        for order_id, items in chunk:
+            try:
+                parsed = json.loads(items) if items else []
+            except ValueError:
+                parsed = []
+            values.extend(_item_row(order_id, raw) for raw in (parsed if isinstance(parsed, list) else []))
+        if values:
+            op.bulk_insert(order_item, values)
+
+    with op.batch_alter_table("order") as batch:
+        batch.drop_column("items")
+
+
+def downgrade():
+    with op.batch_alter_table("order") as batch:
+        batch.add_column(sa.Column("items", sa.String(), nullable=False, server_default="[]"))
+    bind = op.get_bind()
+    grouped = {}
+    for order_id, sku, qty, price in bind.execute(sa.text("SELECT order_id, sku, qty, price FROM order_item ORDER BY id")):
+        grouped.setdefault(order_id, []).append({"sku": sku, "qty": qty, "price": price})
+    for order_id, items in grouped.items():
+        bind.execute(sa.text('UPDATE "order" SET items = :items WHERE id = :id'), {"items": json.dumps(items), "id": order_id})
+    op.drop_index("ix_order_item_sku", table_name="order_item")
+    op.drop_index("ix_order_item_order_id", table_name="order_item")
+    op.drop_table("order_item")
@@ -0,0 +1,29 @@
+"""transactional outbox for domain events
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "orders_outbox",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("type", sa.String(), nullable=False),
+        sa.Column("payload", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_orders_outbox_created", "orders_outbox", ["created_at"])
+
+
+def downgrade():
+    op.drop_index("ix_orders_outbox_created", table_name="orders_outbox")
+    op.drop_table("orders_outbox")
@@ -1,15 +1,47 @@
 from sqlmodel import SQLModel, Field
-from typing import List
+from sqlalchemy import Index
+from typing import List, Optional
 import uuid
 from datetime import datetime
 def gen_uuid():
     return str(uuid.uuid4())
 
 class Order(SQLModel, table=True):
+    # keyset pagination indexes for list_orders sorts
+    __table_args__ = (
+        Index("ix_order_user_created", "user_id", "created_at", "id"),
+        Index("ix_order_user_total", "user_id", "total", "id"),
+    )
+
     id: str = Field(default_factory=gen_uuid, primary_key=True)
-    user_id: str = Field(index=True)
-    items: str  # JSON string of positions; for simplicity
+    user_id: str  # indexed by ix_order_user_created
     status: str = Field(default="created")
     total: float = 0.0
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class OrderItem(SQLModel, table=True):
+    __tablename__ = "order_item"
+    __table_args__ = (
+        Index("ix_order_item_order_id", "order_id"),
+        Index("ix_order_item_sku", "sku"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    order_id: str = Field(foreign_key="order.id")
+    sku: str
+    qty: int = 1
+    price: float = 0.0
+
+
+class OutboxEvent(SQLModel, table=True):
+    # events staged in the same transaction as the change; deleted once published.
+    # Named per service: both services share SQLModel.metadata when run together
+    __tablename__ = "orders_outbox"
+    __table_args__ = (Index("ix_orders_outbox_created", "created_at"),)
+
+    id: str = Field(default_factory=gen_uuid, primary_key=True)
+    type: str
+    payload: str  # JSON
+    created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -1,13 +1,86 @@
-from pydantic import BaseModel
-from typing import List, Dict
+from pydantic import AliasChoices, BaseModel, Field
+from typing import Any, List, Dict, Optional
+
+
+class OrderItemIn(BaseModel):
+    # product/product_id and quantity are accepted from older clients
+    sku: str = Field(validation_alias=AliasChoices("sku", "product_id", "product"))
+    qty: int = Field(default=1, validation_alias=AliasChoices("qty", "quantity"))
+    price: float = 0.0
+
+
+class OrderItemOut(BaseModel):
+    sku: str
+    qty: int
+    price: float
+
 
 class OrderCreate(BaseModel):
-    items: List[Dict]  # e.g. [{"product_id": "...", "quantity": 2}]
+    items: List[OrderItemIn]  # e.g. [{"sku": "...", "qty": 2, "price": 5.0}]
     total: float
 
+# batch entries are validated one by one, so a bad entry fails alone
+class OrderBatchCreate(BaseModel):
+    orders: List[Any]
+
+
+class OrderStatusChange(BaseModel):
+    id: str
+    status: str
+
+
+class OrderBatchStatus(BaseModel):
+    updates: List[Any]
+
 class OrderOut(BaseModel):
     id: str
     user_id: str
-    items: List[Dict]
+    items: List[OrderItemOut]
     status: str
     total: float
+
+
+# response models: the `data` of each route's Envelope
+
+class OrderRef(BaseModel):
+    id: str
+
+
+class OrderStatusOut(BaseModel):
+    id: str
+    status: str
+
+
+class OrderSummary(BaseModel):
+    id: str
+    items: List[OrderItemOut]
+    status: str
+    total: float
+
+
+class OrderPage(BaseModel):
+    items: List[OrderSummary]
+    limit: int
+    offset: int
+    next_cursor: Optional[str] = None
+    # only with include_total=true
+    total: Optional[int] = None
+
+
+# GET /v1/orders?ids=...
+class OrderSelection(BaseModel):
+    items: List[OrderSummary]
+    missing: List[str]
+
+
+class OrderBatchResult(BaseModel):
+    # per entry: {"index", "success", "id"/"status"} or {"index", "success", "error"}
+    items: List[Dict[str, Any]]
+    created: Optional[int] = None
+    updated: Optional[int] = None
+    failed: int
+
+
+class OrderStats(BaseModel):
+    group_by: str
+    items: List[Dict[str, Any]]
@@ -1,5 +1,8 @@
 from passlib.context import CryptContext
 import jwt
+import time
+from collections import OrderedDict
+from fixflow_common.auth import TokenCache, verify_token
 from .config import settings
 from datetime import datetime, timedelta
 import logging
@@ -30,6 +33,34 @@ def hash_password(raw: str):
     return pwd_ctx.hash(_limit_password(raw))
 
 
+def set_work_factor(rounds: int):
+    # pbkdf2 rounds, or the log2 cost for bcrypt
+    scheme = _schemes[0]
+    pwd_ctx.update(**{f"{scheme}__rounds": rounds})
+
+
+def calibrate_work_factor(target_ms: float) -> int:
+    """Pick the work factor whose hash takes about `target_ms` on this host.
+    Never goes below the library default.
+    """
+    scheme = _schemes[0]
+    handler = pwd_ctx.handler(scheme)
+    default_rounds = handler.default_rounds
+    start = time.perf_counter()
+    handler.using(rounds=default_rounds).hash("calibration")
+    elapsed_ms = max((time.perf_counter() - start) * 1000, 0.001)
+    if scheme == "bcrypt":
+        # cost is logarithmic: each +1 doubles the time
+        rounds = default_rounds
+        while elapsed_ms * 2 <= target_ms and rounds < handler.max_rounds:
+            elapsed_ms *= 2
+            rounds += 1
+    else:
+        rounds = max(default_rounds, int(default_rounds * target_ms / elapsed_ms))
+    set_work_factor(rounds)
+    return rounds
+
+
 def verify_password(raw: str, hashed: str):
     return pwd_ctx.verify(_limit_password(raw), hashed)
 
@@ -38,3 +69,45 @@ def create_access_token(user_id: str, email: str, roles: list):
     payload = {"sub": user_id, "email": email, "roles": roles, "exp": datetime.utcnow() + timedelta(hours=8)}
     token = jwt.encode(payload, settings.JWT_SECRET, algorithm="HS256")
     return token
+
+
+class UserCache:
+    """Short-TTL LRU of user records by id, for the per-request user lookup."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, user_id: str):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        user, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return user
+
+    def put(self, user_id: str, user):
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        self._entries[user_id] = (user, time.monotonic() + self.ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+user_cache = UserCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL)
+
+
+def decode_token(token: str) -> dict:
+    return verify_token(token, settings.JWT_SECRET, token_cache)
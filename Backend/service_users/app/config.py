@@ -1,20 +1,25 @@
 import os
+from fixflow_common.config import ServiceSettings
 
 
-class Settings:
-    # JWT secret can be provided directly or via a file (useful for Docker secrets)
-    _jwt_file = os.getenv("JWT_SECRET_FILE")
-    if _jwt_file and _jwt_file.strip() and os.path.exists(_jwt_file):
-        with open(_jwt_file, "r", encoding="utf-8") as f:
-            JWT_SECRET: str = f.read().strip()
-    else:
-        JWT_SECRET: str = os.getenv("JWT_SECRET", "CHANGE_ME_SECRET")
+class Settings(ServiceSettings):
     # DB path for sqlite
     DB_FILE: str = os.getenv("USERS_DB_FILE", "data/users.db")
-    # Optional observability
-    OTEL_COLLECTOR_URL: str | None = os.getenv("OTEL_COLLECTOR_URL")
-    # Password hashing algorithm: 'bcrypt' or 'pbkdf2_sha256'
-    HASH_ALGORITHM: str = os.getenv("HASH_ALGORITHM", "pbkdf2_sha256")
+    # Optional database URL (sqlite:///... or postgresql://...); overrides DB_FILE.
+    # Served through async drivers: aiosqlite for sqlite, asyncpg for Postgres
+    DATABASE_URL: str | None = os.getenv("USERS_DATABASE_URL")
+    # JSON lines written by EVENTS_TRANSPORT=file
+    EVENTS_FILE: str = os.getenv("USERS_EVENTS_FILE", "data/users-events.jsonl")
+    # Short-lived cache of user records for authenticated requests
+    USER_CACHE_SIZE: int = int(os.getenv("USER_CACHE_SIZE", "10000"))
+    USER_CACHE_TTL: float = float(os.getenv("USER_CACHE_TTL", "5"))
+    # Dedicated pool for password hashing: 'thread' or 'process'
+    HASH_POOL_KIND: str = os.getenv("HASH_POOL_KIND", "thread")
+    HASH_POOL_WORKERS: int = int(os.getenv("HASH_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+    # requests allowed to wait for a worker before answering 503
+    HASH_POOL_MAX_QUEUE: int = int(os.getenv("HASH_POOL_MAX_QUEUE", "32"))
+    # if set, recalibrate the work factor at startup so one hash takes about this long
+    HASH_TARGET_MS: float = float(os.getenv("HASH_TARGET_MS", "0"))
 
 
 settings = Settings()
@@ -1,6 +1,12 @@
-# Simple event publisher stub. Replace with real broker later.
-import logging
-logger = logging.getLogger("events")
+"""Domain events of the users service, staged in its transactional outbox
+(users_outbox) and relayed by the shared bus in fixflow_common.events."""
+from fixflow_common.events import EventBus
+from .config import settings
+from .db import async_read_session, async_session
+from .models import OutboxEvent
 
-def publish_user_created(user):
-    logger.info("event.user.created", extra={"user_id": user.id, "email": user.email})
+event_bus = EventBus("service_users", OutboxEvent, settings, async_session, async_read_session)
+
+
+def publish_user_created(session, user):
+    event_bus.stage(session, "user.created", {"user_id": user.id, "email": user.email})
@@ -0,0 +1,122 @@
+"""Password hashing on a dedicated worker pool.
+Keeps pbkdf2/bcrypt off the event loop and out of the threadpool that serves
+sync endpoints, and rejects work with 503 once the wait queue is full.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import HTTPException
+from fixflow_common.metrics import Histogram, register_callback
+from . import auth
+from .config import settings
+
+logger = logging.getLogger("service_users.hashing")
+
+HASH_DURATION = Histogram(
+    "password_hash_duration_seconds", "Password hash/verify time on the hashing pool, queueing included.",
+    ("op",), (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+
+def _init_worker(rounds):
+    # runs in each worker process, which has its own CryptContext
+    if rounds:
+        auth.set_work_factor(rounds)
+
+
+class HashingPool:
+    def __init__(self, kind: str, workers: int, max_queue: int):
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.rounds = None
+        self._executor: Executor | None = None
+        self._pending = 0
+        self.rejected = 0
+        # recent latencies (ms) for the stats endpoint
+        self._latencies = deque(maxlen=1024)
+
+    def start(self):
+        if self._executor is not None:
+            return
+        if self.kind == "process":
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker, initargs=(self.rounds,)
+            )
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hash")
+
+    def shutdown(self):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def calibrate(self, target_ms: float):
+        # before start(), so process workers are initialised with the new factor
+        self.rounds = auth.calibrate_work_factor(target_ms)
+        logger.info("hash work factor calibrated", extra={"rounds": self.rounds, "target_ms": target_ms})
+
+    @property
+    def in_flight(self) -> int:
+        """Jobs running or queued on the pool, including those whose caller went away."""
+        return self._pending
+
+    def _release(self):
+        self._pending -= 1
+
+    async def _run(self, op: str, fn, *args):
+        if self._pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="Server busy, retry later", headers={"Retry-After": "1"})
+        self.start()
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        future = self._executor.submit(fn, *args)
+        self._pending += 1
+        # the slot is held until the job itself ends: a cancelled request does not
+        # stop a job that is already running
+        future.add_done_callback(lambda f: self._release_from(loop))
+        try:
+            return await asyncio.wrap_future(future)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._latencies.append(elapsed * 1000)
+            HASH_DURATION.observe(elapsed, op)
+
+    def _release_from(self, loop):
+        # done callbacks run on a worker thread; count on the loop's thread
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:
+            # the loop is gone, nothing awaits the count any more
+            self._release()
+
+    async def hash(self, raw: str) -> str:
+        return await self._run("hash", auth.hash_password, raw)
+
+    async def verify(self, raw: str, hashed: str) -> bool:
+        return await self._run("verify", auth.verify_password, raw, hashed)
+
+    def stats(self) -> dict:
+        samples = sorted(self._latencies)
+
+        def pct(p):
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))], 2) if samples else None
+
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queue_depth": max(0, self.in_flight - self.workers),
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "rounds": self.rounds,
+            "latency_ms": {"count": len(samples), "p50": pct(0.5), "p95": pct(0.95), "max": samples[-1] if samples else None},
+        }
+
+
+hashing_pool = HashingPool(settings.HASH_POOL_KIND, settings.HASH_POOL_WORKERS, settings.HASH_POOL_MAX_QUEUE)
+register_callback("password_hash_in_flight", "Hash jobs running or queued on the hashing pool.", lambda: {(): hashing_pool.in_flight})
+register_callback("password_hash_rejected_total", "Hash jobs rejected with 503 because the pool queue was full.", lambda: {(): hashing_pool.rejected}, kind="counter")
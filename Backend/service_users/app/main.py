@@ -1,130 +1,180 @@
 from fastapi import FastAPI, Depends, HTTPException, Header, Request, status
-from sqlmodel import select
-from .db import init_db, get_session
+from sqlmodel import select, func
+from .db import migrate_db, get_session, get_read_session, dispose_engines
+from sqlmodel.ext.asyncio.session import AsyncSession
 from .models import User
-from .schemas import UserCreate, UserOut, TokenOut
-from .auth import hash_password, verify_password, create_access_token
-from .events import publish_user_created
-from .middleware import XRequestIDMiddleware
-from .logging import setup_logging
-from .tracing import setup_tracing
-from typing import List, Optional
+from .schemas import TokenOut, UserCreate, UserOut, UserPage, UserRef
+from .auth import create_access_token, decode_token, user_cache
+from .hashing import hashing_pool
+from fixflow_common.pagination import CountCache, apply_keyset, encode_cursor, parse_sort
+from .config import settings
+from .events import event_bus, publish_user_created
+from fixflow_common.auth import bearer_token, trusted_identity
+from fixflow_common.middleware import RequestContextMiddleware
+from fixflow_common.responses import Envelope, JSONResponse, envelope
+from fixflow_common.logging import log_stats, setup_logging
+from fixflow_common.metrics import setup_metrics
+from fixflow_common.tracing import setup_tracing, span
+from sqlalchemy.exc import IntegrityError
+from typing import Any, Dict, Optional
 import logging
 
 setup_logging()
 logger = logging.getLogger("service_users")
-app = FastAPI(title="Users Service")
-app.add_middleware(XRequestIDMiddleware)
+app = FastAPI(title="Users Service", default_response_class=JSONResponse)
+app.add_middleware(RequestContextMiddleware, logger_name="service_users")
 # optional tracing
 tracer = setup_tracing(app, service_name="service_users")
-
-# Ensure DB/tables exist on import for test environment
-init_db()
+setup_metrics(app, service_name="service_users")
 
 @app.on_event("startup")
-def on_startup():
-    init_db()
-
-@app.post("/v1/auth/register", response_model=dict)
-def register(body: UserCreate, request: Request):
-    session = next(get_session())
-    # DB span
-    try:
-        from opentelemetry import trace as otel_trace
-        tracer_local = tracer or otel_trace.get_tracer(__name__)
-        with tracer_local.start_as_current_span("users.create") as span:
-            span.set_attribute("user.email", body.email)
-            user_exists = session.exec(select(User).where(User.email == body.email)).first()
-            if user_exists:
-                raise HTTPException(status_code=400, detail="Email already registered")
-            user = User(email=body.email, hashed_password=hash_password(body.password), name=body.name, roles=["user"])
-            session.add(user)
-            session.commit()
-            session.refresh(user)
-    except Exception:
-        user_exists = session.exec(select(User).where(User.email == body.email)).first()
-        if user_exists:
+async def on_startup():
+    # only applies pending migrations; never drops data
+    await migrate_db()
+    if settings.HASH_TARGET_MS > 0:
+        hashing_pool.calibrate(settings.HASH_TARGET_MS)
+    hashing_pool.start()
+    await event_bus.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await event_bus.stop()
+    hashing_pool.shutdown()
+    await dispose_engines()
+
+
+async def _find_user_by_email(session: AsyncSession, email: str):
+    return (await session.exec(select(User).where(User.email == email))).first()
+
+
+# the password hash runs on the dedicated hashing pool, never on the event loop
+@app.post("/v1/auth/register", response_model=Envelope[UserRef])
+async def register(
+    body: UserCreate,
+    request: Request,
+    read_session: AsyncSession = Depends(get_read_session),
+    session: AsyncSession = Depends(get_session),
+):
+    with span("users.create", {"user.email": body.email}):
+        if await _find_user_by_email(read_session, body.email):
             raise HTTPException(status_code=400, detail="Email already registered")
-        user = User(email=body.email, hashed_password=hash_password(body.password), name=body.name, roles=["user"])
+        hashed = await hashing_pool.hash(body.password)
+        user = User(email=body.email, hashed_password=hashed, name=body.name, roles=["user"])
         session.add(user)
-        session.commit()
-        session.refresh(user)
-
-    publish_user_created(user)
-    return {"success": True, "data": {"id": user.id}}
-
-@app.post("/v1/auth/login", response_model=dict)
-def login(body: UserCreate):
-    session = next(get_session())
-    try:
-        from opentelemetry import trace as otel_trace
-        tracer_local = tracer or otel_trace.get_tracer(__name__)
-        with tracer_local.start_as_current_span("users.authenticate") as span:
-            span.set_attribute("user.email", body.email)
-            user = session.exec(select(User).where(User.email == body.email)).first()
-            if not user or not verify_password(body.password, user.hashed_password):
-                raise HTTPException(status_code=401, detail="Invalid credentials")
-            token = create_access_token(user.id, user.email, user.roles)
-    except Exception:
-        user = session.exec(select(User).where(User.email == body.email)).first()
-        if not user or not verify_password(body.password, user.hashed_password):
+        publish_user_created(session, user)
+        try:
+            await session.commit()
+        except IntegrityError:
+            # lost a race against a concurrent registration of the same email
+            await session.rollback()
+            raise HTTPException(status_code=400, detail="Email already registered")
+        await session.refresh(user)
+
+    user_counts.invalidate()
+    return envelope({"id": user.id})
+
+@app.post("/v1/auth/login", response_model=Envelope[TokenOut])
+async def login(body: UserCreate, session: AsyncSession = Depends(get_read_session)):
+    with span("users.authenticate", {"user.email": body.email}):
+        user = await _find_user_by_email(session, body.email)
+        if not user or not await hashing_pool.verify(body.password, user.hashed_password):
             raise HTTPException(status_code=401, detail="Invalid credentials")
         token = create_access_token(user.id, user.email, user.roles)
 
-    return {"success": True, "data": {"access_token": token, "token_type": "bearer"}}
+    return envelope({"access_token": token, "token_type": "bearer"})
 
-import jwt
-from .config import settings
+@app.get("/v1/health/hashing", response_model=Envelope[Dict[str, Any]])
+async def hashing_health():
+    return envelope(hashing_pool.stats())
+
+@app.get("/v1/health/events", response_model=Envelope[Dict[str, Any]])
+async def events_health():
+    return envelope(event_bus.stats())
+
+@app.get("/v1/health/logging", response_model=Envelope[Dict[str, Any]])
+async def logging_health():
+    return envelope(log_stats())
 
-def get_current_user(authorization: Optional[str] = Header(None)):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Missing Authorization")
-    scheme, _, token = authorization.partition(" ")
-    if scheme.lower() != "bearer":
-        raise HTTPException(status_code=401, detail="Invalid scheme")
-    try:
-        data = jwt.decode(token, settings.JWT_SECRET, algorithms=["HS256"])
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Token error")
-    session = next(get_session())
-    user = session.get(User, data["sub"])
+async def get_current_user(
+    authorization: Optional[str] = Header(None),
+    x_authenticated_user: Optional[str] = Header(None),
+    session: AsyncSession = Depends(get_read_session),
+):
+    data = trusted_identity(x_authenticated_user, settings.TRUST_IDENTITY_HEADER)
+    if data is None:
+        data = decode_token(bearer_token(authorization))
+    user = user_cache.get(data["sub"])
+    if user is not None:
+        return user
+    user = await session.get(User, data["sub"])
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
+    # detach, so the cached record can be shared across requests/sessions
+    session.expunge(user)
+    user_cache.put(user.id, user)
     return user
 
-@app.get("/v1/users/me", response_model=dict)
-def me(user: User = Depends(get_current_user)):
+@app.get("/v1/users/me", response_model=Envelope[UserOut])
+async def me(user: User = Depends(get_current_user)):
     out = {"id": user.id, "email": user.email, "name": user.name, "roles": user.roles}
-    return {"success": True, "data": out}
+    return envelope(out)
 
-@app.put("/v1/users/me", response_model=dict)
-def update_profile(payload: dict, user: User = Depends(get_current_user)):
-    session = next(get_session())
-    db_user = session.get(User, user.id)
+@app.put("/v1/users/me", response_model=Envelope[UserRef])
+async def update_profile(payload: dict, user: User = Depends(get_current_user), session: AsyncSession = Depends(get_session)):
+    db_user = await session.get(User, user.id)
     if "name" in payload:
         db_user.name = payload["name"]
     session.add(db_user)
-    session.commit()
-    return {"success": True, "data": {"id": db_user.id}}
+    await session.commit()
+    user_cache.invalidate(db_user.id)
+    return envelope({"id": db_user.id})
+
+# sort keys allowed for list_users, each backed by an index ending in id
+USER_SORTS = {"created_at": User.created_at, "email": User.email}
+MAX_PAGE_SIZE = 100
+user_counts = CountCache(ttl=settings.COUNT_CACHE_TTL)
+
+
+def _search(query, q: Optional[str]):
+    if q:
+        query = query.where(User.email.contains(q) | User.name.contains(q))
+    return query
+
 
-@app.get("/v1/users", response_model=dict)
-def list_users(limit: int = 10, offset: int = 0, q: Optional[str] = None, current: User = Depends(get_current_user)):
+@app.get("/v1/users", response_model=Envelope[UserPage])
+async def list_users(
+    limit: int = 10,
+    offset: int = 0,
+    q: Optional[str] = None,
+    sort: str = "created_at",
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    current: User = Depends(get_current_user),
+    session: AsyncSession = Depends(get_read_session),
+):
     if "admin" not in current.roles:
         raise HTTPException(status_code=403, detail="Forbidden")
-    session = next(get_session())
-    try:
-        from opentelemetry import trace as otel_trace
-        tracer_local = tracer or otel_trace.get_tracer(__name__)
-        with tracer_local.start_as_current_span("users.list") as span:
-            query = select(User)
-            if q:
-                query = query.where(User.email.contains(q) | User.name.contains(q))
-            users = session.exec(query.offset(offset).limit(limit)).all()
-    except Exception:
-        query = select(User)
-        if q:
-            query = query.where(User.email.contains(q) | User.name.contains(q))
-        users = session.exec(query.offset(offset).limit(limit)).all()
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    _, sort_column, descending = parse_sort(sort, USER_SORTS)
+    query = apply_keyset(_search(select(User), q), sort_column, User.id, descending, cursor, sort)
+    if offset and not cursor:
+        # legacy offset paging, O(offset); prefer next_cursor
+        query = query.offset(offset)
+    # one extra row tells whether there is a next page
+    query = query.limit(limit + 1)
+    with span("users.list", {"users.q": q or ""}):
+        users = (await session.exec(query)).all()
 
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = encode_cursor(sort, getattr(users[-1], sort_column.key), users[-1].id)
     data = [{"id": u.id, "email": u.email, "name": u.name, "roles": u.roles} for u in users]
-    return {"success": True, "data": {"items": data, "limit": limit, "offset": offset}}
+    out = {"items": data, "limit": limit, "offset": offset, "next_cursor": next_cursor}
+    if include_total:
+        total = user_counts.get(q)
+        if total is None:
+            total = (await session.exec(_search(select(func.count()).select_from(User), q))).one()
+            user_counts.put(q, total)
+        out["total"] = total
+    return envelope(out)
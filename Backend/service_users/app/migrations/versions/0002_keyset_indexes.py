@@ -0,0 +1,21 @@
+"""keyset pagination indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # sort by email is served by the unique ix_users_email
+    op.create_index("ix_users_created", "users", ["created_at", "id"])
+
+
+def downgrade():
+    op.drop_index("ix_users_created", table_name="users")
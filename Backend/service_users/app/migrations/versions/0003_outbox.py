@@ -0,0 +1,29 @@
+"""transactional outbox for domain events
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "users_outbox",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("type", sa.String(), nullable=False),
+        sa.Column("payload", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_users_outbox_created", "users_outbox", ["created_at"])
+
+
+def downgrade():
+    op.drop_index("ix_users_outbox_created", table_name="users_outbox")
+    op.drop_table("users_outbox")
@@ -3,7 +3,7 @@ from typing import List, Optional
 import uuid
 from datetime import datetime
 from sqlmodel import SQLModel, Field
-from sqlalchemy import Column, String
+from sqlalchemy import Column, String, Index
 from sqlalchemy import JSON as SAJSON
 from typing import List, Optional
 import uuid
@@ -16,6 +16,8 @@ def gen_uuid():
 
 class User(SQLModel, table=True):
     __tablename__ = "users"
+    # keyset pagination for list_users sorted by created_at
+    __table_args__ = (Index("ix_users_created", "created_at", "id"),)
 
     id: str = Field(default_factory=gen_uuid, primary_key=True)
     email: str = Field(sa_column=Column(String, unique=True, index=True, nullable=False))
@@ -24,3 +26,15 @@ class User(SQLModel, table=True):
     roles: List[str] = Field(default_factory=list, sa_column=Column(SAJSON))
     created_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
     updated_at: datetime = Field(default_factory=datetime.utcnow, nullable=False)
+
+
+class OutboxEvent(SQLModel, table=True):
+    # events staged in the same transaction as the change; deleted once published.
+    # Named per service: both services share SQLModel.metadata when run together
+    __tablename__ = "users_outbox"
+    __table_args__ = (Index("ix_users_outbox_created", "created_at"),)
+
+    id: str = Field(default_factory=gen_uuid, primary_key=True)
+    type: str
+    payload: str  # JSON
+    created_at: datetime = Field(default_factory=datetime.utcnow)
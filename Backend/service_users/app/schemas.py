@@ -15,3 +15,14 @@ class UserOut(BaseModel):
 class TokenOut(BaseModel):
     access_token: str
     token_type: str = "bearer"
+
+class UserRef(BaseModel):
+    id: str
+
+class UserPage(BaseModel):
+    items: List[UserOut]
+    limit: int
+    offset: int
+    next_cursor: Optional[str] = None
+    # only with include_total=true
+    total: Optional[int] = None
@@ -1,6 +1,21 @@
 import os
 import sys
 
+import pytest
+
 ROOT = os.path.dirname(os.path.dirname(__file__))
 if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def reset_databases():
+    """Start the test session from empty, fully migrated databases.
+    The services themselves never drop data; this is the only place that does.
+    """
+    from service_users.app import db as users_db
+    from service_orders.app import db as orders_db
+
+    users_db.reset_db()
+    orders_db.reset_db()
+    yield
@@ -0,0 +1,50 @@
+import os
+from bench.harness import Recorder, build_report, compare, percentile
+
+
+def test_report_percentiles_and_baseline_comparison():
+    assert percentile([1, 2, 3, 4], 50) == 2 and percentile([1, 2, 3, 4], 99) == 4 and percentile([], 50) == 0.0
+
+    recorder = Recorder()
+    recorder.recording = True
+    for ms in range(1, 101):
+        recorder.record("GET /orders/orders", ms / 1000, 200)
+    recorder.record("POST /orders/orders", 0.5, 503)
+    report = build_report(recorder, "mixed", "AsgiTarget", 4, elapsed=10.0)
+    route = report["routes"]["GET /orders/orders"]
+    assert (route["p50_ms"], route["p95_ms"], route["p99_ms"], route["rps"]) == (50.0, 95.0, 99.0, 10.0)
+    assert report["requests"] == 101 and report["errors"] == 1
+    assert report["routes"]["POST /orders/orders"]["statuses"] == {"503": 1}
+
+    assert compare(report, report, tolerance=0.1) == []
+    slower = {**report, "routes": {**report["routes"], "GET /orders/orders": {**route, "p95_ms": 120.0}}}
+    assert compare(slower, report, tolerance=0.1) == [
+        {"route": "GET /orders/orders", "metric": "p95_ms", "baseline": 95.0, "current": 120.0}
+    ]
+
+
+def test_seeder_grows_tables_and_rebuilds_indexes(tmp_path):
+    import sqlite3
+    from bench.db_scaling import explain, scans
+    from bench.harness import migrate_databases
+    from bench.seed import Seeder, table_counts
+
+    users_db, orders_db = str(tmp_path / "users.db"), str(tmp_path / "orders.db")
+    migrate_databases({**os.environ, "USERS_DB_FILE": users_db, "ORDERS_DB_FILE": orders_db})
+    seeder = Seeder(users_db, orders_db, buyers=20, batch_size=300)
+    seeder.grow(users=50, orders=1000)
+    seeder.grow(users=60, orders=1500)
+    counts = table_counts(users_db, orders_db)
+    assert (counts["users"], counts["order"]) == (60, 1500) and counts["order_item"] >= 1500
+
+    conn = sqlite3.connect(orders_db)
+    indexes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"ix_order_user_created", "ix_order_user_total", "ix_order_item_order_id"} <= indexes
+    buyers = conn.execute('SELECT count(DISTINCT user_id) FROM "order"').fetchone()[0]
+    assert buyers <= 20
+    user_id = conn.execute('SELECT user_id FROM "order" LIMIT 1').fetchone()[0]
+    conn.close()
+
+    plan = explain(orders_db, 'SELECT id FROM "order" WHERE user_id = ? ORDER BY created_at DESC LIMIT 20', (user_id,))
+    assert scans(plan) == [] and "ix_order_user_created" in plan[0]
+    assert scans(explain(users_db, "SELECT count(*) FROM users WHERE name LIKE ?", ("%ivan%",))) == ["SCAN users"]
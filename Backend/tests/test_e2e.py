@@ -4,6 +4,7 @@ from fastapi.testclient import TestClient
 from api_gateway.app.main import app as gateway_app
 from api_gateway.app import main as gateway_main
 from api_gateway.app import config as gateway_config
+from api_gateway.app.upstream import UpstreamPools
 from service_users.app.main import app as users_app
 from service_orders.app.main import app as orders_app
 
@@ -22,7 +23,7 @@ def test_e2e_register_login_create_order_and_propagation():
     import asyncio
 
     transport = ASGITransport(app=composite)
-    gateway_main.async_client = AsyncClient(transport=transport, base_url="http://testserver")
+    gateway_main.upstreams = UpstreamPools(transport=transport)
 
     async def run_sequence():
         async with AsyncClient(transport=transport, base_url="http://testserver") as client:
@@ -0,0 +1,594 @@
+import asyncio
+
+from fastapi import FastAPI, Request
+from fastapi.responses import Response
+from httpx import AsyncClient, ASGITransport
+
+from api_gateway.app.main import app as gateway_app
+from api_gateway.app import main as gateway_main
+from api_gateway.app import config as gateway_config
+from api_gateway.app.upstream import UpstreamPools
+from service_users.app.auth import create_access_token
+
+
+def make_upstream():
+    upstream = FastAPI()
+
+    @upstream.post("/v1/echo")
+    async def echo(request: Request):
+        body = b"".join([chunk async for chunk in request.stream()])
+        return Response(content=body, media_type="application/octet-stream", headers={"Content-Encoding": "identity"})
+
+    return upstream
+
+
+def test_proxy_streams_body_and_passes_headers_through():
+    composite = FastAPI()
+    composite.mount("/v1", gateway_app)
+    composite.mount("/orders", make_upstream())
+    gateway_config.settings.ORDERS_URL = "http://testserver/orders/v1"
+
+    transport = ASGITransport(app=composite)
+    gateway_main.upstreams = UpstreamPools(transport=transport)
+    token = create_access_token("u-stream", "s@test.com", ["user"])
+    payload = b"x" * (256 * 1024)
+
+    async def run():
+        async with AsyncClient(transport=transport, base_url="http://testserver") as client:
+            r = await client.post("/v1/orders/echo", content=payload, headers={"Authorization": f"Bearer {token}"})
+            assert r.status_code == 200
+            assert r.content == payload
+            assert r.headers["content-length"] == str(len(payload))
+            assert r.headers["content-encoding"] == "identity"
+            assert r.headers.get("X-Request-ID") is not None
+
+    asyncio.run(run())
+
+
+def test_upstream_pool_stats():
+    pools = UpstreamPools()
+    pools.client("orders")
+    stats = pools.stats()
+    assert stats["orders"]["open"] is True
+    assert stats["orders"]["active"] == 0 and stats["orders"]["waiting"] == 0
+    assert stats["users"]["open"] is False
+    asyncio.run(pools.aclose())
+    assert pools.stats()["orders"]["open"] is False
+
+
+def test_get_cache_etag_and_invalidation_on_write():
+    import gzip
+
+    upstream = FastAPI()
+    calls = {"get": 0}
+    state = {"status": "created"}
+
+    @upstream.get("/v1/orders/{order_id}")
+    async def get_order(order_id: str):
+        calls["get"] += 1
+        return {"success": True, "data": {"id": order_id, "status": state["status"]}}
+
+    @upstream.patch("/v1/orders/{order_id}/status")
+    async def update_status(order_id: str, payload: dict):
+        state["status"] = payload["status"]
+        return {"success": True}
+
+    @upstream.get("/v1/orders/{order_id}/packed")
+    async def packed(order_id: str, request: Request):
+        calls["get"] += 1
+        # compressed for clients that accept it, as a compressing upstream would
+        if "gzip" in request.headers.get("accept-encoding", ""):
+            return Response(content=gzip.compress(b"plain"), headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"})
+        return Response(content=b"plain", headers={"Vary": "Accept-Encoding"})
+
+    @upstream.get("/v1/orders/{order_id}/personal")
+    async def personal(order_id: str):
+        calls["get"] += 1
+        return Response(content=b"{}", headers={"Vary": "Cookie"})
+
+    composite = FastAPI()
+    composite.mount("/v1", gateway_app)
+    composite.mount("/orders", upstream)
+    gateway_config.settings.ORDERS_URL = "http://testserver/orders/v1"
+    transport = ASGITransport(app=composite)
+    gateway_main.upstreams = UpstreamPools(transport=transport)
+    gateway_main.response_cache.clear()
+    headers = {"Authorization": f"Bearer {create_access_token('u-cache', 'c@test.com', ['user'])}"}
+    other = {"Authorization": f"Bearer {create_access_token('u-other', 'x@test.com', ['user'])}"}
+
+    async def run():
+        async with AsyncClient(transport=transport, base_url="http://testserver") as client:
+            r1 = await client.get("/v1/orders/orders/o1", headers=headers)
+            r2 = await client.get("/v1/orders/orders/o1", headers=headers)
+            assert r1.headers["x-cache"] == "MISS" and r2.headers["x-cache"] == "HIT"
+            assert r1.json() == r2.json() and calls["get"] == 1
+
+            # entries are per user
+            r = await client.get("/v1/orders/orders/o1", headers=other)
+            assert r.headers["x-cache"] == "MISS" and calls["get"] == 2
+
+            r = await client.get("/v1/orders/orders/o1", headers={**headers, "If-None-Match": r1.headers["etag"]})
+            assert r.status_code == 304 and r.content == b""
+
+            await client.patch("/v1/orders/orders/o1/status", json={"status": "completed"}, headers=other)
+            r = await client.get("/v1/orders/orders/o1", headers=headers)
+            assert r.headers["x-cache"] == "MISS" and r.json()["data"]["status"] == "completed"
+
+            # a compressed body is only served to clients that sent the same Accept-Encoding
+            r = await client.get("/v1/orders/orders/o1/packed", headers={**headers, "Accept-Encoding": "gzip"})
+            assert r.headers["content-encoding"] == "gzip"
+            r = await client.get("/v1/orders/orders/o1/packed", headers={**headers, "Accept-Encoding": "identity"})
+            assert r.headers["x-cache"] == "MISS" and r.content == b"plain" and "content-encoding" not in r.headers
+            r = await client.get("/v1/orders/orders/o1/packed", headers={**headers, "Accept-Encoding": "gzip"})
+            assert r.headers["x-cache"] == "HIT" and r.headers["content-encoding"] == "gzip"
+
+            # a response that varies on a header outside the key is not stored
+            calls["get"] = 0
+            for _ in range(2):
+                r = await client.get("/v1/orders/orders/o1/personal", headers=headers)
+            assert "x-cache" not in r.headers and calls["get"] == 2
+
+    asyncio.run(run())
+
+
+def test_batch_write_invalidates_whole_collection():
+    from api_gateway.app.cache import ResponseCache
+
+    cache = ResponseCache(ttl=60, max_entries=10, max_bytes=10_000, max_entry_bytes=1_000)
+    keys = [cache.key("orders", p, "", "u") for p in ("orders", "orders/1", "orders/2")]
+    for key in keys:
+        cache.put(key, 200, [], b"{}", 0)
+    cache.invalidate("orders", "orders/1/status")
+    assert cache.get(keys[2]) is not None and cache.get(keys[1]) is None
+
+    cache.invalidate("orders", "orders/status:batch")
+    assert cache.stats()["entries"] == 0
+
+
+def test_identical_concurrent_gets_share_one_upstream_call():
+    upstream = FastAPI()
+    calls = {}
+    gate = asyncio.Event()
+
+    @upstream.get("/v1/orders/{order_id}")
+    async def get_order(order_id: str):
+        call = calls[order_id] = calls.get(order_id, 0) + 1
+        await gate.wait()
+        return {"success": True, "data": {"id": order_id, "call": call}}
+
+    @upstream.patch("/v1/orders/{order_id}/status")
+    async def update_status(order_id: str, payload: dict):
+        return {"success": True}
+
+    composite = FastAPI()
+    composite.mount("/v1", gateway_app)
+    composite.mount("/orders", upstream)
+    gateway_config.settings.ORDERS_URL = "http://testserver/orders/v1"
+    transport = ASGITransport(app=composite)
+    gateway_main.upstreams = UpstreamPools(transport=transport)
+    gateway_main.response_cache.clear()
+    coalescer = gateway_main.coalescer
+    headers = {"Authorization": f"Bearer {create_access_token('u-flight', 'f@test.com', ['user'])}"}
+    other = {"Authorization": f"Bearer {create_access_token('u-flight2', 'g@test.com', ['user'])}"}
+
+    async def burst(client, path, count, hdrs=headers):
+        tasks = [asyncio.create_task(client.get(path, headers=hdrs)) for _ in range(count)]
+        await asyncio.sleep(0.05)
+        return tasks
+
+    async def run():
+        async with AsyncClient(transport=transport, base_url="http://testserver") as client:
+            tasks = await burst(client, "/v1/orders/orders/o1", 5) + await burst(client, "/v1/orders/orders/o1", 1, other)
+            gate.set()
+            responses = await asyncio.gather(*tasks)
+            assert calls["o1"] == 2  # one per user
+            mine = responses[:5]
+            assert responses[5].json()["data"]["call"] != mine[0].json()["data"]["call"]
+            assert all(r.status_code == 200 and r.json() == mine[0].json() for r in mine)
+            assert sorted(r.headers["x-cache"] for r in mine) == ["COALESCED"] * 4 + ["MISS"]
+            assert coalescer.stats()["in_flight"] == 0
+
+            # waiters are bounded; the rest go upstream on their own
+            gate.clear()
+            coalescer.max_waiters = 1
+            try:
+                tasks = await burst(client, "/v1/orders/orders/o2", 3)
+                gate.set()
+                await asyncio.gather(*tasks)
+            finally:
+                coalescer.max_waiters = gateway_config.settings.COALESCE_MAX_WAITERS
+            assert calls["o2"] == 2
+
+            # a read sent after a write does not join a call started before it
+            gate.clear()
+            gateway_main.response_cache.clear()
+            before = await burst(client, "/v1/orders/orders/o3", 1)
+            await client.patch("/v1/orders/orders/o3/status", json={"status": "completed"}, headers=other)
+            after = await burst(client, "/v1/orders/orders/o3", 1)
+            gate.set()
+            r1, r2 = await asyncio.gather(*before, *after)
+            assert calls["o3"] == 2 and r1.json()["data"]["call"] != r2.json()["data"]["call"]
+
+    asyncio.run(run())
+
+
+def test_retries_circuit_breaker_and_hedging():
+    import httpx
+    import json
+    import time
+
+    script = {"fail": 0, "slow": 0}
+    calls = []
+
+    class Body(httpx.AsyncByteStream):
+        # unread, like a network response (a Response built from content counts as read)
+        def __init__(self, data: bytes):
+            self.data = data
+
+        async def __aiter__(self):
+            yield self.data
+
+    def reply(status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        return httpx.Response(status, headers={"content-type": "application/json", "content-length": str(len(body))}, stream=Body(body))
+
+    async def handler(request: httpx.Request):
+        calls.append((request.method, request.url.path))
+        if script["slow"]:
+            script["slow"] -= 1
+            await asyncio.sleep(1)
+        if script["fail"]:
+            script["fail"] -= 1
+            return reply(503, {"success": False})
+        if request.url.path.endswith("/down"):
+            raise httpx.ConnectError("connection refused")
+        return reply(200, {"success": True, "data": {"path": request.url.path}})
+
+    settings = gateway_config.settings
+    saved = {k: getattr(settings, k) for k in ("ORDERS_URL", "UPSTREAM_RETRIES", "UPSTREAM_BREAKER_FAILURES", "UPSTREAM_BREAKER_OPEN_SECONDS", "UPSTREAM_HEDGE", "UPSTREAM_HEDGE_MIN_MS", "UPSTREAM_RETRY_BACKOFF_MS")}
+    settings.ORDERS_URL = "http://orders/v1"
+    settings.UPSTREAM_RETRY_BACKOFF_MS = 1
+    gateway_main.upstreams = UpstreamPools(transport=httpx.MockTransport(handler))
+    resilience = gateway_main.resilience
+    resilience.reset()
+    headers = {"Authorization": f"Bearer {create_access_token('u-resilience', 'r@test.com', ['user'])}"}
+
+    async def run():
+        async with AsyncClient(transport=ASGITransport(app=gateway_app), base_url="http://testserver") as client:
+            # a GET is retried past a 503, a POST is not
+            script["fail"] = 1
+            r = await client.get("/orders/orders/r1", headers=headers)
+            assert r.status_code == 200 and len(calls) == 2
+            script["fail"] = 1
+            r = await client.post("/orders/orders", json={}, headers=headers)
+            assert r.status_code == 503 and len(calls) == 3
+
+            r = await client.get("/orders/orders/down", headers=headers)
+            assert r.status_code == 502 and r.json()["error"]["code"] == "upstream_error"
+
+            # consecutive failures open the circuit; requests then fail fast until a probe succeeds
+            settings.UPSTREAM_RETRIES, settings.UPSTREAM_BREAKER_FAILURES, settings.UPSTREAM_BREAKER_OPEN_SECONDS = 0, 2, 0.2
+            resilience.reset()
+            script["fail"] = 2
+            for _ in range(2):
+                assert (await client.get("/orders/orders/r2", headers=headers)).status_code == 503
+            sent = len(calls)
+            r = await client.get("/orders/orders/r2", headers=headers)
+            assert r.status_code == 503 and r.json()["error"]["code"] == "upstream_unavailable"
+            assert r.headers["retry-after"] == "1" and len(calls) == sent
+            assert (await client.get("/health/upstreams")).json()["data"]["orders"]["circuit"]["state"] == "open"
+            await asyncio.sleep(0.25)
+            assert (await client.get("/orders/orders/r2", headers=headers)).status_code == 200
+            assert resilience.stats()["orders"]["state"] == "closed"
+
+            # a call slower than the recent p95 gets a second attempt; the first answer wins
+            settings.UPSTREAM_HEDGE, settings.UPSTREAM_HEDGE_MIN_MS = True, 0
+            resilience.reset()
+            for _ in range(32):
+                resilience.policy("orders").latency.observe(0.01)
+            script["slow"] = 1
+            start = time.perf_counter()
+            r = await client.get("/orders/orders/r3", headers=headers)
+            assert r.status_code == 200 and time.perf_counter() - start < 0.5
+            assert calls[-2:] == [("GET", "/v1/orders/r3")] * 2
+
+    try:
+        asyncio.run(run())
+    finally:
+        for key, value in saved.items():
+            setattr(settings, key, value)
+        resilience.reset()
+
+
+def test_breaker_probe_slots_and_cancelled_hedge_attempts():
+    import httpx
+    import time
+    from api_gateway.app.resilience import CircuitBreaker, Resilience
+
+    breaker = CircuitBreaker(failures=1, slow_seconds=0, open_seconds=0.01, probes=1)
+    assert breaker.acquire() == (True, False)
+    # another call fails and opens the circuit while the first is still running
+    assert breaker.acquire() == (True, False)
+    breaker.release(False)
+    time.sleep(0.02)
+    assert breaker.acquire() == (True, True)
+    # the call from before the circuit opened neither closes it nor frees the probe slot
+    breaker.release(True)
+    assert breaker.state == CircuitBreaker.HALF_OPEN and breaker.acquire() == (False, False)
+    breaker.release(True, probe=True)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    bodies, calls = [], []
+
+    class Body(httpx.AsyncByteStream):
+        def __init__(self):
+            self.closed = False
+            bodies.append(self)
+
+        async def __aiter__(self):
+            yield b"{}"
+
+        async def aclose(self):
+            self.closed = True
+
+    async def handler(request: httpx.Request):
+        calls.append(request.url.path)
+        await asyncio.sleep(0.1)
+        return httpx.Response(200, headers={"content-length": "2"}, stream=Body())
+
+    settings = gateway_config.settings
+    saved = settings.UPSTREAM_HEDGE, settings.UPSTREAM_HEDGE_MIN_MS
+    settings.UPSTREAM_HEDGE, settings.UPSTREAM_HEDGE_MIN_MS = True, 50
+    resilience = Resilience()
+    for _ in range(32):
+        resilience.policy("orders").latency.observe(0.01)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://orders") as client:
+            # the caller goes away while the first attempt waits for its hedge delay
+            call = asyncio.ensure_future(resilience.send("orders", client, lambda: client.build_request("GET", "/x"), "GET", True))
+            await asyncio.sleep(0.02)
+            call.cancel()
+            await asyncio.sleep(0.2)
+            # the attempt was cancelled with it instead of leaving a response (and connection) behind
+            assert calls == ["/x"] and bodies == []
+            # the first attempt beats its hedge; the hedge is cancelled
+            response = await resilience.send("orders", client, lambda: client.build_request("GET", "/y"), "GET", True)
+            await asyncio.sleep(0.15)
+            assert calls[1:] == ["/y", "/y"] and len(bodies) == 1 and not bodies[0].closed
+            await response.aclose()
+
+    try:
+        asyncio.run(run())
+    finally:
+        settings.UPSTREAM_HEDGE, settings.UPSTREAM_HEDGE_MIN_MS = saved
+
+
+def test_admission_limiter_priorities_queue_and_gradient():
+    import time
+    from api_gateway.app.admission import PRIORITIES, GradientLimit, Limiter, Overloaded
+
+    high, normal, low = PRIORITIES["high"], PRIORITIES["normal"], PRIORITIES["low"]
+
+    async def run():
+        limiter = Limiter("orders", GradientLimit(2, 1, 10), queue_size=2, queue_timeout=0.2, low_share=0.5)
+        # low priority may only use half of the limit
+        await limiter.acquire(low)
+        low_waiter = asyncio.ensure_future(limiter.acquire(low))
+        await limiter.acquire(normal)
+        assert limiter.in_flight == 2
+        normal_waiter = asyncio.ensure_future(limiter.acquire(normal))
+        await asyncio.sleep(0)
+        assert limiter.stats()["queued"] == 2
+        # the queue is full: a high-priority call takes the place of the newest lowest one
+        high_waiter = asyncio.ensure_future(limiter.acquire(high))
+        await asyncio.sleep(0)
+        try:
+            await low_waiter
+            assert False, "low-priority waiter was not evicted"
+        except Overloaded as exc:
+            assert exc.reason == "evicted"
+        # nothing ranks below normal now: rejected at once
+        try:
+            await limiter.acquire(normal)
+            assert False, "queue_full not raised"
+        except Overloaded as exc:
+            assert exc.reason == "queue_full"
+        # a freed slot goes to the highest priority first
+        limiter.release(0.01, True)
+        await high_waiter
+        assert not normal_waiter.done()
+        # ...and a waiter that gets no slot before its deadline is shed
+        try:
+            await normal_waiter
+            assert False, "timeout not raised"
+        except Overloaded as exc:
+            assert exc.reason == "timeout"
+        assert limiter.stats()["rejected"] == {"queue_full": 1, "timeout": 1, "evicted": 1}
+        assert limiter.stats()["queued"] == 0 and limiter.in_flight == 2
+
+    asyncio.run(run())
+
+    async def evicted_at_deadline():
+        limiter = Limiter("orders", GradientLimit(1, 1, 1), queue_size=1, queue_timeout=0.05, low_share=1.0)
+        await limiter.acquire(normal)
+        waiter = asyncio.ensure_future(limiter.acquire(low))
+        await asyncio.sleep(0)
+        # evicted right after its deadline fired, in the same loop iteration:
+        # the loop is blocked across both, so they come due together
+        loop = asyncio.get_running_loop()
+        loop.call_at(loop.time() + 0.04, time.sleep, 0.03)
+        loop.call_at(loop.time() + 0.051, limiter._evict, high)
+        try:
+            await waiter
+            assert False, "evicted waiter was admitted"
+        except Overloaded as exc:
+            assert exc.reason == "evicted"
+        limiter.release(0.01, True)
+        assert limiter.in_flight == 0 and limiter.stats()["queued"] == 0
+
+    asyncio.run(evicted_at_deadline())
+
+    # the limit grows while latency stays at the baseline and shrinks once it rises
+    limit = GradientLimit(20, 4, 100)
+    for _ in range(200):
+        limit.on_sample(0.01, in_flight=int(limit.limit))
+    grown = limit.limit
+    assert grown > 40
+    for _ in range(100):
+        limit.on_sample(0.2, in_flight=int(limit.limit))
+    assert limit.limit < grown / 2
+    # calls made well below the limit do not move it
+    before = limit.limit
+    limit.on_sample(0.001, in_flight=1)
+    assert limit.limit == before
+
+
+def test_admission_sheds_with_503_and_retry_after():
+    import httpx
+    from api_gateway.app.admission import AdmissionControl
+
+    gate = asyncio.Event()
+    calls = []
+
+    class Body(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            yield b'{"success":true,"data":{}}'
+
+    async def handler(request: httpx.Request):
+        calls.append((request.method, request.url.path))
+        await gate.wait()
+        return httpx.Response(200, headers={"content-type": "application/json", "content-length": "26"}, stream=Body())
+
+    settings = gateway_config.settings
+    saved_url, saved_admission = settings.ORDERS_URL, gateway_main.admission
+    settings.ORDERS_URL = "http://orders/v1"
+    gateway_main.upstreams = UpstreamPools(transport=httpx.MockTransport(handler))
+    gateway_main.admission = AdmissionControl(
+        enabled=True, initial=1, min_limit=1, max_limit=1, tolerance=2.0, queue_size=1, queue_timeout=5, low_share=1.0,
+        priorities="PATCH orders/orders/*/status=high",
+    )
+    headers = {"Authorization": f"Bearer {create_access_token('u-admission', 'a@test.com', ['user'])}"}
+
+    async def run():
+        async with AsyncClient(transport=ASGITransport(app=gateway_app), base_url="http://testserver") as client:
+            first = asyncio.ensure_future(client.get("/orders/orders/a1", headers=headers))
+            queued = asyncio.ensure_future(client.get("/orders/orders/a2", headers=headers))
+            await asyncio.sleep(0.05)
+            # one in flight, one queued: the next normal call is shed without reaching the upstream
+            r = await client.get("/orders/orders/a3", headers=headers)
+            assert r.status_code == 503 and r.headers["retry-after"] == "1"
+            assert r.json()["error"]["code"] == "overloaded" and r.json()["error"]["upstream"] == "orders"
+            # a status update outranks the queued read
+            update = asyncio.ensure_future(client.patch("/orders/orders/a1/status", json={"status": "completed"}, headers=headers))
+            await asyncio.sleep(0.05)
+            assert (await queued).status_code == 503
+            gate.set()
+            assert (await first).status_code == 200 and (await update).status_code == 200
+            assert calls == [("GET", "/v1/orders/a1"), ("PATCH", "/v1/orders/a1/status")]
+            stats = (await client.get("/health/admission")).json()["data"]["orders"]
+            assert stats["rejected"]["queue_full"] == 1 and stats["rejected"]["evicted"] == 1
+
+    try:
+        asyncio.run(run())
+    finally:
+        settings.ORDERS_URL = saved_url
+        gateway_main.admission = saved_admission
+
+
+def test_rate_limit_per_user_with_costs_and_headers(tmp_path):
+    from api_gateway.app.ratelimit import RateLimiter, SQLiteStore
+
+    upstream = FastAPI()
+
+    @upstream.api_route("/v1/{path:path}", methods=["GET", "POST"])
+    async def ok(path: str):
+        return {"success": True}
+
+    composite = FastAPI()
+    composite.mount("/v1", gateway_app)
+    composite.mount("/orders", upstream)
+    gateway_config.settings.ORDERS_URL = "http://testserver/orders/v1"
+    transport = ASGITransport(app=composite)
+    gateway_main.upstreams = UpstreamPools(transport=transport)
+    gateway_main.rate_limiter = RateLimiter(rate="3/minute", costs="POST orders/*:batch=2")
+    alice = {"Authorization": f"Bearer {create_access_token('u-rl-a', 'a@test.com', ['user'])}"}
+    bob = {"Authorization": f"Bearer {create_access_token('u-rl-b', 'b@test.com', ['user'])}"}
+
+    async def run():
+        async with AsyncClient(transport=transport, base_url="http://testserver") as client:
+            r = await client.post("/v1/orders/orders:batch", headers=alice)
+            assert r.status_code == 200 and r.headers["ratelimit-limit"] == "3"
+            assert r.headers["ratelimit-remaining"] == "1"
+            assert (await client.post("/v1/orders/orders:batch", headers=alice)).status_code == 429
+            r = await client.get("/v1/orders/orders", headers=alice)
+            assert r.status_code == 200 and r.headers["ratelimit-remaining"] == "0"
+            r = await client.get("/v1/orders/orders", headers=alice)
+            assert r.status_code == 429 and int(r.headers["retry-after"]) >= 1
+            assert r.json()["error"]["code"] == "rate_limited"
+            # a separate bucket per user
+            assert (await client.get("/v1/orders/orders", headers=bob)).status_code == 200
+
+    try:
+        asyncio.run(run())
+    finally:
+        gateway_main.rate_limiter = RateLimiter()
+
+    # workers sharing one sqlite file share their buckets
+    path = str(tmp_path / "rl.db")
+    workers = [RateLimiter(store=SQLiteStore(path), rate="2/minute", costs="") for _ in range(2)]
+    decisions = [asyncio.run(w.hit("sub:x", "GET", "orders/orders")).allowed for w in workers * 2]
+    assert decisions == [True, True, False, False]
+
+    # a file locked by another worker lets the request through instead of stalling the loop
+    import sqlite3
+    import time
+    holder = sqlite3.connect(path, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE")
+    try:
+        start = time.perf_counter()
+        assert asyncio.run(workers[0].hit("sub:x", "GET", "orders/orders")).allowed
+        assert time.perf_counter() - start < 0.5
+    finally:
+        holder.execute("ROLLBACK")
+        holder.close()
+    for w in workers:
+        asyncio.run(w.aclose())
+
+
+def test_metrics_endpoint_and_multiprocess_aggregation(tmp_path, monkeypatch):
+    import json
+    import os
+    from fixflow_common import metrics
+
+    composite = FastAPI()
+    composite.mount("/v1", gateway_app)
+    composite.mount("/orders", make_upstream())
+    gateway_config.settings.ORDERS_URL = "http://testserver/orders/v1"
+    transport = ASGITransport(app=composite)
+    gateway_main.upstreams = UpstreamPools(transport=transport)
+    token = create_access_token("u-metrics", "m@test.com", ["user"])
+
+    async def run(path="/v1/metrics"):
+        async with AsyncClient(transport=transport, base_url="http://testserver") as client:
+            await client.post("/v1/orders/echo", content=b"x", headers={"Authorization": f"Bearer {token}"})
+            return await client.get(path)
+
+    r = asyncio.run(run())
+    assert r.status_code == 200 and r.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = r.text
+    assert 'http_request_duration_seconds_bucket{method="POST",route="/orders/{path:path}",le="+Inf"}' in text
+    assert 'gateway_upstream_duration_seconds_count{upstream="orders"}' in text
+    assert "# TYPE http_requests_in_flight gauge" in text
+
+    # another worker's snapshot: its counters add up, its gauges only while it is alive
+    monkeypatch.setattr(metrics.exporter, "directory", str(tmp_path))
+    dead_pid = 2 ** 22 + 1
+    (tmp_path / f"{metrics.exporter.service}.{dead_pid}.json").write_text(json.dumps({"pid": dead_pid, "metrics": {
+        "gateway_upstream_errors_total": {"kind": "counter", "help": "h", "labels": ["upstream"], "buckets": [], "samples": [[["users"], [7.0]]]},
+        "http_requests_in_flight": {"kind": "gauge", "help": "h", "labels": [], "buckets": [], "samples": [[[], [50.0]]]},
+    }}))
+    text = metrics.render()
+    assert 'gateway_upstream_errors_total{upstream="users"} 7' in text
+    assert "http_requests_in_flight 50" not in text
+    assert (tmp_path / f"{metrics.exporter.service}.{os.getpid()}.json").exists()
@@ -36,3 +36,269 @@ def test_order_pagination_and_forbidden_update_and_cancel():
     # user1 cancels own order
     r = orders_client.delete(f"/v1/orders/{ids[0]}", headers=headers1)
     assert r.status_code == 200 and r.json()["data"]["status"] == "cancelled"
+
+
+def test_identity_header_only_trusted_when_enabled(monkeypatch):
+    import json
+    import time
+    from service_orders.app.config import settings as orders_settings
+
+    identity = json.dumps({"sub": "gw-user", "roles": ["user"], "exp": time.time() + 60})
+    r = orders_client.get("/v1/orders", headers={"X-Authenticated-User": identity})
+    assert r.status_code == 401
+
+    monkeypatch.setattr(orders_settings, "TRUST_IDENTITY_HEADER", True)
+    r = orders_client.get("/v1/orders", headers={"X-Authenticated-User": identity})
+    assert r.status_code == 200 and r.json()["data"]["items"] == []
+
+    expired = json.dumps({"sub": "gw-user", "exp": time.time() - 1})
+    r = orders_client.get("/v1/orders", headers={"X-Authenticated-User": expired})
+    assert r.status_code == 401
+
+
+def test_order_cursor_pagination_and_sorting():
+    headers = {"Authorization": f"Bearer {register_and_token('cursor@test.com')}"}
+    for i in range(5):
+        orders_client.post("/v1/orders", json={"items": [], "total": float(i)}, headers=headers)
+
+    seen, cursor = [], None
+    while True:
+        url = "/v1/orders?limit=2&sort=-total&include_total=true" + (f"&cursor={cursor}" if cursor else "")
+        data = orders_client.get(url, headers=headers).json()["data"]
+        assert data["total"] == 5
+        seen += [o["total"] for o in data["items"]]
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [4.0, 3.0, 2.0, 1.0, 0.0]
+
+    r = orders_client.get("/v1/orders?sort=user_id", headers=headers)
+    assert r.status_code == 400
+    r = orders_client.get("/v1/orders?sort=total&cursor=garbage", headers=headers)
+    assert r.status_code == 400
+
+
+def test_order_items_are_normalized_and_aggregated():
+    headers = {"Authorization": f"Bearer {register_and_token('items@test.com')}"}
+    items = [{"sku": "A", "qty": 2, "price": 1.5}, {"product_id": "B", "quantity": 1, "price": 4.0}]
+    order_id = orders_client.post("/v1/orders", json={"items": items, "total": 7.0}, headers=headers).json()["data"]["id"]
+    orders_client.post("/v1/orders", json={"items": [{"sku": "A", "qty": 1, "price": 1.5}], "total": 1.5}, headers=headers)
+
+    r = orders_client.get(f"/v1/orders/{order_id}", headers=headers)
+    assert r.json()["data"]["items"] == [{"sku": "A", "qty": 2, "price": 1.5}, {"sku": "B", "qty": 1, "price": 4.0}]
+
+    r = orders_client.get("/v1/orders/stats?group_by=sku", headers=headers)
+    assert r.json()["data"]["items"] == [
+        {"sku": "A", "orders": 2, "qty": 3, "amount": 4.5},
+        {"sku": "B", "orders": 1, "qty": 1, "amount": 4.0},
+    ]
+    r = orders_client.get("/v1/orders/stats?group_by=status", headers=headers)
+    assert r.json()["data"]["items"] == [{"status": "created", "orders": 2, "total": 8.5}]
+
+
+def test_batch_create_status_update_and_fetch_by_ids():
+    headers = {"Authorization": f"Bearer {register_and_token('batch@test.com')}"}
+    other = {"Authorization": f"Bearer {register_and_token('batch2@test.com')}"}
+    orders = [
+        {"items": [{"sku": "B1", "qty": 1, "price": 2.0}], "total": 2.0},
+        {"items": "not-a-list", "total": 1.0},
+        {"items": [], "total": 3.0},
+    ]
+    r = orders_client.post("/v1/orders:batch", json={"orders": orders}, headers=headers)
+    data = r.json()["data"]
+    assert r.status_code == 200 and data["created"] == 2 and data["failed"] == 1
+    assert [i["success"] for i in data["items"]] == [True, False, True]
+    assert data["items"][1]["error"]["status_code"] == 422
+    ids = [data["items"][0]["id"], data["items"][2]["id"]]
+    foreign = orders_client.post("/v1/orders", json={"items": [], "total": 1.0}, headers=other).json()["data"]["id"]
+
+    updates = [
+        {"id": ids[0], "status": "completed"},
+        {"id": ids[1], "status": "bogus"},
+        {"id": foreign, "status": "cancelled"},
+        {"id": "missing", "status": "completed"},
+    ]
+    data = orders_client.patch("/v1/orders/status:batch", json={"updates": updates}, headers=headers).json()["data"]
+    assert data["updated"] == 1
+    assert [i.get("error", {}).get("status_code") for i in data["items"]] == [None, 400, 403, 404]
+
+    r = orders_client.get(f"/v1/orders?ids={ids[1]},{foreign},{ids[0]}", headers=headers)
+    data = r.json()["data"]
+    assert [(o["id"], o["status"]) for o in data["items"]] == [(ids[1], "created"), (ids[0], "completed")]
+    assert data["missing"] == [foreign]
+
+    r = orders_client.post("/v1/orders:batch", json={"orders": [{"items": [], "total": 0}] * 101}, headers=headers)
+    assert r.status_code == 400
+
+
+def test_order_events_are_relayed_through_the_outbox(tmp_path, monkeypatch):
+    import asyncio
+    import json
+    import sqlite3
+    import time
+    from service_orders.app.config import settings as orders_settings
+    from fixflow_common.events import FileTransport
+    from service_orders.app.events import event_bus
+
+    path = tmp_path / "events.jsonl"
+    monkeypatch.setattr(event_bus, "transport", FileTransport(str(path)))
+    headers = {"Authorization": f"Bearer {register_and_token('events@test.com')}"}
+
+    def outbox_size():
+        with sqlite3.connect(orders_settings.DB_FILE) as conn:
+            return conn.execute("SELECT count(*) FROM orders_outbox").fetchone()[0]
+
+    def published():
+        return [json.loads(line) for line in path.read_text().splitlines()] if path.exists() else []
+
+    # the module-level client never starts the relay: events only land in the outbox
+    orders_client.post("/v1/orders", json={"items": [], "total": 1.0}, headers=headers)
+    assert outbox_size() > 0 and published() == []
+    asyncio.run(event_bus.sweep(min_age=0))
+    assert outbox_size() == 0 and published()
+
+    with TestClient(orders_app) as client:
+        start = len(published())
+        order_id = client.post("/v1/orders", json={"items": [], "total": 2.0}, headers=headers).json()["data"]["id"]
+        client.patch(f"/v1/orders/{order_id}/status", json={"status": "in_work"}, headers=headers)
+        deadline = time.monotonic() + 5
+        while (len(published()) < start + 2 or outbox_size()) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        events = published()[start:]
+        assert [e["type"] for e in events] == ["order.created", "order.status_changed"]
+        assert events[0]["payload"]["order_id"] == order_id and events[1]["payload"]["status"] == "in_work"
+        assert outbox_size() == 0
+
+
+def test_tuned_sqlite_profile(tmp_path):
+    import asyncio
+    import pytest
+    from pathlib import Path
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+    from fixflow_common.db import Database
+    from service_orders.app import db as orders_db
+    from service_orders.app.config import Settings
+
+    class TunedSettings(Settings):
+        SQLITE_MODE = "tuned"
+        DB_FILE = str(tmp_path / "tuned.db")
+        DATABASE_URL = None
+
+    database = Database(TunedSettings(), Path(orders_db.__file__).parent / "migrations")
+    assert database.read_engine is not database.engine
+
+    async def scenario():
+        async with database.engine.begin() as conn:
+            await conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY, v INTEGER)"))
+        for engine in (database.engine, database.read_engine):
+            async with engine.connect() as conn:
+                assert (await conn.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+
+        # readers are query_only
+        async with database.async_read_session() as session:
+            with pytest.raises(OperationalError, match="readonly"):
+                await (await session.connection()).execute(text("INSERT INTO t (v) VALUES (0)"))
+
+        # concurrent writers queue for the single writer connection instead of
+        # failing with "database is locked"
+        async def write(v):
+            async with database.async_session() as session:
+                await (await session.connection()).execute(text("INSERT INTO t (v) VALUES (:v)"), {"v": v})
+                await asyncio.sleep(0)
+                await session.commit()
+
+        await asyncio.gather(*(write(v) for v in range(20)))
+        async with database.read_engine.connect() as conn:
+            assert (await conn.execute(text("SELECT count(*) FROM t"))).scalar() == 20
+        await database.dispose_engines()
+
+    asyncio.run(scenario())
+
+
+def test_spans_record_db_time_and_run_the_handler_once(monkeypatch):
+    from contextlib import contextmanager
+    from fixflow_common import tracing
+
+    spans = []
+
+    class RecordingSpan(dict):
+        def set_attribute(self, key, value):
+            self[key] = value
+
+    class RecordingTracer:
+        @contextmanager
+        def start_as_current_span(self, name, attributes=None):
+            s = RecordingSpan(attributes or {}, name=name)
+            spans.append(s)
+            yield s
+
+    headers = {"Authorization": f"Bearer {register_and_token('spans@test.com')}"}
+    monkeypatch.setattr(tracing, "_tracer", RecordingTracer())
+
+    r = orders_client.get("/v1/orders/does-not-exist", headers=headers)
+    assert r.status_code == 404
+    # the 404 propagates out of the span instead of re-running the lookup
+    assert [s["name"] for s in spans] == ["orders.get"]
+    assert spans[0]["db.statements"] == 1 and spans[0]["db.duration_ms"] >= 0
+
+    spans.clear()
+    r = orders_client.post("/v1/orders", json={"items": [{"sku": "S", "qty": 1, "price": 2.0}], "total": 2.0}, headers=headers)
+    assert r.status_code == 200
+    assert [s["name"] for s in spans] == ["orders.create"] and spans[0]["db.statements"] >= 2
+
+    monkeypatch.setattr(tracing, "_tracer", None)
+    assert tracing.span("orders.get") is tracing._NOOP
+
+
+def test_responses_match_their_response_models():
+    from fixflow_common.responses import Envelope
+    from service_orders.app.schemas import OrderOut, OrderPage, OrderSelection
+    from service_users.app.schemas import UserOut
+
+    headers = {"Authorization": f"Bearer {register_and_token('models@test.com')}"}
+    order_id = orders_client.post("/v1/orders", json={"items": [{"sku": "M", "qty": 2, "price": 1.5}], "total": 3.0}, headers=headers).json()["data"]["id"]
+
+    r = orders_client.get("/v1/orders?include_total=true", headers=headers)
+    assert r.headers["content-type"] == "application/json"
+    page = Envelope[OrderPage].model_validate_json(r.content).data
+    assert page.total == 1 and page.items[0].items[0].sku == "M"
+    Envelope[OrderOut].model_validate_json(orders_client.get(f"/v1/orders/{order_id}", headers=headers).content)
+    Envelope[OrderSelection].model_validate_json(orders_client.get(f"/v1/orders?ids={order_id}", headers=headers).content)
+    me = Envelope[UserOut].model_validate_json(users_client.get("/v1/users/me", headers=headers).content).data
+    assert me.email == "models@test.com"
+
+    schema = orders_app.openapi()["paths"]["/v1/orders/{order_id}"]["get"]["responses"]["200"]
+    assert "Envelope_OrderOut_" in str(schema)
+
+
+def test_tail_latency_sampling_keeps_slow_and_failed_traces(monkeypatch):
+    import time
+    import pytest
+    pytest.importorskip("opentelemetry.sdk")
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+    from fixflow_common import tracing
+    from fixflow_common.config import CommonSettings
+
+    monkeypatch.setattr(CommonSettings, "TRACE_SAMPLE_RATIO", 0.0)
+    monkeypatch.setattr(CommonSettings, "TRACE_SLOW_MS", 20.0)
+    exporter = InMemorySpanExporter()
+    processor = tracing.TailLatencyProcessor(SimpleSpanProcessor(exporter), slow_ms=20.0)
+    provider = TracerProvider(sampler=tracing._sampler())
+    provider.add_span_processor(processor)
+    tracer = provider.get_tracer("test")
+
+    with tracer.start_as_current_span("fast"):
+        with tracer.start_as_current_span("fast.child"):
+            pass
+    with tracer.start_as_current_span("slow"):
+        with tracer.start_as_current_span("slow.child"):
+            time.sleep(0.03)
+    with pytest.raises(ValueError):
+        with tracer.start_as_current_span("failed"):
+            raise ValueError
+
+    assert [s.name for s in exporter.get_finished_spans()] == ["slow.child", "slow", "failed"]
+    assert processor.kept == 2 and processor.discarded == 1
@@ -15,3 +15,109 @@ def test_duplicate_registration():
 def test_protected_endpoint_requires_token():
     r = client.get("/v1/users/me")
     assert r.status_code == 401
+
+
+def test_hashing_pool_rejects_when_queue_full():
+    import asyncio
+    from fastapi import HTTPException
+    from service_users.app.hashing import HashingPool
+
+    pool = HashingPool("thread", workers=1, max_queue=0)
+
+    async def run():
+        return await asyncio.gather(pool.hash("a"), pool.hash("b"), return_exceptions=True)
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        pool.shutdown()
+    assert isinstance(results[0], str)
+    assert isinstance(results[1], HTTPException) and results[1].status_code == 503
+    assert pool.stats()["rejected"] == 1
+
+
+def test_hashing_pool_holds_slot_until_cancelled_job_ends():
+    import asyncio
+    import threading
+    from fastapi import HTTPException
+    from service_users.app.hashing import HashingPool
+
+    pool = HashingPool("thread", workers=1, max_queue=0)
+    started, release = threading.Event(), threading.Event()
+
+    def job():
+        started.set()
+        release.wait(5)
+        return "done"
+
+    async def run():
+        request = asyncio.ensure_future(pool._run("hash", job))
+        await asyncio.to_thread(started.wait, 5)
+        request.cancel()
+        await asyncio.sleep(0.01)
+        # the job is still running on the only worker: no room for another
+        assert pool.in_flight == 1
+        try:
+            await pool._run("hash", job)
+            assert False, "admitted past a running job"
+        except HTTPException as exc:
+            assert exc.status_code == 503
+        release.set()
+        for _ in range(100):
+            if pool.in_flight == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert pool.in_flight == 0
+        assert await pool._run("hash", lambda: "next") == "next"
+
+    try:
+        asyncio.run(run())
+    finally:
+        pool.shutdown()
+
+
+def test_request_context_middleware_sets_request_id_and_logs_timing(caplog):
+    import logging
+
+    with caplog.at_level(logging.INFO, logger="service_users"):
+        r = client.get("/v1/users/me", headers={"X-Request-ID": "rid-123"})
+    assert r.status_code == 401 and r.headers["x-request-id"] == "rid-123"
+    record = next(rec for rec in caplog.records if rec.getMessage() == "request")
+    assert record.status == 401 and record.path == "/v1/users/me" and record.duration_ms >= 0
+    assert record.request_id == "rid-123"
+
+    r = client.get("/v1/users/me")
+    assert len(r.headers["x-request-id"]) == 36
+
+
+def test_async_log_pipeline_samples_batches_and_drops():
+    import io
+    import json
+    import logging
+    from fixflow_common.logging import AccessLogSampler, BatchStreamHandler, BoundedQueueHandler, JSONFormatter
+
+    handler = BoundedQueueHandler(maxsize=3)
+    sampler = AccessLogSampler(rate=0.0, slow_ms=100)
+    handler.addFilter(sampler)
+    log = logging.getLogger("test.async_logging")
+    log.propagate = False
+    log.handlers = [handler]
+
+    log.info("request", extra={"status": 200, "duration_ms": 1.0})    # sampled out
+    log.info("request", extra={"status": 503, "duration_ms": 1.0})    # error: kept
+    log.info("request", extra={"status": 200, "duration_ms": 250.0})  # slow: kept
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        log.exception("failed %s", "job")
+    log.info("overflow")                                              # queue full
+    assert sampler.sampled_out == 1 and handler.dropped == 1
+
+    stream = io.StringIO()
+    writer = BatchStreamHandler(handler.queue, stream, batch_size=100)
+    writer.setFormatter(JSONFormatter())
+    while not handler.queue.empty():
+        writer.handle(handler.queue.get_nowait())
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line["status"] for line in lines[:2]] == [503, 200]
+    assert lines[2]["msg"] == "failed job" and "ValueError: boom" in lines[2]["exc_info"]